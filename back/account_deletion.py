@@ -0,0 +1,210 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from config import get_config
+from database import current_shop, use_shop
+from events import publish_product_event, delete_user_events
+from inventory import release_order_stock
+from reports import ORDER_TABLES, remove_orders_from_rollups, remove_user_orders_from_rollups, remove_seller_rollups
+from repository import get_repository
+
+config = get_config()
+
+logger = logging.getLogger('bobrshop.accounts')
+
+# Удаление аккаунта. Строки пользователя удаляет ON DELETE CASCADE одним DELETE FROM users, кроме
+# товаров: на них ссылаются строки чужих заказов, поэтому товары удаляются мягко и теряют владельца.
+# Маленький аккаунт удаляется сразу одной транзакцией. У большого (продавец с тысячами товаров,
+# покупатель с тысячами заказов) одна транзакция надолго заняла бы писателя, поэтому сначала
+# заказы и товары удаляются пачками по ACCOUNT_DELETE_BATCH_SIZE в отдельных транзакциях,
+# а прогресс пишется в account_deletions. Каждая пачка целостна: вклад заказов вычитается из
+# роллапов в той же транзакции, поэтому сбой посередине не оставляет сирот и задачу можно продолжить.
+
+# Незавершенные заказы держат резервы склада: перед удалением их нужно вернуть, CASCADE этого не делает
+OPEN_ORDER_STATUSES = ('new', 'in_progress')
+
+# Задача без обновлений дольше этого срока считается брошенной (процесс перезапущен)
+STALE_JOB_AFTER = timedelta(minutes=5)
+
+
+def retire_products(conn, product_ids):
+    """Мягко удаляет товары удаляемого продавца и обнуляет владельца; строки чужих заказов остаются"""
+    placeholders = ', '.join('?' for _ in product_ids)
+    live = conn.execute(
+        f'SELECT id FROM products WHERE id IN ({placeholders}) AND deleted_at IS NULL ORDER BY id',
+        product_ids
+    ).fetchall()
+    for row in live:
+        publish_product_event(conn, row['id'], 'deleted')
+
+    conn.execute(f'''
+        UPDATE products SET deleted_at = COALESCE(deleted_at, CURRENT_TIMESTAMP), created_by = NULL
+        WHERE id IN ({placeholders})
+    ''', product_ids)
+    conn.execute(f'DELETE FROM cart_items WHERE product_id IN ({placeholders})', product_ids)
+
+
+def release_open_orders(conn, user_id, order_ids=None):
+    """Возвращает на склад резервы незавершенных заказов пользователя (всех или из order_ids)"""
+    query = 'SELECT id FROM orders WHERE user_id = ? AND status IN (?, ?)'
+    params = [user_id, *OPEN_ORDER_STATUSES]
+    if order_ids is not None:
+        query += f" AND id IN ({', '.join('?' for _ in order_ids)})"
+        params.extend(order_ids)
+    for row in conn.execute(query, params).fetchall():
+        release_order_stock(conn, row['id'])
+
+
+def _product_ids(conn, user_id, limit=None):
+    """Товары пользователя, включая удаленные мягко: у них тоже нужно обнулить владельца"""
+    return [row['id'] for row in conn.execute(
+        f"SELECT id FROM products WHERE created_by = ? ORDER BY id{' LIMIT ?' if limit else ''}",
+        (user_id, limit) if limit else (user_id,)
+    ).fetchall()]
+
+
+def erase_account(conn, user_id):
+    """Удаляет аккаунт целиком в одной транзакции"""
+    release_open_orders(conn, user_id)
+    remove_user_orders_from_rollups(conn, user_id)
+    remove_seller_rollups(conn, user_id)
+
+    product_ids = _product_ids(conn, user_id)
+    if product_ids:
+        retire_products(conn, product_ids)
+    delete_user_events(conn, user_id)
+
+    get_repository().delete_user_rows(conn, user_id)
+
+
+def count_account_rows(user_id):
+    """Заказы (с архивом) и товары пользователя - объем удаления"""
+    row = get_repository().fetch_one('''
+        SELECT
+            (SELECT COUNT(*) FROM orders WHERE user_id = ?)
+            + (SELECT COUNT(*) FROM orders_archive WHERE user_id = ?)
+            + (SELECT COUNT(*) FROM products WHERE created_by = ?) AS total
+    ''', (user_id, user_id, user_id))
+    return row['total']
+
+
+def delete_account_batch(conn, user_id, limit):
+    """Удаляет до limit заказов или товаров пользователя; возвращает число удаленных (0 - все)"""
+    deleted = 0
+    for orders, items in ORDER_TABLES:
+        order_ids = [row['id'] for row in conn.execute(
+            f'SELECT id FROM {orders} WHERE user_id = ? ORDER BY id LIMIT ?',
+            (user_id, limit)
+        ).fetchall()]
+        if order_ids:
+            placeholders = ', '.join('?' for _ in order_ids)
+            remove_orders_from_rollups(conn, order_ids, orders, items)
+            if orders == 'orders':
+                release_open_orders(conn, user_id, order_ids)
+            else:
+                # У архива внешних ключей нет
+                for table in ('stock_reservations_archive', 'order_items_archive'):
+                    conn.execute(f'DELETE FROM {table} WHERE order_id IN ({placeholders})', order_ids)
+            conn.execute(f'DELETE FROM {orders} WHERE id IN ({placeholders})', order_ids)
+            deleted = len(order_ids)
+            break
+
+    if not deleted:
+        product_ids = _product_ids(conn, user_id, limit)
+        if product_ids:
+            retire_products(conn, product_ids)
+            deleted = len(product_ids)
+
+    if deleted:
+        conn.execute('''
+            UPDATE account_deletions SET deleted_rows = deleted_rows + ?, updated_at = CURRENT_TIMESTAMP
+            WHERE user_id = ?
+        ''', (deleted, user_id))
+    return deleted
+
+
+def _start_job(conn, user_id, total):
+    """Создает задачу удаления; False, если она уже есть (повторный DELETE) - второй поток не нужен"""
+    started = conn.execute('''
+        INSERT INTO account_deletions (user_id, status, total_rows) VALUES (?, 'running', ?)
+        ON CONFLICT (user_id) DO NOTHING
+    ''', (user_id, total)).rowcount
+    if not started:
+        return False
+    # Пока идет удаление: вход и выданные токены не проходят (пустой хеш пароля), бот отвязан
+    conn.execute("UPDATE users SET password_hash = '', telegram_id = NULL WHERE id = ?", (user_id,))
+    conn.execute('DELETE FROM telegram_link_tokens WHERE user_id = ?', (user_id,))
+    return True
+
+
+def _finish_job(conn, user_id):
+    erase_account(conn, user_id)
+    conn.execute('''
+        UPDATE account_deletions SET status = 'done', deleted_rows = total_rows, updated_at = CURRENT_TIMESTAMP
+        WHERE user_id = ?
+    ''', (user_id,))
+
+
+def run_deletion_job(user_id):
+    """Удаляет аккаунт пачками; между пачками писатель свободен для других запросов"""
+    repo = get_repository()
+    try:
+        while repo.write(delete_account_batch, user_id, config.ACCOUNT_DELETE_BATCH_SIZE):
+            time.sleep(config.ACCOUNT_DELETE_BATCH_PAUSE_MS / 1000)
+        repo.write(_finish_job, user_id)
+    except Exception as error:
+        logger.exception('account deletion failed', extra={'user_id': user_id})
+        repo.execute('''
+            UPDATE account_deletions SET status = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE user_id = ?
+        ''', (str(error)[:500], user_id))
+        return False
+    logger.info('account deleted', extra={'user_id': user_id})
+    return True
+
+
+def _deletion_thread(shop, user_id):
+    # Контекст запроса в новый поток не переходит - магазин передается явно
+    with use_shop(shop):
+        run_deletion_job(user_id)
+
+
+def delete_account(user_id):
+    """Удаляет аккаунт: маленький - сразу (None), большой - фоновой задачей (ее прогресс)"""
+    repo = get_repository()
+    total = count_account_rows(user_id)
+    if total <= config.ACCOUNT_DELETE_BATCH_SIZE:
+        repo.write(erase_account, user_id)
+        return None
+
+    if not repo.write(_start_job, user_id, total):
+        return deletion_progress(user_id)
+    threading.Thread(
+        target=_deletion_thread, args=(current_shop(), user_id), name=f'account-deletion-{user_id}', daemon=True
+    ).start()
+    return deletion_progress(user_id)
+
+
+def deletion_progress(user_id):
+    job = get_repository().fetch_one('SELECT * FROM account_deletions WHERE user_id = ?', (user_id,))
+    if job is None:
+        return None
+    return {
+        'status': job['status'],
+        'total': job['total_rows'],
+        'deleted': job['deleted_rows'],
+        'progress': round(100 * job['deleted_rows'] / job['total_rows'], 1) if job['total_rows'] else 100.0,
+        'error': job['error']
+    }
+
+
+def resume_deletion_jobs():
+    """Продолжает упавшие и брошенные задачи (maintenance.py); возвращает число завершенных"""
+    stale_before = (datetime.now(timezone.utc) - STALE_JOB_AFTER).strftime('%Y-%m-%d %H:%M:%S')
+    jobs = get_repository().fetch_all('''
+        SELECT user_id FROM account_deletions
+        WHERE status = 'failed' OR (status = 'running' AND updated_at < ?)
+        ORDER BY user_id
+    ''', (stale_before,))
+    return sum(run_deletion_job(job['user_id']) for job in jobs)
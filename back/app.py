@@ -1,21 +1,121 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import secrets
-import aiohttp
-import asyncio
+import logging
 import os
-from config import get_config
-from database import init_db, execute_query
-from auth import hash_pswd, check_pswd, create_access_token, jwt_required
+import time
+from config import get_config, print_config_banner
+from database import init_db, on_worker_start, use_shop, current_shop, set_shop, reset_shop
+from repository import get_repository
+from inventory import InsufficientStockError, ProductNotFoundError, is_valid_qty, reserve_stock, validate_order_item, release_order_stock, restore_order_reservations
+from auth import hash_pswd, check_pswd, create_access_token, create_stream_token, decode_access_token, verify_access_token, jwt_required
+from shops import SHOP_HEADER, is_known_shop, bot_request_shop, shop_link_token, web_request_shop
+from idempotency import idempotent
+from money import parse_price, from_minor, money_fields, update_order_total
+from cart import (
+    get_cart, add_cart_item, set_cart_item_qty, remove_cart_item, clear_cart, cart_to_json, place_cart_order
+)
+from notifications import TELEGRAM_NOTIFIER, send_telegram_notification, notify_order_created, notify_from_event
+from events import (
+    publish_order_event, publish_product_event, register_consumer, consume_events
+)
+from sync import changes_since
+from reports import (
+    add_order_to_rollups, remove_order_from_rollups, seller_revenue, top_products, status_funnel, clamp_report_days
+)
+from metrics import UNMATCHED_ROUTE, request_started, request_finished, render_metrics
+from query_log import start_query_log, finish_query_log
+from logs import REQUEST_ID_HEADER, setup_logging, set_request_id, reset_request_id
+from profiling import PROFILE_HEADER, PROFILE_FILE_HEADER, start_request_profile, finish_request_profile
+import account_deletion
+import telegram_api
 
 app = Flask(__name__)
 cfg = get_config()
 app.config.from_object(cfg) 
 
-CORS(app, origins=app.config['CORS_ORIGINS'])
+CORS(app, origins=app.config['CORS_ORIGINS'], expose_headers=[REQUEST_ID_HEADER, PROFILE_FILE_HEADER])
+
+setup_logging()
+request_logger = logging.getLogger('bobrshop.http')
 
 init_db()
+repo = get_repository()
+repo.init_schema()
+
+for shop in cfg.SHOPS:
+    with use_shop(shop):
+        register_consumer(TELEGRAM_NOTIFIER)
+
+@app.before_request
+def start_request_metrics():
+    # Бот передает свой X-Request-ID - по нему логи бота и backend связываются в одну цепочку
+    g.request_id, g.request_id_token = set_request_id(request.headers.get(REQUEST_ID_HEADER))
+    # Шаблон маршрута, а не путь: /api/orders/<int:order_id> - одна метка на все заказы
+    g.metrics_route = request.url_rule.rule if request.url_rule else UNMATCHED_ROUTE
+    g.metrics_started = request_started(request.method, g.metrics_route)
+    g.query_log_token = start_query_log(f'{request.method} {g.metrics_route}')
+    g.profile = start_request_profile(
+        request.method, g.metrics_route, request.headers.get(PROFILE_HEADER), g.request_id
+    )
+
+def request_access_token():
+    """JWT из заголовка Authorization"""
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        return auth_header[7:]
+    return None
+
+@app.before_request
+def route_shop():
+    """Выбирает базу магазина до первого обращения к ней (см. shops.py)"""
+    shop = request.headers.get(SHOP_HEADER)
+    token = request_access_token()
+    
+    if token:
+        shop = web_request_shop(decode_access_token(token), shop)
+    elif request.path.startswith('/api/telegram/') or request.path == '/link-telegram':
+        data = request.get_json(silent=True)
+        telegram_id = request.args.get('telegram_id') or (data.get('telegram_id') if isinstance(data, dict) else None)
+        link_token = request.args.get('token') if request.path == '/link-telegram' else None
+        shop = bot_request_shop(telegram_id, link_token, shop)
+    else:
+        shop = web_request_shop(shop=shop)
+    
+    if not is_known_shop(shop):
+        return jsonify({'error': 'Shop not found'}), 404
+    g.shop_token = set_shop(shop)
+
+@app.after_request
+def record_response_status(response):
+    g.metrics_status = response.status_code
+    response.headers[REQUEST_ID_HEADER] = g.request_id
+    if g.get('profile'):
+        response.headers[PROFILE_FILE_HEADER] = os.path.basename(g.profile[1])
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    # teardown вызывается всегда, поэтому счетчик запросов в работе не "залипает" после ошибки
+    if g.get('profile'):
+        finish_request_profile(g.profile)
+    
+    if 'metrics_started' in g:
+        status = g.get('metrics_status', 500)
+        query_log = finish_query_log(g.query_log_token)
+        request_logger.log(logging.ERROR if status >= 500 else logging.INFO, 'request', extra={
+            'method': request.method,
+            'route': g.metrics_route,
+            'status': status,
+            'duration_ms': round((time.perf_counter() - g.metrics_started) * 1000, 1),
+            'queries': query_log['count']
+        })
+        request_finished(request.method, g.metrics_route, status, g.metrics_started)
+        reset_request_id(g.request_id_token)
+    
+    if 'shop_token' in g:
+        reset_shop(g.shop_token)
 
 def row_to_dict(row):  
     return dict(row) if row else None
@@ -23,44 +123,18 @@ def row_to_dict(row):
 def rows_to_dict_list(rows):
     return [dict(row) for row in rows] if rows else []
 
-async def send_telegram_notification_async(telegram_id, message):
-    try:
-        bot_token = os.getenv('BOT_TOKEN')
-        if not bot_token:
-            print("❌ BOT_TOKEN не настроен для уведомлений")
-            return False
-        
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-        payload = {
-            'chat_id': telegram_id,
-            'text': message,
-            'parse_mode': 'HTML'
-        }
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, timeout=10) as response:
-                if response.status == 200:
-                    print(f"✅ Уведомление отправлено пользователю {telegram_id}")
-                    return True
-                else:
-                    error_text = await response.text()
-                    print(f"❌ Ошибка отправки уведомления: {error_text}")
-                    return False
-                    
-    except Exception as e:
-        print(f"❌ Исключение при отправке уведомления: {e}")
-        return False
-
-def send_telegram_notification(telegram_id, message):
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(send_telegram_notification_async(telegram_id, message))
-        loop.close()
-        return result
-    except Exception as e:
-        print(f"❌ Ошибка в синхронной обертке: {e}")
-        return False
+def parse_report_days(default=30):
+    """Период отчета в днях из query-параметра ?days="""
+    return clamp_report_days(request.args.get('days', default, type=int))
+
+def parse_stock(value):
+    """None/пустое значение - товар без учета остатков, иначе неотрицательное целое"""
+    if value is None or value == '':
+        return None
+    stock = int(value)
+    if stock < 0:
+        raise ValueError('Stock must be non-negative')
+    return stock
 
 @app.route('/api/auth/register', methods=['POST'])
 def reg():
@@ -71,22 +145,14 @@ def reg():
         if not data or not data.get(field):
             return jsonify({'error': f'Field {field} is required'}), 400
     
-    existing_user = execute_query(
-        'SELECT id FROM users WHERE email = ? OR username = ?',
-        (data['email'], data['username']),
-        fetch_one=True
-    )
-    
-    if existing_user:
+    if repo.user_exists(data['email'], data['username']):
         return jsonify({'error': 'Email or username already registered'}), 400
     
-    user_id = execute_query(
-        'INSERT INTO users (username, email, first_name, last_name, password_hash) VALUES (?, ?, ?, ?, ?)',
-        (data['username'], data['email'], data['first_name'], data['last_name'], hash_pswd(data['password'])),
-        lastrowid=True
+    user_id = repo.create_user(
+        data['username'], data['email'], data['first_name'], data['last_name'], hash_pswd(data['password'])
     )
     
-    access_token = create_access_token(user_id)
+    access_token = create_access_token(user_id, current_shop())
     
     return jsonify({
         'message': 'User created successfully',
@@ -109,16 +175,12 @@ def login():
     if not data or not data.get('login') or not data.get('password'):
         return jsonify({'error': 'Login and password required'}), 400
     
-    user = execute_query(
-        'SELECT * FROM users WHERE email = ? OR username = ?',
-        (data['login'], data['login']),
-        fetch_one=True
-    )
+    user = repo.find_user_by_login(data['login'])
     
     if not user or not check_pswd(user['password_hash'], data['password']):
         return jsonify({'error': 'Invalid credentials'}), 401
     
-    access_token = create_access_token(user['id'])
+    access_token = create_access_token(user['id'], current_shop())
     
     return jsonify({
         'access_token': access_token,
@@ -136,11 +198,7 @@ def login():
 @app.route('/api/auth/me', methods=['GET'])
 @jwt_required
 def get_profile():
-    user = execute_query(
-        'SELECT * FROM users WHERE id = ?',
-        (request.user_id,),
-        fetch_one=True
-    )
+    user = repo.get_user(request.user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -165,29 +223,13 @@ def update_profile():
         return jsonify({'error': 'No data provided'}), 400
     
     allowed_fields = ['first_name', 'last_name', 'theme']
-    update_fields = []
-    params = []
-    
-    for field in allowed_fields:
-        if field in data:
-            update_fields.append(f'{field} = ?')
-            params.append(data[field])
+    update_fields = {field: data[field] for field in allowed_fields if field in data}
     
     if not update_fields:
         return jsonify({'error': 'No valid fields to update'}), 400
     
-    params.append(request.user_id)
-    
-    execute_query(
-        f'UPDATE users SET {", ".join(update_fields)} WHERE id = ?',
-        params
-    )
-    
-    user = execute_query(
-        'SELECT * FROM users WHERE id = ?',
-        (request.user_id,),
-        fetch_one=True
-    )
+    repo.update_user(request.user_id, update_fields)
+    user = repo.get_user(request.user_id)
     
     return jsonify({
         'id': user['id'],
@@ -203,19 +245,35 @@ def update_profile():
 @app.route('/api/auth/me', methods=['DELETE'])
 @jwt_required
 def delete_account():
-    user_id = request.user_id
-    
     try:
-        execute_query('DELETE FROM telegram_link_tokens WHERE user_id = ?', (user_id,))
-        execute_query('DELETE FROM order_items WHERE order_id IN (SELECT id FROM orders WHERE user_id = ?)', (user_id,))
-        execute_query('DELETE FROM orders WHERE user_id = ?', (user_id,))
-        execute_query('DELETE FROM products WHERE created_by = ?', (user_id,))
-        execute_query('DELETE FROM users WHERE id = ?', (user_id,))
-        
-        return jsonify({'message': 'Account deleted successfully'}), 200
-        
-    except Exception as e:
+        deletion = account_deletion.delete_account(request.user_id)
+    except Exception:
         return jsonify({'error': 'Failed to delete account'}), 500
+    
+    if deletion is None:
+        return jsonify({'message': 'Account deleted successfully'}), 200
+    
+    # Большой аккаунт удаляется в фоне, прогресс - GET /api/auth/me/deletion
+    return jsonify({'message': 'Account deletion started', 'deletion': deletion}), 202
+
+@app.route('/api/auth/me/deletion', methods=['GET'])
+def get_account_deletion():
+    # Токены удаляемого аккаунта уже отозваны, но прогресс удаления по ним виден
+    token = request_access_token()
+    user_id = verify_access_token(token, active_only=False) if token else None
+    if user_id is None:
+        return jsonify({'error': 'Invalid token'}), 401
+    
+    deletion = account_deletion.deletion_progress(user_id)
+    
+    if deletion is None:
+        return jsonify({'error': 'Account deletion not found'}), 404
+    
+    return jsonify(deletion)
+
+def get_product_with_owner(product_id):
+    """Товар в том же виде, что и в каталоге - для инкрементальных обновлений на клиенте"""
+    return money_fields(repo.get_product_with_owner(product_id), 'price')
 
 @app.route('/api/products', methods=['POST'])
 @jwt_required
@@ -225,257 +283,223 @@ def create_product():
     if not data or not data.get('name') or not data.get('price'):
         return jsonify({'error': 'Name and price required'}), 400
     
-    product_id = execute_query(
-        '''INSERT INTO products (name, price, description, created_by) 
-           VALUES (?, ?, ?, ?)''',
-        (data['name'], float(data['price']), data.get('description', ''), request.user_id),
-        lastrowid=True
-    )
+    try:
+        price = parse_price(data['price'])
+    except ValueError:
+        return jsonify({'error': 'Price must be a non-negative number'}), 400
     
-    user = execute_query(
-        'SELECT * FROM users WHERE id = ?',
-        (request.user_id,),
-        fetch_one=True
-    )
+    try:
+        stock = parse_stock(data.get('stock'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Stock must be a non-negative integer'}), 400
+    
+    def save_product(conn):
+        product_id = repo.insert_product(conn, request.user_id, data['name'], price, data.get('description', ''), stock)
+        publish_product_event(conn, product_id, 'created')
+        return product_id
+    
+    product_id = repo.write(save_product)
+    
+    user = repo.get_user(request.user_id)
     
     if user and user['telegram_id']:
-        message = f"🎉 <b>Ваш товар создан!</b>\n\n📦 <b>{data['name']}</b>\n💰 Цена: {data['price']} руб.\n\nТовар теперь доступен для покупки в магазине!"
+        message = f"🎉 <b>Ваш товар создан!</b>\n\n📦 <b>{data['name']}</b>\n💰 Цена: {from_minor(price)} руб.\n\nТовар теперь доступен для покупки в магазине!"
         send_telegram_notification(user['telegram_id'], message)
     
-    return jsonify({
-        'id': product_id,
-        'name': data['name'],
-        'price': float(data['price']),
-        'description': data.get('description', ''),
-        'created_by': request.user_id
-    }), 201
+    return jsonify(get_product_with_owner(product_id)), 201
 
 @app.route('/api/products', methods=['GET'])
 @jwt_required
 def get_products():
-    products = execute_query(
-        'SELECT * FROM products WHERE created_by = ? ORDER BY created_at DESC',
-        (request.user_id,),
-        fetch_all=True
-    )
+    products = repo.list_user_products(request.user_id)
     
-    return jsonify(rows_to_dict_list(products))
+    return jsonify([money_fields(product, 'price') for product in products])
 
 @app.route('/api/products/all', methods=['GET'])
 @jwt_required
 def get_all_products():
-    products = execute_query('''
-        SELECT p.*, u.email as owner_email 
-        FROM products p 
-        JOIN users u ON p.created_by = u.id 
-        ORDER BY p.created_at DESC
-    ''', fetch_all=True)
+    products = repo.list_all_products()
     
-    return jsonify(rows_to_dict_list(products))
+    return jsonify([money_fields(product, 'price') for product in products])
+
+@app.route('/api/products/overview', methods=['GET'])
+@jwt_required
+def get_products_overview():
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 200)
+    only_mine = request.args.get('mine', '0') == '1'
+    
+    products = repo.products_page(request.user_id, only_mine, per_page, (page - 1) * per_page)
+    
+    total = products[0]['total_count'] if products else 0
+    my_count = products[0]['my_count'] if products else 0
+    
+    items = []
+    for product in products:
+        item = money_fields(product, 'price')
+        del item['total_count'], item['my_count']
+        item['is_mine'] = product['created_by'] == request.user_id
+        items.append(item)
+    
+    return jsonify({
+        'products': items,
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'my_count': my_count,
+        'has_more': page * per_page < total
+    })
 
 @app.route('/api/products/<int:product_id>', methods=['PUT'])
 @jwt_required
 def update_product(product_id):
     data = request.get_json()
     
-    product = execute_query(
-        'SELECT * FROM products WHERE id = ? AND created_by = ?',
-        (product_id, request.user_id),
-        fetch_one=True
-    )
+    product = repo.get_owned_product(product_id, request.user_id)
     
     if not product:
         return jsonify({'error': 'Product not found'}), 404
     
-    update_fields = []
-    params = []
+    update_fields = {}
     
     if 'name' in data:
-        update_fields.append('name = ?')
-        params.append(data['name'])
+        update_fields['name'] = data['name']
     if 'price' in data:
-        update_fields.append('price = ?')
-        params.append(float(data['price']))
+        try:
+            update_fields['price'] = parse_price(data['price'])
+        except ValueError:
+            return jsonify({'error': 'Price must be a non-negative number'}), 400
     if 'description' in data:
-        update_fields.append('description = ?')
-        params.append(data['description'])
+        update_fields['description'] = data['description']
+    if 'stock' in data:
+        try:
+            update_fields['stock'] = parse_stock(data['stock'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Stock must be a non-negative integer'}), 400
     
     if not update_fields:
         return jsonify({'error': 'No fields to update'}), 400
     
-    params.extend([product_id, request.user_id])
+    def save_product(conn):
+        repo.update_product(conn, product_id, request.user_id, update_fields)
+        publish_product_event(conn, product_id, 'updated')
     
-    execute_query(
-        f'UPDATE products SET {", ".join(update_fields)} WHERE id = ? AND created_by = ?',
-        params
-    )
+    repo.write(save_product)
     
-    return jsonify({'message': 'Product updated successfully'})
+    return jsonify({
+        'message': 'Product updated successfully',
+        'product': get_product_with_owner(product_id)
+    })
 
 @app.route('/api/products/<int:product_id>', methods=['DELETE'])
 @jwt_required
 def delete_product(product_id):
-    product = execute_query(
-        'SELECT * FROM products WHERE id = ? AND created_by = ?',
-        (product_id, request.user_id),
-        fetch_one=True
-    )
+    product = repo.get_owned_product(product_id, request.user_id)
     
     if not product:
         return jsonify({'error': 'Product not found'}), 404
     
-    execute_query(
-        'DELETE FROM products WHERE id = ? AND created_by = ?',
-        (product_id, request.user_id)
-    )
+    def remove_product(conn):
+        repo.delete_product(conn, product_id, request.user_id)
+        publish_product_event(conn, product_id, 'deleted')
+    
+    repo.write(remove_product)
+    
+    return jsonify({
+        'message': 'Product deleted successfully',
+        'id': product_id
+    })
+
+def insert_order(conn, user_id, items):
+    """Заказ из позиций каталога внутри repo.write(). Возвращает (order_id, total_amount)"""
+    product_ids = {item['product_id'] for item in items}
+    products = repo.product_prices(conn, product_ids)
+    
+    for product_id in product_ids:
+        if product_id not in products:
+            raise ProductNotFoundError(product_id)
+    
+    order_id = repo.insert_order(conn, user_id)
+    
+    for item in items:
+        reserve_stock(conn, order_id, item['product_id'], item['qty'])
     
-    return jsonify({'message': 'Product deleted successfully'})
+    repo.insert_order_items(conn, [
+        (order_id, item['product_id'], item['qty'], products[item['product_id']]['price'], products[item['product_id']]['name'])
+        for item in items
+    ])
+    
+    total_amount = update_order_total(conn, order_id)
+    add_order_to_rollups(conn, order_id)
+    publish_order_event(conn, order_id, 'created')
+    return order_id, total_amount
 
 @app.route('/api/orders', methods=['POST'])
 @jwt_required
+@idempotent
 def create_order():
     data = request.get_json()
     
     if not data or not data.get('items') or not isinstance(data['items'], list):
         return jsonify({'error': 'Items array required'}), 400
     
-    total_amount = 0
-    order_items = []
-    product_owners = {}
-    
-    for item in data['items']:
-        if not item.get('product_id') or not item.get('qty'):
-            return jsonify({'error': 'Each item must have product_id and qty'}), 400
-        
-        product = execute_query(
-            'SELECT p.*, u.telegram_id, u.id as owner_id FROM products p JOIN users u ON p.created_by = u.id WHERE p.id = ?',
-            (item['product_id'],),
-            fetch_one=True
-        )
-        
-        if not product:
-            return jsonify({'error': f'Product with id {item["product_id"]} not found'}), 404
-        
-        item_total = product['price'] * item['qty']
-        total_amount += item_total
-        
-        order_items.append({
-            'product_id': product['id'],
-            'qty': item['qty'],
-            'price': product['price'],
-            'product_name': product['name'],
-            'owner_id': product['owner_id'],
-            'owner_telegram_id': product['telegram_id']
-        })
-        
-        if product['owner_id'] not in product_owners:
-            product_owners[product['owner_id']] = {
-                'telegram_id': product['telegram_id'],
-                'products': []
-            }
-        product_owners[product['owner_id']]['products'].append({
-            'name': product['name'],
-            'qty': item['qty'],
-            'price': product['price'],
-            'total': item_total
-        })
-    
-    order_id = execute_query(
-        'INSERT INTO orders (user_id, total_amount, status) VALUES (?, ?, ?)',
-        (request.user_id, total_amount, 'new'),
-        lastrowid=True
-    )
-    
-    for item in order_items:
-        execute_query(
-            'INSERT INTO order_items (order_id, product_id, qty, price) VALUES (?, ?, ?, ?)',
-            (order_id, item['product_id'], item['qty'], item['price'])
-        )
-    
-    buyer = execute_query(
-        'SELECT * FROM users WHERE id = ?',
-        (request.user_id,),
-        fetch_one=True
-    )
-    
-    if buyer and buyer['telegram_id']:
-        items_text = "\n".join([f"   • {item['product_name']} - {item['qty']} шт." for item in order_items[:3]])
-        if len(order_items) > 3:
-            items_text += f"\n   • ... и еще {len(order_items) - 3} товаров"
-            
-        message = f"🎉 <b>Заказ #{order_id} создан!</b>\n\n📦 <b>Ваши товары:</b>\n{items_text}\n\n💰 <b>Общая сумма:</b> {total_amount} руб.\n\n🔄 Статус заказа можно отслеживать через /orders"
-        send_telegram_notification(buyer['telegram_id'], message)
+    try:
+        for item in data['items']:
+            validate_order_item(item)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    for owner_id, owner_info in product_owners.items():
-        if owner_info['telegram_id'] and owner_id != request.user_id:
-            products_text = "\n".join([f"   • {product['name']} - {product['qty']} шт. × {product['price']} руб. = {product['total']} руб." for product in owner_info['products']])
-            
-            message = f"🛒 <b>Ваш товар купили!</b>\n\n📦 <b>Заказ #{order_id}</b>\n{products_text}\n\n💰 <b>Общая выручка:</b> {sum(p['total'] for p in owner_info['products'])} руб."
-            send_telegram_notification(owner_info['telegram_id'], message)
+    try:
+        order_id, total_amount = repo.write(insert_order, request.user_id, data['items'])
+    except ProductNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except InsufficientStockError as e:
+        return jsonify({'error': f'Not enough stock for product with id {e.product_id}'}), 409
     
-    order_items_details = execute_query('''
-        SELECT oi.*, p.name as product_name 
-        FROM order_items oi 
-        JOIN products p ON oi.product_id = p.id 
-        WHERE oi.order_id = ?
-    ''', (order_id,), fetch_all=True)
+    order_lines = notify_order_created(order_id, request.user_id, total_amount)
     
     return jsonify({
         'id': order_id,
-        'total_amount': total_amount,
+        'total_amount': from_minor(total_amount),
         'status': 'new',
         'created_at': datetime.now().isoformat(),
         'items': [{
             'product_name': item['product_name'],
             'quantity': item['qty'],
-            'price': item['price'],
-            'total': item['qty'] * item['price']
-        } for item in order_items_details]
+            'price': from_minor(item['price']),
+            'total': from_minor(item['qty'] * item['price'])
+        } for item in order_lines]
     }), 201
 
 @app.route('/api/orders', methods=['GET'])
 @jwt_required
 def get_orders():
-    orders = execute_query('''
-        SELECT o.*, COUNT(oi.id) as items_count 
-        FROM orders o 
-        LEFT JOIN order_items oi ON o.id = oi.order_id 
-        WHERE o.user_id = ? 
-        GROUP BY o.id 
-        ORDER BY o.created_at DESC
-    ''', (request.user_id,), fetch_all=True)
+    # ?archived=1 - вместе с заказами, перенесенными в архив
+    orders = repo.list_user_orders(request.user_id, include_archived=request.args.get('archived', '0') == '1')
     
-    return jsonify(rows_to_dict_list(orders))
+    return jsonify([money_fields(order, 'total_amount') for order in orders])
 
 @app.route('/api/orders/<int:order_id>', methods=['GET'])
 @jwt_required
 def get_order(order_id):
-    order = execute_query(
-        'SELECT * FROM orders WHERE id = ? AND user_id = ?',
-        (order_id, request.user_id),
-        fetch_one=True
-    )
+    include_archived = request.args.get('archived', '0') == '1'
+    order = repo.get_user_order(order_id, request.user_id, include_archived)
     
     if not order:
         return jsonify({'error': 'Order not found'}), 404
     
-    order_items = execute_query('''
-        SELECT oi.*, p.name as product_name 
-        FROM order_items oi 
-        JOIN products p ON oi.product_id = p.id 
-        WHERE oi.order_id = ?
-    ''', (order_id,), fetch_all=True)
+    order_items = repo.order_items_with_names(order_id, include_archived)
     
     return jsonify({
         'id': order['id'],
-        'total_amount': order['total_amount'],
+        'total_amount': from_minor(order['total_amount']),
         'status': order['status'],
         'created_at': order['created_at'],
         'items': [{
             'product_name': item['product_name'],
             'quantity': item['qty'],
-            'price': item['price'],
-            'total': item['qty'] * item['price']
+            'price': from_minor(item['price']),
+            'total': from_minor(item['qty'] * item['price'])
         } for item in order_items]
     })
 
@@ -484,11 +508,7 @@ def get_order(order_id):
 def update_order(order_id):
     data = request.get_json()
     
-    order = execute_query(
-        'SELECT * FROM orders WHERE id = ? AND user_id = ?',
-        (order_id, request.user_id),
-        fetch_one=True
-    )
+    order = repo.get_user_order(order_id, request.user_id)
     
     if not order:
         return jsonify({'error': 'Order not found'}), 404
@@ -500,174 +520,129 @@ def update_order(order_id):
         if data['status'] not in allowed_statuses:
             return jsonify({'error': 'Invalid status'}), 400
         
-        execute_query(
-            'UPDATE orders SET status = ? WHERE id = ?',
-            (data['status'], order_id)
-        )
+        def change_status(conn):
+            remove_order_from_rollups(conn, order_id)
+            
+            if data['status'] == 'canceled' and old_status != 'canceled':
+                release_order_stock(conn, order_id)
+            elif old_status == 'canceled' and data['status'] != 'canceled':
+                restore_order_reservations(conn, order_id)
+            
+            repo.set_order_status(conn, order_id, data['status'])
+            
+            add_order_to_rollups(conn, order_id)
+            publish_order_event(conn, order_id, 'status_changed', old_status)
         
-        buyer = execute_query(
-            'SELECT u.telegram_id FROM orders o JOIN users u ON o.user_id = u.id WHERE o.id = ?',
-            (order_id,),
-            fetch_one=True
-        )
+        try:
+            repo.write(change_status)
+        except InsufficientStockError as e:
+            return jsonify({'error': f'Not enough stock for product with id {e.product_id}'}), 409
         
-        if buyer and buyer['telegram_id']:
-            status_emojis = {
-                'new': '🆕',
-                'in_progress': '🔄',
-                'completed': '✅',
-                'canceled': '❌'
-            }
-            emoji = status_emojis.get(data['status'], '📦')
-            
-            message = f"📢 <b>Статус заказа обновлен!</b>\n\n🆔 Заказ #{order_id}\n{emoji} Статус: <b>{data['status']}</b>\n\n📊 Предыдущий статус: {old_status}"
-            send_telegram_notification(buyer['telegram_id'], message)
+        consume_events(TELEGRAM_NOTIFIER, notify_from_event)
     
-    updated_order = execute_query(
-        'SELECT * FROM orders WHERE id = ?',
-        (order_id,),
-        fetch_one=True
-    )
+    updated_order = repo.get_order(order_id)
     
     return jsonify({
         'id': updated_order['id'],
-        'total_amount': updated_order['total_amount'],
+        'total_amount': from_minor(updated_order['total_amount']),
         'status': updated_order['status'],
         'created_at': updated_order['created_at']
     })
 
-@app.route('/api/telegram/create-order', methods=['POST'])
-def create_telegram_order():
-    try:
-        data = request.get_json()
-        print(f"📦 Получен запрос на создание заказа: {data}")
-        
-        if not data or not data.get('telegram_id') or not data.get('items') or not isinstance(data['items'], list):
-            return jsonify({'error': 'telegram_id and items array required'}), 400
-        
-        telegram_id = data['telegram_id']
-        
-        user = execute_query(
-            'SELECT * FROM users WHERE telegram_id = ?',
-            (telegram_id,),
-            fetch_one=True
-        )
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        user_id = user['id']
-        total_amount = data.get('total_amount', 0)
-        order_items = data['items']
-        
-        print(f"👤 Найден пользователь: {user['email']}, ID: {user_id}")
-        
-        order_id = execute_query(
-            'INSERT INTO orders (user_id, total_amount, status) VALUES (?, ?, ?)',
-            (user_id, total_amount, 'new'),
-            lastrowid=True
-        )
-        
-        print(f"📝 Создан заказ ID: {order_id}")
-        
-        for item in order_items:
-            product_id = execute_query(
-                'INSERT INTO products (name, price, description, created_by) VALUES (?, ?, ?, ?)',
-                (item['product_name'], item['price'], item.get('description', f'Товар из заказа Telegram #{order_id}'), user_id),
-                lastrowid=True
-            )
-            
-            execute_query(
-                'INSERT INTO order_items (order_id, product_id, qty, price) VALUES (?, ?, ?, ?)',
-                (order_id, product_id, item['quantity'], item['price'])
-            )
-            
-            print(f"✅ Добавлен товар: {item['product_name']} - {item['quantity']} шт. × {item['price']} руб.")
-        
-        print(f"✅ Добавлено {len(order_items)} товаров в заказ")
-        
-        order_details = execute_query(
-            'SELECT * FROM orders WHERE id = ?',
-            (order_id,),
-            fetch_one=True
-        )
-        
-        order_items_details = execute_query('''
-            SELECT oi.*, p.name as product_name 
-            FROM order_items oi 
-            JOIN products p ON oi.product_id = p.id 
-            WHERE oi.order_id = ?
-        ''', (order_id,), fetch_all=True)
-        
-        if user['telegram_id']:
-            items_text = "\n".join([f"   • {item['product_name']} - {item['quantity']} шт. × {item['price']} руб." for item in order_items])
-            
-            message = f"🎉 <b>Заказ #{order_id} создан!</b>\n\n📦 <b>Ваши товары:</b>\n{items_text}\n\n💰 <b>Общая сумма:</b> {total_amount} руб.\n\n🔄 Статус заказа можно отслеживать через /orders"
-            send_telegram_notification(user['telegram_id'], message)
-        
-        return jsonify({
-            'success': True,
-            'order_id': order_id,
-            'total_amount': total_amount,
-            'status': 'new',
-            'created_at': order_details['created_at'],
-            'items': [{
-                'product_name': item['product_name'],
-                'quantity': item['quantity'],
-                'price': item['price'],
-                'total': item['quantity'] * item['price']
-            } for item in order_items]
-        }), 201
-        
-    except Exception as e:
-        print(f"❌ Ошибка при создании заказа: {str(e)}")
-        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+@app.route('/api/cart', methods=['GET'])
+@jwt_required
+def get_user_cart():
+    return jsonify(cart_to_json(get_cart(request.user_id)))
 
-@app.route('/api/telegram/products', methods=['GET'])
-def get_telegram_products():
-    telegram_id = request.args.get('telegram_id')
+@app.route('/api/cart', methods=['DELETE'])
+@jwt_required
+def clear_user_cart():
+    clear_cart(request.user_id)
+    return jsonify(cart_to_json(get_cart(request.user_id)))
+
+@app.route('/api/cart/items', methods=['POST'])
+@jwt_required
+def add_to_cart():
+    data = request.get_json()
+    
+    try:
+        validate_order_item(data, default_qty=1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    if not telegram_id:
-        return jsonify({'error': 'telegram_id required'}), 400
+    if not add_cart_item(request.user_id, data['product_id'], data['qty']):
+        return jsonify({'error': 'Product not found'}), 404
     
-    user = execute_query(
-        'SELECT * FROM users WHERE telegram_id = ?',
-        (telegram_id,),
-        fetch_one=True
-    )
+    return jsonify(cart_to_json(get_cart(request.user_id)))
+
+@app.route('/api/cart/items/<int:product_id>', methods=['PUT'])
+@jwt_required
+def update_cart_item(product_id):
+    data = request.get_json()
     
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
+    # Позиция удаляется только через DELETE: qty 0 здесь - ошибка клиента, а не удаление
+    if not data or not is_valid_qty(data.get('qty')):
+        return jsonify({'error': 'qty must be a positive integer'}), 400
     
-    products = execute_query(
-        'SELECT * FROM products WHERE created_by = ? ORDER BY created_at DESC',
-        (user['id'],),
-        fetch_all=True
-    )
+    if not set_cart_item_qty(request.user_id, product_id, data['qty']):
+        return jsonify({'error': 'Item not in cart'}), 404
     
-    return jsonify(rows_to_dict_list(products))
+    return jsonify(cart_to_json(get_cart(request.user_id)))
+
+@app.route('/api/cart/items/<int:product_id>', methods=['DELETE'])
+@jwt_required
+def delete_cart_item(product_id):
+    if not remove_cart_item(request.user_id, product_id):
+        return jsonify({'error': 'Item not in cart'}), 404
+    
+    return jsonify(cart_to_json(get_cart(request.user_id)))
+
+@app.route('/api/cart/checkout', methods=['POST'])
+@jwt_required
+@idempotent
+def checkout_user_cart():
+    body, status = place_cart_order(request.user_id)
+    return jsonify(body), status
+
+def telegram_response(result):
+    body, status = result
+    return jsonify(body), status
+
+@app.route('/api/telegram/create-order', methods=['POST'])
+@idempotent
+def create_telegram_order():
+    return telegram_response(telegram_api.create_order(request.get_json()))
+
+@app.route('/api/telegram/cart', methods=['GET'])
+def get_telegram_cart():
+    return telegram_response(telegram_api.get_user_cart(request.args.get('telegram_id')))
+
+@app.route('/api/telegram/cart', methods=['DELETE'])
+def clear_telegram_cart():
+    return telegram_response(telegram_api.clear_user_cart(request.args.get('telegram_id')))
+
+@app.route('/api/telegram/cart/items', methods=['POST'])
+def add_to_telegram_cart():
+    return telegram_response(telegram_api.add_to_cart(request.get_json()))
+
+@app.route('/api/telegram/cart/checkout', methods=['POST'])
+@idempotent
+def checkout_telegram_cart():
+    return telegram_response(telegram_api.checkout_cart(request.get_json()))
+
+@app.route('/api/telegram/products', methods=['GET'])
+def get_telegram_products():
+    return telegram_response(telegram_api.get_products(request.args.get('telegram_id')))
 
 @app.route('/api/telegram/generate-token', methods=['POST'])
 @jwt_required
 def generate_telegram_token():
-    execute_query(
-        'DELETE FROM telegram_link_tokens WHERE user_id = ?',
-        (request.user_id,)
-    )
-    
-    token = secrets.token_hex(16)
+    token = shop_link_token(secrets.token_hex(16), current_shop())
     expires_at = datetime.now() + timedelta(minutes=30)
     
-    execute_query(
-        'INSERT INTO telegram_link_tokens (user_id, token, expires_at) VALUES (?, ?, ?)',
-        (request.user_id, token, expires_at)
-    )
+    repo.replace_link_token(request.user_id, token, expires_at)
     
-    user = execute_query(
-        'SELECT * FROM users WHERE id = ?',
-        (request.user_id,),
-        fetch_one=True
-    )
+    user = repo.get_user(request.user_id)
     
     if user and user['telegram_id']:
         message = f"🔗 <b>Код для привязки аккаунта</b>\n\n📝 <code>{token}</code>\n\n⏰ Действителен 30 минут\n\n💡 Отправьте боту команду:\n<code>/link {token}</code>"
@@ -680,160 +655,80 @@ def generate_telegram_token():
 
 @app.route('/link-telegram', methods=['GET'])
 def link_telegram():
-    token = request.args.get('token')
-    telegram_id = request.args.get('telegram_id')
-    
-    if not token or not telegram_id:
-        return jsonify({'error': 'Token and telegram_id required'}), 400
-    
-    token_record = execute_query(
-        'SELECT * FROM telegram_link_tokens WHERE token = ? AND is_used = 0 AND expires_at > ?',
-        (token, datetime.now()),
-        fetch_one=True
-    )
-    
-    if not token_record:
-        return jsonify({'error': 'Invalid or expired token'}), 400
-    
-    user = execute_query(
-        'SELECT * FROM users WHERE id = ?',
-        (token_record['user_id'],),
-        fetch_one=True
-    )
-    
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
-    
-    execute_query(
-        'UPDATE users SET telegram_id = ? WHERE id = ?',
-        (telegram_id, user['id'])
-    )
-    
-    execute_query(
-        'UPDATE telegram_link_tokens SET is_used = 1 WHERE id = ?',
-        (token_record['id'],)
-    )
-    
-    message = f"✅ <b>Аккаунт успешно привязан!</b>\n\n👤 {user['email']}\n\nТеперь вы будете получать уведомления о:\n• Новых заказах\n• Покупках ваших товаров\n• Изменениях статусов"
-    send_telegram_notification(telegram_id, message)
-    
-    return jsonify({
-        'success': True,
-        'message': 'Telegram account linked successfully',
-        'user_email': user['email']
-    })
+    return telegram_response(telegram_api.link_account(request.args.get('token'), request.args.get('telegram_id')))
 
 @app.route('/api/telegram/user-info', methods=['GET'])
 def get_telegram_user_info():
-    telegram_id = request.args.get('telegram_id')
-    
-    if not telegram_id:
-        return jsonify({'error': 'telegram_id required'}), 400
-    
-    user = execute_query(
-        'SELECT * FROM users WHERE telegram_id = ?',
-        (telegram_id,),
-        fetch_one=True
-    )
-    
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
-    
-    all_orders = execute_query(
-        'SELECT * FROM orders WHERE user_id = ?',
-        (user['id'],),
-        fetch_all=True
-    )
-    
-    total_all_orders = sum(order['total_amount'] for order in all_orders) if all_orders else 0
-    
-    orders = execute_query('''
-        SELECT o.* 
-        FROM orders o 
-        WHERE o.user_id = ? 
-        ORDER BY o.created_at DESC 
-        LIMIT 3
-    ''', (user['id'],), fetch_all=True)
-    
-    orders_list = []
-    for order in orders:
-        order_dict = dict(order)
-        
-        order_items = execute_query('''
-            SELECT oi.*, p.name as product_name 
-            FROM order_items oi 
-            JOIN products p ON oi.product_id = p.id 
-            WHERE oi.order_id = ?
-        ''', (order['id'],), fetch_all=True)
-        
-        items_list = []
-        for item in order_items:
-            item_dict = dict(item)
-            items_list.append({
-                'product_name': item_dict['product_name'],
-                'quantity': item_dict['qty'],
-                'price': float(item_dict['price']),
-                'total': float(item_dict['qty'] * item_dict['price'])
-            })
-        
-        order_dict['items'] = items_list
-        orders_list.append(order_dict)
-    
-    return jsonify({
-        'email': user['email'],
-        'first_name': user['first_name'],
-        'last_name': user['last_name'],
-        'total_all_orders': total_all_orders,
-        'orders': orders_list
-    })
+    return telegram_response(telegram_api.get_user_info(request.args.get('telegram_id')))
 
 @app.route('/api/telegram/orders', methods=['GET'])
 def get_telegram_orders():
-    telegram_id = request.args.get('telegram_id')
-    
-    if not telegram_id:
-        return jsonify({'error': 'telegram_id required'}), 400
-    
-    user = execute_query(
-        'SELECT * FROM users WHERE telegram_id = ?',
-        (telegram_id,),
-        fetch_one=True
-    )
-    
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
+    return telegram_response(telegram_api.get_orders(
+        request.args.get('telegram_id'),
+        request.args.get('archived', '0') == '1'
+    ))
+
+def parse_sync_version():
+    since = request.args.get('since', 0, type=int)
+    return max(since, 0)
+
+@app.route('/api/sync', methods=['GET'])
+@jwt_required
+def sync_changes():
+    return jsonify(changes_since(request.user_id, parse_sync_version()))
+
+@app.route('/api/telegram/sync', methods=['GET'])
+def sync_telegram_changes():
+    return telegram_response(telegram_api.get_changes(request.args.get('telegram_id'), parse_sync_version()))
+
+@app.route('/api/events/token', methods=['POST'])
+@jwt_required
+def create_events_token():
+    # Сам поток SSE отдает asgi.py: долгое соединение там не занимает поток воркера gunicorn
+    return jsonify({
+        'token': create_stream_token(request.user_id, current_shop()),
+        'expires_in': int(cfg.EVENTS_TOKEN_EXPIRES.total_seconds())
+    })
+
+@app.route('/api/reports/revenue', methods=['GET'])
+@jwt_required
+def get_revenue_report():
+    days = parse_report_days()
+    rows = seller_revenue(request.user_id, days)
     
-    orders = execute_query(
-        'SELECT * FROM orders WHERE user_id = ? ORDER BY created_at DESC',
-        (user['id'],),
-        fetch_all=True
-    )
+    return jsonify({
+        'days': days,
+        'revenue_total': from_minor(sum(row['revenue'] for row in rows)),
+        'orders_total': sum(row['orders_count'] for row in rows),
+        'by_day': [money_fields(row, 'revenue') for row in rows]
+    })
+
+@app.route('/api/reports/top-products', methods=['GET'])
+@jwt_required
+def get_top_products_report():
+    days = parse_report_days()
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
     
-    orders_list = []
-    for order in orders:
-        order_dict = dict(order)
-        
-        order_items = execute_query('''
-            SELECT oi.*, p.name as product_name 
-            FROM order_items oi 
-            JOIN products p ON oi.product_id = p.id 
-            WHERE oi.order_id = ?
-        ''', (order['id'],), fetch_all=True)
-        
-        items_list = []
-        for item in order_items:
-            item_dict = dict(item)
-            items_list.append({
-                'product_name': item_dict['product_name'],
-                'quantity': item_dict['qty'],
-                'price': float(item_dict['price']),
-                'total': float(item_dict['qty'] * item_dict['price'])
-            })
-        
-        order_dict['items'] = items_list
-        orders_list.append(order_dict)
+    return jsonify([money_fields(row, 'revenue') for row in top_products(request.user_id, days, limit)])
+
+@app.route('/api/reports/status-funnel', methods=['GET'])
+@jwt_required
+def get_status_funnel_report():
+    days = parse_report_days()
     
-    return jsonify(orders_list)
+    return jsonify({
+        'days': days,
+        'statuses': status_funnel(request.user_id, days)
+    })
+
+@app.route('/api/telegram/stats', methods=['GET'])
+def get_telegram_stats():
+    return telegram_response(telegram_api.get_stats(request.args.get('telegram_id'), request.args.get('days', 7, type=int)))
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
 
 @app.route('/')
 def hello():
@@ -842,13 +737,21 @@ def hello():
         'version': '2.0',
         'endpoints': {
             'auth': '/api/auth/register, /api/auth/login, /api/auth/me',
-            'products': '/api/products, /api/products/all',
+            'products': '/api/products, /api/products/all, /api/products/overview',
             'orders': '/api/orders',
-            'telegram': '/api/telegram/generate-token, /link-telegram, /api/telegram/create-order, /api/telegram/products'
+            'cart': '/api/cart, /api/cart/items, /api/cart/checkout',
+            'events': '/api/events/token',
+            'sync': '/api/sync?since=<version>',
+            'reports': '/api/reports/revenue, /api/reports/top-products, /api/reports/status-funnel',
+            'metrics': '/metrics',
+            'telegram': '/api/telegram/generate-token, /link-telegram, /api/telegram/create-order, /api/telegram/products, /api/telegram/sync'
         }
     })
 
 if __name__ == '__main__':
+    # Dev-сервер в одном процессе; в продакшене: gunicorn -c gunicorn.conf.py wsgi:app
+    print_config_banner()
+    on_worker_start()
     app.run(
         host='0.0.0.0',
         port=5000,
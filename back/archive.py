@@ -0,0 +1,115 @@
+"""Архивация заказов: python archive.py [--interval 3600] [--once]
+
+Завершенные и отмененные заказы, которые не менялись ARCHIVE_AFTER_DAYS дней, переносятся
+вместе со строками и резервами в orders_archive, order_items_archive и stock_reservations_archive.
+Горячие таблицы и их индексы остаются маленькими; история с архивом - GET /api/orders?archived=1.
+Перенос идет пачками по ARCHIVE_BATCH_SIZE заказов, каждая пачка - короткая транзакция
+через repo.write, между пачками пауза ARCHIVE_BATCH_PAUSE_MS, чтобы не задерживать заказы.
+Роллапы отчетов не меняются, tombstone для /api/sync не создается.
+Каждый проход обходит базы всех магазинов по очереди (--shop - только один).
+"""
+import argparse
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from config import get_config
+from database import init_db, use_shop
+from logs import setup_logging
+from repository import get_repository
+
+config = get_config()
+
+logger = logging.getLogger('bobrshop.archive')
+
+ARCHIVED_STATUSES = ('completed', 'canceled')
+
+ORDER_COLUMNS = 'id, user_id, total_amount, status, created_at, updated_at, version'
+ORDER_ITEM_COLUMNS = 'id, order_id, product_id, qty, price, product_name'
+RESERVATION_COLUMNS = 'id, order_id, product_id, qty, status, created_at, released_at'
+
+
+def archive_cutoff(days):
+    """Граница архивации в формате CURRENT_TIMESTAMP базы (UTC)"""
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def archive_batch(conn, cutoff, limit):
+    """Переносит до limit заказов, законченных раньше cutoff; возвращает их число"""
+    order_ids = [row['id'] for row in conn.execute('''
+        SELECT id FROM orders
+        WHERE status IN (?, ?) AND updated_at < ?
+        ORDER BY id
+        LIMIT ?
+    ''', (*ARCHIVED_STATUSES, cutoff, limit)).fetchall()]
+    if not order_ids:
+        return 0
+
+    placeholders = ', '.join('?' for _ in order_ids)
+    # Строка в orders_archive должна появиться раньше удаления: по ней триггер orders_sync_delete
+    # отличает перенос в архив от удаления заказа
+    for table, columns, key in (
+        ('orders', ORDER_COLUMNS, 'id'),
+        ('order_items', ORDER_ITEM_COLUMNS, 'order_id'),
+        ('stock_reservations', RESERVATION_COLUMNS, 'order_id')
+    ):
+        conn.execute(
+            f'INSERT INTO {table}_archive ({columns}) SELECT {columns} FROM {table} WHERE {key} IN ({placeholders})',
+            order_ids
+        )
+
+    conn.execute(f'DELETE FROM stock_reservations WHERE order_id IN ({placeholders})', order_ids)
+    conn.execute(f'DELETE FROM order_items WHERE order_id IN ({placeholders})', order_ids)
+    conn.execute(f'DELETE FROM orders WHERE id IN ({placeholders})', order_ids)
+    return len(order_ids)
+
+
+def archive_orders(days=None, batch_size=None, pause_ms=None):
+    """Архивирует все подходящие заказы пачками; возвращает число перенесенных"""
+    days = config.ARCHIVE_AFTER_DAYS if days is None else days
+    batch_size = batch_size or config.ARCHIVE_BATCH_SIZE
+    pause_ms = config.ARCHIVE_BATCH_PAUSE_MS if pause_ms is None else pause_ms
+
+    repo = get_repository()
+    cutoff = archive_cutoff(days)
+    total = 0
+    while True:
+        moved = repo.write(archive_batch, cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            break
+        time.sleep(pause_ms / 1000)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Перенос старых завершенных заказов в архив')
+    parser.add_argument('--interval', type=float, default=3600, help='секунд между проходами')
+    parser.add_argument('--once', action='store_true', help='один проход и выйти')
+    parser.add_argument('--days', type=int, default=config.ARCHIVE_AFTER_DAYS, help='возраст заказа в днях')
+    parser.add_argument('--batch-size', type=int, default=config.ARCHIVE_BATCH_SIZE, help='заказов в транзакции')
+    parser.add_argument('--pause-ms', type=float, default=config.ARCHIVE_BATCH_PAUSE_MS, help='пауза между пачками')
+    parser.add_argument('--shop', choices=config.SHOPS, help='магазин (по умолчанию - все)')
+    args = parser.parse_args()
+    shops = [args.shop] if args.shop else config.SHOPS
+
+    setup_logging()
+    init_db()
+    get_repository().init_schema()
+
+    while True:
+        for shop in shops:
+            started = time.perf_counter()
+            with use_shop(shop):
+                moved = archive_orders(args.days, args.batch_size, args.pause_ms)
+            logger.info('orders archived', extra={
+                'shop': shop,
+                'orders': moved,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+            })
+        if args.once:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
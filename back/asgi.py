@@ -0,0 +1,309 @@
+"""ASGI-приложение для API бота (/api/telegram/*, /link-telegram) и ленты событий сайта /api/events.
+
+Запуск: uvicorn asgi:app --host 0.0.0.0 --port 5001 (или несколько процессов через
+gunicorn -k uvicorn.workers.UvicornWorker asgi:app). Бот указывает на него через API_URL.
+
+Логика эндпоинтов общая с Flask (telegram_api.py), обращения к SQLite идут через пул
+потоков (db_async.py), уведомления ставятся в фоновый event loop и не задерживают ответ.
+Магазин запроса выбирается как во Flask: X-Shop, код привязки или telegram_id (shops.py).
+Лента /api/events (SSE) живет здесь, а не во Flask: долгое соединение ждет в event loop,
+а не держит поток воркера gunicorn. Сайт открывает ее с коротким токеном из POST /api/events/token.
+"""
+import logging
+import time
+from contextlib import asynccontextmanager
+from functools import wraps
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from auth import decode_stream_token
+from config import get_config
+from database import init_db, on_worker_start, on_worker_exit, set_shop, reset_shop
+from db_async import run_db, db_executor
+from events import stream_events
+from idempotency import IDEMPOTENCY_HEADER, request_scope, begin_request, finish_request, abort_request
+from notifications import wait_for_notifications
+from metrics import UNMATCHED_ROUTE, request_started, request_finished, render_metrics
+from query_log import start_query_log, finish_query_log
+from logs import REQUEST_ID_HEADER, setup_logging, set_request_id, reset_request_id
+from shops import SHOP_HEADER, is_known_shop, bot_request_shop
+from repository import get_repository
+import telegram_api
+
+config = get_config()
+
+setup_logging()
+request_logger = logging.getLogger('bobrshop.http')
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def query_int(request, name, default):
+    try:
+        return int(request.query_params.get(name, default))
+    except ValueError:
+        return default
+
+
+def respond(result):
+    body, status = result
+    return JSONResponse(body, status_code=status)
+
+
+def shop_routed(handler):
+    """Выбирает базу магазина до первого обращения к ней; контекст уходит в потоки run_db"""
+
+    @wraps(handler)
+    async def wrapper(request):
+        shop = request.headers.get(SHOP_HEADER)
+        if shop is None and len(config.SHOPS) > 1:
+            data = await read_json(request) if request.method == 'POST' else None
+            telegram_id = request.query_params.get('telegram_id') or (data.get('telegram_id') if isinstance(data, dict) else None)
+            # Справочник магазинов - файл SQLite, читается в пуле потоков
+            shop = await run_db(bot_request_shop, telegram_id, request.query_params.get('token'))
+        shop = shop or config.DEFAULT_SHOP
+
+        if not is_known_shop(shop):
+            return JSONResponse({'error': 'Shop not found'}, status_code=404)
+
+        token = set_shop(shop)
+        try:
+            return await handler(request)
+        finally:
+            reset_shop(token)
+
+    return wrapper
+
+
+def idempotent(handler):
+    """Idempotency-Key для асинхронных эндпоинтов - те же таблица и правила, что у Flask"""
+
+    @wraps(handler)
+    async def wrapper(request):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return await handler(request)
+
+        body = await request.body()
+        scope = request_scope(request.url.path, data=await read_json(request))
+
+        ready = await run_db(begin_request, scope, key, body)
+        if ready is not None:
+            status_code, response_body, replayed = ready
+            headers = {'Idempotent-Replayed': 'true'} if replayed else None
+            return Response(response_body, status_code=status_code, media_type='application/json', headers=headers)
+
+        try:
+            response = await handler(request)
+        except Exception:
+            await run_db(abort_request, scope, key)
+            raise
+
+        await run_db(finish_request, scope, key, response.status_code, response.body.decode())
+        return response
+
+    return wrapper
+
+
+@shop_routed
+@idempotent
+async def create_order(request):
+    return respond(await run_db(telegram_api.create_order, await read_json(request)))
+
+
+@shop_routed
+async def get_cart(request):
+    return respond(await run_db(telegram_api.get_user_cart, request.query_params.get('telegram_id')))
+
+
+@shop_routed
+async def clear_cart(request):
+    return respond(await run_db(telegram_api.clear_user_cart, request.query_params.get('telegram_id')))
+
+
+@shop_routed
+async def add_to_cart(request):
+    return respond(await run_db(telegram_api.add_to_cart, await read_json(request)))
+
+
+@shop_routed
+@idempotent
+async def checkout_cart(request):
+    return respond(await run_db(telegram_api.checkout_cart, await read_json(request)))
+
+
+@shop_routed
+async def get_products(request):
+    return respond(await run_db(telegram_api.get_products, request.query_params.get('telegram_id')))
+
+
+@shop_routed
+async def link_account(request):
+    return respond(await run_db(
+        telegram_api.link_account,
+        request.query_params.get('token'),
+        request.query_params.get('telegram_id')
+    ))
+
+
+@shop_routed
+async def get_user_info(request):
+    return respond(await run_db(telegram_api.get_user_info, request.query_params.get('telegram_id')))
+
+
+@shop_routed
+async def get_orders(request):
+    return respond(await run_db(
+        telegram_api.get_orders,
+        request.query_params.get('telegram_id'),
+        request.query_params.get('archived', '0') == '1'
+    ))
+
+
+@shop_routed
+async def get_stats(request):
+    return respond(await run_db(
+        telegram_api.get_stats,
+        request.query_params.get('telegram_id'),
+        query_int(request, 'days', 7)
+    ))
+
+
+@shop_routed
+async def get_changes(request):
+    return respond(await run_db(
+        telegram_api.get_changes,
+        request.query_params.get('telegram_id'),
+        query_int(request, 'since', 0)
+    ))
+
+
+async def get_events(request):
+    # EventSource не умеет заголовки - токен в URL, поэтому это короткий токен ленты, а не JWT
+    payload = decode_stream_token(request.query_params.get('token', ''))
+    if payload is None or not is_known_shop(payload['shop']):
+        return JSONResponse({'error': 'Invalid token'}, status_code=401)
+
+    shop, user_id = payload['shop'], payload['user_id']
+    token = set_shop(shop)
+    try:
+        active = await run_db(get_repository().is_active_user, user_id)
+    finally:
+        reset_shop(token)
+    if not active:
+        return JSONResponse({'error': 'Invalid token'}, status_code=401)
+
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id') or 0)
+    except ValueError:
+        return JSONResponse({'error': 'Invalid Last-Event-ID'}, status_code=400)
+
+    return StreamingResponse(
+        stream_events(shop, user_id, last_event_id),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def get_metrics(request):
+    body, content_type = await run_db(render_metrics)
+    return Response(body, headers={'Content-Type': content_type})
+
+
+async def index(request):
+    return JSONResponse({
+        'message': 'Order System Telegram API (ASGI) is running!',
+        'endpoints': sorted({route.path for route in routes})
+    })
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await run_db(init_db)
+    # Схема серверной базы (DB_BACKEND=dbapi) - как при импорте app.py
+    await run_db(get_repository().init_schema)
+    on_worker_start()
+    yield
+    await run_db(wait_for_notifications)
+    on_worker_exit()
+    db_executor.shutdown(wait=False)
+
+
+routes = [
+    Route('/', index),
+    Route('/api/telegram/create-order', create_order, methods=['POST']),
+    Route('/api/telegram/cart', get_cart, methods=['GET']),
+    Route('/api/telegram/cart', clear_cart, methods=['DELETE']),
+    Route('/api/telegram/cart/items', add_to_cart, methods=['POST']),
+    Route('/api/telegram/cart/checkout', checkout_cart, methods=['POST']),
+    Route('/api/telegram/products', get_products, methods=['GET']),
+    Route('/link-telegram', link_account, methods=['GET']),
+    Route('/api/telegram/user-info', get_user_info, methods=['GET']),
+    Route('/api/telegram/orders', get_orders, methods=['GET']),
+    Route('/api/telegram/stats', get_stats, methods=['GET']),
+    Route('/api/telegram/sync', get_changes, methods=['GET']),
+    Route('/api/events', get_events, methods=['GET']),
+    Route('/metrics', get_metrics, methods=['GET']),
+]
+
+ROUTE_PATHS = {route.path for route in routes}
+
+
+class MetricsMiddleware:
+    """Те же метрики, лог запросов и X-Request-ID, что и у Flask"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        # Все маршруты без параметров, поэтому путь и есть шаблон маршрута
+        route = scope['path'] if scope['path'] in ROUTE_PATHS else UNMATCHED_ROUTE
+        headers = dict(scope['headers'])
+        request_id, request_id_token = set_request_id(
+            headers.get(REQUEST_ID_HEADER.lower().encode(), b'').decode('latin-1')
+        )
+        started = request_started(scope['method'], route)
+        query_log_token = start_query_log(f"{scope['method']} {route}")
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                message['headers'] = [
+                    *message.get('headers', []),
+                    (REQUEST_ID_HEADER.lower().encode(), request_id.encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            query_log = finish_query_log(query_log_token)
+            request_logger.log(logging.ERROR if status >= 500 else logging.INFO, 'request', extra={
+                'method': scope['method'],
+                'route': route,
+                'status': status,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+                'queries': query_log['count']
+            })
+            request_finished(scope['method'], route, status, started)
+            reset_request_id(request_id_token)
+
+
+app = Starlette(routes=routes, lifespan=lifespan, middleware=[
+    Middleware(MetricsMiddleware),
+    # Ленту открывает браузер с адреса сайта
+    Middleware(CORSMiddleware, allow_origins=config.CORS_ORIGINS, allow_methods=['GET'])
+])
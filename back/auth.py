@@ -1,7 +1,9 @@
 import bcrypt
 import jwt as pyjwt
-from datetime import datetime, timedelta
+from datetime import datetime
 from config import get_config
+from database import current_shop
+from repository import get_repository
 
 config = get_config()
 
@@ -23,23 +25,58 @@ def check_pswd(hashed_password: str, password: str) -> bool:
     except Exception:
         return False
 
-def create_access_token(user_id: int) -> str:
-    """Создание JWT токена"""
+def create_access_token(user_id: int, shop: str) -> str:
+    """Создание JWT токена; claim shop - магазин, в базе которого лежит пользователь"""
     payload = {
         'user_id': user_id,
+        'shop': shop,
         'exp': datetime.utcnow() + config.JWT_ACCESS_TOKEN_EXPIRES,
         'iat': datetime.utcnow()
     }
     return pyjwt.encode(payload, config.JWT_SECRET_KEY, algorithm='HS256')
 
-def verify_access_token(token: str) -> int:
-    """Верификация JWT токена"""
+def create_stream_token(user_id: int, shop: str) -> str:
+    """Короткий токен только для ленты /api/events; основной JWT не попадает в URL и логи"""
+    payload = {
+        'user_id': user_id,
+        'shop': shop,
+        'purpose': 'events',
+        'exp': datetime.utcnow() + config.EVENTS_TOKEN_EXPIRES,
+        'iat': datetime.utcnow()
+    }
+    return pyjwt.encode(payload, config.JWT_SECRET_KEY, algorithm='HS256')
+
+def decode_stream_token(token: str) -> dict:
+    """Полезная нагрузка токена ленты или None; обычный JWT здесь не подходит"""
+    payload = decode_access_token(token)
+    if payload is None or payload.get('purpose') != 'events':
+        return None
+    return payload
+
+def decode_access_token(token: str) -> dict:
+    """Проверенная полезная нагрузка JWT или None"""
     try:
-        payload = pyjwt.decode(token, config.JWT_SECRET_KEY, algorithms=['HS256'])
-        return payload['user_id']
+        return pyjwt.decode(token, config.JWT_SECRET_KEY, algorithms=['HS256'])
     except (pyjwt.ExpiredSignatureError, pyjwt.InvalidTokenError):
         return None
 
+def verify_access_token(token: str, active_only: bool = True) -> int:
+    """Верификация JWT токена: id пользователя, если токен выдан в текущем магазине.
+
+    active_only - пользователь существует и не удаляется: удаление аккаунта отзывает выданные токены.
+    """
+    payload = decode_access_token(token)
+    # id пользователей в базах магазинов пересекаются - чужой токен не действует.
+    # Токены без claim выданы до появления магазинов, в DEFAULT_SHOP
+    if payload is None or payload.get('shop', config.DEFAULT_SHOP) != current_shop():
+        return None
+    # Токен ленты выдается для одного назначения и вместо JWT не действует
+    if 'purpose' in payload:
+        return None
+    if active_only and not get_repository().is_active_user(payload['user_id']):
+        return None
+    return payload['user_id']
+
 def jwt_required(f):
     """Декоратор для проверки JWT токена"""
     from functools import wraps
@@ -0,0 +1,271 @@
+from datetime import datetime
+from events import publish_order_event, publish_product_event
+from inventory import InsufficientStockError, reserve_stock
+from money import from_minor, money_fields, update_order_total
+from notifications import notify_order_created
+from reports import add_order_to_rollups
+from repository import get_repository
+
+
+class CartEmptyError(Exception):
+    """Попытка оформить пустую корзину"""
+
+
+class CartValidationError(Exception):
+    """Корзина устарела: товары удалены, цены изменились или не хватает остатков"""
+
+    def __init__(self, problems):
+        self.problems = problems
+        super().__init__('Cart is out of date')
+
+
+CART_QUERY = '''
+    SELECT ci.product_id, ci.qty, ci.added_price, ci.added_at,
+           p.id AS current_id, p.name, p.price, p.stock, p.description, p.created_by
+    FROM cart_items ci
+    LEFT JOIN products p ON p.id = ci.product_id AND p.deleted_at IS NULL
+    WHERE ci.user_id = ?
+    ORDER BY ci.added_at, ci.product_id
+'''
+
+CUSTOM_ITEMS_QUERY = '''
+    SELECT name, price, description, qty
+    FROM cart_custom_items
+    WHERE user_id = ?
+    ORDER BY added_at, name, price
+'''
+
+
+def find_or_create_product(conn, owner_id, name, price, description):
+    """Находит товар владельца с тем же названием и ценой или создает новый"""
+    product = conn.execute(
+        'SELECT id FROM products WHERE created_by = ? AND name = ? AND price = ? AND deleted_at IS NULL ORDER BY id LIMIT 1',
+        (owner_id, name, price)
+    ).fetchone()
+
+    if product:
+        return product['id']
+
+    product_id = get_repository().insert_product(conn, owner_id, name, price, description, None)
+    publish_product_event(conn, product_id, 'created')
+    return product_id
+
+
+def _validate_rows(rows):
+    """Проверяет всю корзину по результату одного запроса, без запросов на каждый товар"""
+    items = []
+    problems = []
+
+    for row in rows:
+        item = {
+            'product_id': row['product_id'],
+            'qty': row['qty'],
+            'name': row['name'],
+            'price': row['price'],
+            'added_price': row['added_price'],
+            'stock': row['stock'],
+            'description': row['description'],
+            'available': row['current_id'] is not None,
+            'price_changed': row['current_id'] is not None and row['price'] != row['added_price'],
+            'insufficient_stock': row['stock'] is not None and row['stock'] < row['qty']
+        }
+        items.append(item)
+
+        if not item['available']:
+            problems.append({'product_id': item['product_id'], 'problem': 'unavailable'})
+        elif item['price_changed']:
+            problems.append({'product_id': item['product_id'], 'problem': 'price_changed', 'price': item['price']})
+        elif item['insufficient_stock']:
+            problems.append({'product_id': item['product_id'], 'problem': 'insufficient_stock', 'stock': item['stock']})
+
+    return items, problems
+
+
+def _custom_items(rows):
+    """Позиции без товара в каталоге: цену назначил покупатель, устареть она не может"""
+    return [{
+        'product_id': None,
+        'qty': row['qty'],
+        'name': row['name'],
+        'price': row['price'],
+        'added_price': row['price'],
+        'stock': None,
+        'description': row['description'],
+        'available': True,
+        'price_changed': False,
+        'insufficient_stock': False
+    } for row in rows]
+
+
+def get_cart(user_id):
+    """Корзина пользователя с актуальными ценами и списком проблем"""
+    def read_cart(conn):
+        return (
+            conn.execute(CART_QUERY, (user_id,)).fetchall(),
+            conn.execute(CUSTOM_ITEMS_QUERY, (user_id,)).fetchall()
+        )
+
+    rows, custom_rows = get_repository().read(read_cart)
+    items, problems = _validate_rows(rows)
+    items += _custom_items(custom_rows)
+
+    return {
+        'items': items,
+        'problems': problems,
+        'total_amount': sum(item['price'] * item['qty'] for item in items if item['available'])
+    }
+
+
+def add_cart_item(user_id, product_id, qty):
+    """Добавляет товар в корзину или увеличивает количество. False, если товара нет"""
+    repo = get_repository()
+    product = repo.fetch_one('SELECT price FROM products WHERE id = ? AND deleted_at IS NULL', (product_id,))
+    if not product:
+        return False
+
+    repo.execute('''
+        INSERT INTO cart_items (user_id, product_id, qty, added_price) VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id, product_id) DO UPDATE SET
+            qty = cart_items.qty + excluded.qty,
+            added_price = excluded.added_price
+    ''', (user_id, product_id, qty, product['price']))
+    return True
+
+
+def add_custom_cart_item(user_id, name, price, description, qty):
+    """Добавляет позицию без товара в каталоге (цена в копейках); та же позиция увеличивает количество"""
+    get_repository().execute('''
+        INSERT INTO cart_custom_items (user_id, name, price, description, qty) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, name, price) DO UPDATE SET
+            qty = cart_custom_items.qty + excluded.qty,
+            description = excluded.description
+    ''', (user_id, name, price, description, qty))
+
+
+def set_cart_item_qty(user_id, product_id, qty):
+    """Устанавливает количество товара (целое больше нуля). False, если позиции нет"""
+    return get_repository().execute(
+        'UPDATE cart_items SET qty = ? WHERE user_id = ? AND product_id = ?',
+        (qty, user_id, product_id)
+    ) > 0
+
+
+def remove_cart_item(user_id, product_id):
+    return get_repository().execute(
+        'DELETE FROM cart_items WHERE user_id = ? AND product_id = ?',
+        (user_id, product_id)
+    ) > 0
+
+
+def clear_cart(user_id):
+    def clear(conn):
+        conn.execute('DELETE FROM cart_items WHERE user_id = ?', (user_id,))
+        conn.execute('DELETE FROM cart_custom_items WHERE user_id = ?', (user_id,))
+
+    get_repository().write(clear)
+
+
+def refresh_cart(user_id):
+    """Принимает актуальные цены и убирает удаленные товары после неудачного оформления"""
+    def refresh(conn):
+        conn.execute('''
+            UPDATE cart_items
+            SET added_price = (SELECT price FROM products WHERE products.id = cart_items.product_id)
+            WHERE user_id = ? AND product_id IN (SELECT id FROM products WHERE deleted_at IS NULL)
+        ''', (user_id,))
+        conn.execute(
+            'DELETE FROM cart_items WHERE user_id = ? AND product_id NOT IN (SELECT id FROM products WHERE deleted_at IS NULL)',
+            (user_id,)
+        )
+
+    get_repository().write(refresh)
+
+
+def checkout_cart(conn, user_id):
+    """Превращает корзину в заказ внутри транзакции conn. Возвращает (order_id, total_amount)"""
+    rows = conn.execute(CART_QUERY, (user_id,)).fetchall()
+    custom_rows = conn.execute(CUSTOM_ITEMS_QUERY, (user_id,)).fetchall()
+    if not rows and not custom_rows:
+        raise CartEmptyError()
+
+    items, problems = _validate_rows(rows)
+    if problems:
+        raise CartValidationError(problems)
+
+    repo = get_repository()
+    order_id = repo.insert_order(conn, user_id)
+
+    conn.execute('''
+        INSERT INTO order_items (order_id, product_id, qty, price, product_name)
+        SELECT ?, ci.product_id, ci.qty, p.price, p.name
+        FROM cart_items ci
+        JOIN products p ON p.id = ci.product_id
+        WHERE ci.user_id = ?
+    ''', (order_id, user_id))
+
+    for item in items:
+        if item['stock'] is not None:
+            reserve_stock(conn, order_id, item['product_id'], item['qty'])
+
+    # Товар для позиции без каталога появляется только вместе с заказом - брошенная корзина его не оставляет
+    if custom_rows:
+        repo.insert_order_items(conn, [
+            (order_id, find_or_create_product(
+                conn,
+                user_id,
+                row['name'],
+                row['price'],
+                row['description'] or f'Товар из заказа Telegram #{order_id}'
+            ), row['qty'], row['price'], row['name'])
+            for row in custom_rows
+        ])
+
+    total_amount = update_order_total(conn, order_id)
+    add_order_to_rollups(conn, order_id)
+    publish_order_event(conn, order_id, 'created')
+    conn.execute('DELETE FROM cart_items WHERE user_id = ?', (user_id,))
+    conn.execute('DELETE FROM cart_custom_items WHERE user_id = ?', (user_id,))
+
+    return order_id, total_amount
+
+
+def cart_to_json(cart):
+    return {
+        'items': [money_fields(item, 'price', 'added_price') for item in cart['items']],
+        'problems': [money_fields(problem, 'price') for problem in cart['problems']],
+        'total_amount': from_minor(cart['total_amount'])
+    }
+
+
+def place_cart_order(user_id):
+    """Оформляет корзину пользователя одной транзакцией. Возвращает (тело ответа API, статус)"""
+    try:
+        order_id, total_amount = get_repository().write(checkout_cart, user_id)
+    except CartEmptyError:
+        return {'error': 'Cart is empty'}, 400
+    except CartValidationError as e:
+        refresh_cart(user_id)
+        return {
+            'error': 'Cart is out of date, please review it',
+            'problems': [money_fields(problem, 'price') for problem in e.problems],
+            'cart': cart_to_json(get_cart(user_id))
+        }, 409
+    except InsufficientStockError as e:
+        return {'error': f'Not enough stock for product with id {e.product_id}'}, 409
+
+    order_lines = notify_order_created(order_id, user_id, total_amount)
+
+    return {
+        'success': True,
+        'id': order_id,
+        'order_id': order_id,
+        'total_amount': from_minor(total_amount),
+        'status': 'new',
+        'created_at': datetime.now().isoformat(),
+        'items': [{
+            'product_name': item['product_name'],
+            'quantity': item['qty'],
+            'price': from_minor(item['price']),
+            'total': from_minor(item['qty'] * item['price'])
+        } for item in order_lines]
+    }, 201
@@ -1,3 +1,4 @@
+import logging
 import os
 from datetime import timedelta
 
@@ -6,18 +7,113 @@ class Config:
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-dev-secret-change-in-production'
 
     DATABASE_PATH = os.environ.get('DATABASE_PATH') or 'app.db'
+    # Магазины (SHOPS через запятую): у каждого своя база SQLite и свой поток-писатель, поэтому
+    # нагрузка одного магазина не задерживает записи других. База DEFAULT_SHOP - DATABASE_PATH,
+    # остальных - SHOP_DATABASE_DIR/shop_<имя>.db. SHOP_DIRECTORY_PATH - общий справочник
+    # telegram_id -> магазин для бота (нужен только при нескольких магазинах)
+    DEFAULT_SHOP = os.environ.get('DEFAULT_SHOP', 'main')
+    SHOPS = list(dict.fromkeys(
+        [DEFAULT_SHOP] + [shop.strip() for shop in os.environ.get('SHOPS', '').split(',') if shop.strip()]
+    ))
+    SHOP_DATABASE_DIR = os.environ.get('SHOP_DATABASE_DIR') or os.path.dirname(DATABASE_PATH)
+    SHOP_DIRECTORY_PATH = os.environ.get('SHOP_DIRECTORY_PATH') or os.path.join(SHOP_DATABASE_DIR, 'shops.db')
+    # Соединений только для чтения на процесс и необязательная реплика для тяжелых чтений
+    # (обновляется python replica.py; чтения из нее отстают на интервал обновления)
+    DB_READ_POOL_SIZE = int(os.environ.get('DB_READ_POOL_SIZE', 8))
+    DATABASE_REPLICA_PATH = os.environ.get('DATABASE_REPLICA_PATH')
+    # Групповой коммит потока-писателя: до DB_WRITE_BATCH_SIZE заданий в одной транзакции,
+    # ожидание следующих не дольше DB_WRITE_BATCH_WINDOW_MS после первого
+    DB_WRITE_BATCH_SIZE = int(os.environ.get('DB_WRITE_BATCH_SIZE', 32))
+    DB_WRITE_BATCH_WINDOW_MS = float(os.environ.get('DB_WRITE_BATCH_WINDOW_MS', 2))
+    # Хранилище пользователей, товаров и заказов (repository.py): sqlite или dbapi - серверная
+    # база через модуль DB-API (DBAPI_MODULE, по умолчанию psycopg2) по строке DATABASE_URL
+    DB_BACKEND = os.environ.get('DB_BACKEND', 'sqlite')
+    DBAPI_MODULE = os.environ.get('DBAPI_MODULE', 'psycopg2')
+    DATABASE_URL = os.environ.get('DATABASE_URL')
+    DB_SERVER_POOL_SIZE = int(os.environ.get('DB_SERVER_POOL_SIZE', 10))
     
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
     
+    IDEMPOTENCY_KEY_TTL = timedelta(hours=int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', 24)))
+    # Ключ без сохраненного ответа дольше аренды считается брошенным (процесс упал) и занимается заново
+    IDEMPOTENCY_LEASE = timedelta(seconds=int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', 60)))
+    
+    # Лента изменений /api/events (SSE)
+    EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 1))
+    EVENTS_HEARTBEAT_INTERVAL = 15
+    EVENTS_STREAM_TIMEOUT = int(os.environ.get('EVENTS_STREAM_TIMEOUT', 300))
+    EVENTS_RETRY_MS = 3000
+    EVENTS_RETENTION_HOURS = int(os.environ.get('EVENTS_RETENTION_HOURS', 72))
+    # Токен ленты передается в URL (EventSource не умеет заголовки), поэтому живет недолго
+    EVENTS_TOKEN_EXPIRES = timedelta(seconds=int(os.environ.get('EVENTS_TOKEN_TTL_SECONDS', 60)))
+    
+    # Удаления для /api/sync хранятся столько дней, потом клиенту нужна полная синхронизация
+    SYNC_TOMBSTONE_RETENTION_DAYS = int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', 30))
+    
+    # Архив заказов (archive.py): завершенные и отмененные заказы старше ARCHIVE_AFTER_DAYS
+    # переносятся пачками по ARCHIVE_BATCH_SIZE с паузой ARCHIVE_BATCH_PAUSE_MS между ними
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+    ARCHIVE_BATCH_PAUSE_MS = float(os.environ.get('ARCHIVE_BATCH_PAUSE_MS', 200))
+    
+    # Обслуживание базы (maintenance.py): копии шагами по DB_BACKUP_STEP_PAGES страниц,
+    # в DB_BACKUP_DIR хранится DB_BACKUP_KEEP последних; incremental vacuum - по DB_VACUUM_STEP_PAGES
+    DB_BACKUP_DIR = os.environ.get('DB_BACKUP_DIR')
+    DB_BACKUP_KEEP = int(os.environ.get('DB_BACKUP_KEEP', 7))
+    DB_BACKUP_STEP_PAGES = int(os.environ.get('DB_BACKUP_STEP_PAGES', 1024))
+    DB_BACKUP_STEP_PAUSE_MS = float(os.environ.get('DB_BACKUP_STEP_PAUSE_MS', 10))
+    DB_VACUUM_STEP_PAGES = int(os.environ.get('DB_VACUUM_STEP_PAGES', 1000))
+    DB_VACUUM_STEP_PAUSE_MS = float(os.environ.get('DB_VACUUM_STEP_PAUSE_MS', 50))
+    # Очистка просроченных и использованных токенов привязки Telegram - пачками по столько строк
+    LINK_TOKEN_SWEEP_BATCH_SIZE = int(os.environ.get('LINK_TOKEN_SWEEP_BATCH_SIZE', 1000))
+    
+    # Удаление аккаунта: больше ACCOUNT_DELETE_BATCH_SIZE заказов и товаров - фоновой задачей
+    # пачками такого размера, между пачками писатель свободен ACCOUNT_DELETE_BATCH_PAUSE_MS
+    ACCOUNT_DELETE_BATCH_SIZE = int(os.environ.get('ACCOUNT_DELETE_BATCH_SIZE', 500))
+    ACCOUNT_DELETE_BATCH_PAUSE_MS = float(os.environ.get('ACCOUNT_DELETE_BATCH_PAUSE_MS', 50))
+    
+    # ASGI-приложение бота: потоков для SQLite и одновременных запросов к Telegram API
+    ASYNC_DB_THREADS = int(os.environ.get('ASYNC_DB_THREADS', 16))
+    NOTIFICATION_CONCURRENCY = int(os.environ.get('NOTIFICATION_CONCURRENCY', 20))
+    # Адрес Bot API для уведомлений (в нагрузочных тестах - заглушка bench/fake_telegram.py)
+    TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+    
+    # Журнал запросов к базе: медленные запросы пишутся с планом выполнения, а бюджет запросов
+    # на один HTTP-запрос и повторы одного запроса (N+1) проверяются в режиме QUERY_CHECK_MODE:
+    # off - не проверять, warn - писать в лог, raise - падать с QueryBudgetError (для тестов)
+    QUERY_SLOW_MS = float(os.environ.get('QUERY_SLOW_MS', 100))
+    QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', 50))
+    QUERY_REPEAT_LIMIT = int(os.environ.get('QUERY_REPEAT_LIMIT', 10))
+    
+    # Логи - JSON в stdout через фоновый поток. LOG_LEVELS задает уровни отдельных логгеров
+    # ('bobrshop.db=WARNING'), LOG_SAMPLE_RATES - долю записей ниже WARNING, которые пишутся
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+    LOG_SAMPLE_RATES = os.environ.get('LOG_SAMPLE_RATES', 'bobrshop.http=0.1,bobrshop.notifications=0.1')
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    
+    # Профилирование запросов (см. profiling.py): только маршруты из PROFILING_ROUTES ('*' - все),
+    # по заголовку X-Profile: <PROFILING_TOKEN> или случайная доля PROFILING_SAMPLE_RATE
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+    PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+    PROFILING_ROUTES = os.environ.get('PROFILING_ROUTES', '')
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+    PROFILING_MODE = os.environ.get('PROFILING_MODE', 'cprofile')
+    PROFILING_INTERVAL_MS = float(os.environ.get('PROFILING_INTERVAL_MS', 5))
+    PROFILING_DIR = os.environ.get('PROFILING_DIR', 'profiles')
+    PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', 100))
+    
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://localhost:3000').split(',')
 
 class DevelopmentConfig(Config):
     DEBUG = True
     TESTING = False
+    QUERY_CHECK_MODE = os.environ.get('QUERY_CHECK_MODE', 'warn')
 
 class ProductionConfig(Config):
     DEBUG = False
     TESTING = False
+    QUERY_CHECK_MODE = os.environ.get('QUERY_CHECK_MODE', 'off')
 
 config_dict = {
     'development': DevelopmentConfig,
@@ -27,12 +123,16 @@ config_dict = {
 
 def get_config():
     env = os.environ.get('FLASK_ENV', 'development')
-    config_class = config_dict.get(env, config_dict['default'])
-    
-    # Вывод информации о конфигурации
-    print(f"🔧 Loading {env} configuration")
-    print(f"📁 Database path: {config_class.DATABASE_PATH}")
-    print(f"🌐 CORS origins: {config_class.CORS_ORIGINS}")
-    print(f"🐛 Debug mode: {config_class.DEBUG}")
+    return config_dict.get(env, config_dict['default'])
+
+def print_config_banner():
+    """Вывод информации о конфигурации - один раз при старте сервера, а не при каждом импорте"""
+    config_class = get_config()
     
-    return config_class
\ No newline at end of file
+    logging.getLogger('bobrshop.config').info('configuration loaded', extra={
+        'env': os.environ.get('FLASK_ENV', 'development'),
+        'database_path': config_class.DATABASE_PATH,
+        'shops': config_class.SHOPS,
+        'cors_origins': config_class.CORS_ORIGINS,
+        'debug': config_class.DEBUG
+    })
\ No newline at end of file
@@ -1,17 +1,245 @@
+import contextvars
 import sqlite3
 import os
-from datetime import datetime
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from urllib.parse import quote
+try:
+    import fcntl
+except ImportError:  # Windows: там backend запускается только dev-сервером в одном процессе
+    fcntl = None
 from config import get_config
+from money import migrate_money_to_minor_units
+from query_log import record_query
 
 config = get_config()
 
-def get_db_connection():
-    conn = sqlite3.connect(config.DATABASE_PATH)
+class TimedConnection(sqlite3.Connection):
+    """Учитывает conn.execute - запросы внутри transaction() и snapshot() попадают в журнал и метрики"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        cursor = super().execute(sql, parameters)
+        # Для SELECT строки еще не выбраны - rowcount известен только для изменений
+        rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        record_query(self, sql, parameters, time.perf_counter() - started, rows)
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        cursor = super().executemany(sql, seq_of_parameters)
+        record_query(self, sql, None, time.perf_counter() - started, cursor.rowcount, many=True)
+        return cursor
+
+# Магазин текущего запроса: его выбирает маршрутизатор (shops.py) до первого обращения к базе.
+# Контекст копируется в задания писателя (WriteJob) и в потоки run_db, поэтому все соединения,
+# пулы и писатели ниже относятся к базе этого магазина. Без маршрутизации - DEFAULT_SHOP.
+_current_shop = contextvars.ContextVar('shop', default=None)
+
+def current_shop():
+    return _current_shop.get() or config.DEFAULT_SHOP
+
+def set_shop(shop):
+    return _current_shop.set(shop)
+
+def reset_shop(token):
+    _current_shop.reset(token)
+
+@contextmanager
+def use_shop(shop):
+    """Обращения к базе внутри блока идут в базу магазина shop"""
+    token = set_shop(shop)
+    try:
+        yield
+    finally:
+        reset_shop(token)
+
+def shop_database_path(shop=None):
+    shop = shop or current_shop()
+    if shop == config.DEFAULT_SHOP:
+        return config.DATABASE_PATH
+    return os.path.join(config.SHOP_DATABASE_DIR, f'shop_{shop}.db')
+
+def shop_replica_path(shop=None):
+    """Реплика магазина рядом с DATABASE_REPLICA_PATH; None, если реплики не настроены"""
+    shop = shop or current_shop()
+    if not config.DATABASE_REPLICA_PATH or shop == config.DEFAULT_SHOP:
+        return config.DATABASE_REPLICA_PATH
+    root, ext = os.path.splitext(config.DATABASE_REPLICA_PATH)
+    return f'{root}_{shop}{ext}'
+
+def get_db_connection(path=None):
+    conn = sqlite3.connect(path or shop_database_path(), timeout=30, factory=TimedConnection)
     conn.row_factory = sqlite3.Row  
+    # Внешние ключи и ON DELETE CASCADE: удаление пользователя или заказа не оставляет сирот.
+    # Через курсор - настройка соединения не считается запросом в журнале и бюджете
+    conn.cursor().execute('PRAGMA foreign_keys=ON')
     return conn
 
+# Чтения и записи разведены: SELECT идут через пул соединений только для чтения (их в WAL
+# может быть сколько угодно параллельно), изменения - через одного писателя на процесс,
+# чтобы потоки воркера не толкались за блокировку SQLite и не ждали busy timeout.
+# Блокировка записи - своя у каждого магазина: их базы - разные файлы
+_write_locks = {shop: threading.RLock() for shop in config.SHOPS}
+
+def write_lock(shop=None):
+    return _write_locks[shop or current_shop()]
+
+_READ_QUERY = re.compile(r'^\s*SELECT\b', re.IGNORECASE)
+_DATA_CHANGE_QUERY = re.compile(r'^\s*(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+def file_id(path):
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns
+
+class ReadPool:
+    """Пул соединений mode=ro + query_only; не больше size соединений одновременно"""
+
+    def __init__(self, path, size, immutable=False):
+        self.path = path
+        # immutable - для реплики: файл не меняется, его целиком подменяет refresh_replica()
+        self.immutable = immutable
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _open(self):
+        uri = f'file:{quote(os.path.abspath(self.path))}?mode=ro'
+        if self.immutable:
+            uri += '&immutable=1'
+        conn = sqlite3.connect(uri, uri=True, timeout=30, check_same_thread=False, factory=TimedConnection)
+        conn.row_factory = sqlite3.Row
+        conn.isolation_level = None
+        conn.execute('PRAGMA query_only = 1')
+        conn.file_id = file_id(self.path) if self.immutable else None
+        return conn
+
+    def _checkout(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return self._open()
+            # Реплика обновилась - старое соединение смотрит на удаленный файл
+            if self.immutable and conn.file_id != file_id(self.path):
+                conn.close()
+                continue
+            return conn
+
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            conn = self._checkout()
+            try:
+                yield conn
+            except BaseException:
+                conn.close()
+                raise
+            self._idle.put(conn)
+
+_read_pools = {}
+_read_pools_pid = None
+_read_pools_lock = threading.Lock()
+
+def read_pool_for(key, path, immutable=False):
+    """Пул чтения процесса для файла path (одна база магазина, его реплика или справочник магазинов)"""
+    global _read_pools_pid
+    
+    with _read_pools_lock:
+        if _read_pools_pid != os.getpid():
+            # После fork соединения родителя не используются
+            _read_pools.clear()
+            _read_pools_pid = os.getpid()
+        
+        if key not in _read_pools:
+            _read_pools[key] = ReadPool(path, config.DB_READ_POOL_SIZE, immutable=immutable)
+        return _read_pools[key]
+
+def read_pool(replica=False):
+    """Пул чтения текущего магазина; replica=True - снимок его реплики, если она настроена"""
+    shop = current_shop()
+    replica_path = shop_replica_path(shop)
+    
+    if replica and replica_path and os.path.exists(replica_path):
+        return read_pool_for((shop, 'replica'), replica_path, immutable=True)
+    return read_pool_for((shop, 'primary'), shop_database_path(shop))
+
+def refresh_replica():
+    """Копирует базу текущего магазина в его реплику через backup API и атомарно подменяет файл"""
+    replica_path = shop_replica_path()
+    tmp_path = f'{replica_path}.tmp'
+    
+    source = get_db_connection()
+    target = sqlite3.connect(tmp_path)
+    try:
+        source.backup(target)
+        # Реплика открывается как immutable - ей не нужен WAL
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+        source.close()
+    
+    os.replace(tmp_path, replica_path)
+
+def add_column_if_missing(conn, table, column, definition):
+    """Добавляет колонку в существующую таблицу (миграция старых баз)"""
+    columns = [row['name'] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        return True
+    return False
+
+@contextmanager
+def init_lock():
+    """Межпроцессная блокировка: миграции выполняет только один процесс, остальные ждут"""
+    if fcntl is None:
+        yield
+        return
+    
+    with open(f'{shop_database_path()}.init.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 def init_db():
+    """Схема и миграции баз всех магазинов"""
+    if config.SHOP_DATABASE_DIR:
+        os.makedirs(config.SHOP_DATABASE_DIR, exist_ok=True)
+    
+    for shop in config.SHOPS:
+        with use_shop(shop), init_lock():
+            _init_db()
+    
+    if len(config.SHOPS) > 1:
+        from shops import init_shop_directory
+        init_shop_directory()
+
+# Соединения, которые воркер держит открытыми все время работы (по одному на базу магазина).
+# Пока к WAL-базе открыто хотя бы одно соединение, SQLite не делает чекпойнт с удалением -wal
+# при закрытии каждого короткого соединения execute_query.
+_worker_conns = []
+
+def on_worker_start():
+    """Настройка воркера после fork: свои соединения, ничего не наследуется от мастера"""
+    _worker_conns[:] = [get_db_connection(shop_database_path(shop)) for shop in config.SHOPS]
+
+def on_worker_exit():
+    for conn in _worker_conns:
+        conn.close()
+    _worker_conns.clear()
+
+def _init_db():
     conn = get_db_connection()
+    # Миграции пересоздают таблицы, на которые ссылаются другие - с проверкой ключей DROP TABLE не пройдет
+    conn.execute('PRAGMA foreign_keys=OFF')
+    # Действует только на новую пустую базу; старую переводит maintenance.py enable-incremental-vacuum
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    conn.execute('PRAGMA journal_mode=WAL')
     
     conn.executescript('''
         CREATE TABLE IF NOT EXISTS users (
@@ -29,20 +257,26 @@ def init_db():
         CREATE TABLE IF NOT EXISTS products (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
-            price REAL NOT NULL,
+            price INTEGER NOT NULL,
             description TEXT,
-            created_by INTEGER NOT NULL,
+            stock INTEGER,
+            created_by INTEGER,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (created_by) REFERENCES users (id)
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            version INTEGER NOT NULL DEFAULT 0,
+            deleted_at TIMESTAMP,
+            FOREIGN KEY (created_by) REFERENCES users (id) ON DELETE SET NULL
         );
 
         CREATE TABLE IF NOT EXISTS orders (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
-            total_amount REAL NOT NULL,
+            total_amount INTEGER NOT NULL,
             status TEXT DEFAULT 'new',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            version INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
         );
 
         CREATE TABLE IF NOT EXISTS order_items (
@@ -50,9 +284,9 @@ def init_db():
             order_id INTEGER NOT NULL,
             product_id INTEGER NOT NULL,
             qty INTEGER NOT NULL,
-            price REAL NOT NULL,
-            FOREIGN KEY (order_id) REFERENCES orders (id),
-            FOREIGN KEY (product_id) REFERENCES products (id)
+            price INTEGER NOT NULL,
+            product_name TEXT,
+            FOREIGN KEY (order_id) REFERENCES orders (id) ON DELETE CASCADE
         );
 
         CREATE TABLE IF NOT EXISTS telegram_link_tokens (
@@ -61,10 +295,181 @@ def init_db():
             token TEXT UNIQUE NOT NULL,
             expires_at TIMESTAMP NOT NULL,
             is_used BOOLEAN DEFAULT 0,
-            FOREIGN KEY (user_id) REFERENCES users (id)
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        );
+
+        CREATE TABLE IF NOT EXISTS stock_reservations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            qty INTEGER NOT NULL,
+            status TEXT DEFAULT 'active',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            released_at TIMESTAMP,
+            FOREIGN KEY (order_id) REFERENCES orders (id) ON DELETE CASCADE
+        );
+
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scope TEXT NOT NULL,
+            idem_key TEXT NOT NULL,
+            request_hash TEXT NOT NULL,
+            status_code INTEGER,
+            response_body TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            UNIQUE (scope, idem_key)
+        );
+
+        CREATE TABLE IF NOT EXISTS cart_items (
+            user_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            qty INTEGER NOT NULL,
+            added_price INTEGER NOT NULL,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, product_id),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+            FOREIGN KEY (product_id) REFERENCES products (id) ON DELETE CASCADE
+        );
+
+        -- Позиции корзины бота без товара в каталоге: товар создается только при оформлении заказа
+        CREATE TABLE IF NOT EXISTS cart_custom_items (
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            price INTEGER NOT NULL,
+            description TEXT,
+            qty INTEGER NOT NULL,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, name, price),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        );
+
+        CREATE TABLE IF NOT EXISTS seller_daily_stats (
+            seller_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            orders_count INTEGER NOT NULL DEFAULT 0,
+            items_qty INTEGER NOT NULL DEFAULT 0,
+            revenue INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (seller_id, day)
+        );
+
+        CREATE TABLE IF NOT EXISTS product_daily_stats (
+            seller_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            qty INTEGER NOT NULL DEFAULT 0,
+            revenue INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (seller_id, product_id, day)
+        );
+
+        CREATE TABLE IF NOT EXISTS order_status_daily (
+            seller_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            status TEXT NOT NULL,
+            orders_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (seller_id, day, status)
+        );
+
+        CREATE TABLE IF NOT EXISTS change_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS event_cursors (
+            consumer TEXT PRIMARY KEY,
+            last_event_id INTEGER NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS sync_clock (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            purged_version INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT OR IGNORE INTO sync_clock (id, version) VALUES (1, 0);
+
+        CREATE TABLE IF NOT EXISTS sync_tombstones (
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            user_id INTEGER,
+            version INTEGER NOT NULL,
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name TEXT PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        
+        -- Архив завершенных и отмененных заказов (archive.py): те же колонки плюс время переноса.
+        -- Горячие orders/order_items остаются маленькими, история читается с ?archived=1.
+        CREATE TABLE IF NOT EXISTS orders_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            total_amount INTEGER NOT NULL,
+            status TEXT,
+            created_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            version INTEGER NOT NULL DEFAULT 0,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        
+        CREATE TABLE IF NOT EXISTS order_items_archive (
+            id INTEGER PRIMARY KEY,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            qty INTEGER NOT NULL,
+            price INTEGER NOT NULL,
+            product_name TEXT
+        );
+        
+        -- Поэтапное удаление больших аккаунтов (account_deletion.py); строка переживает пользователя
+        CREATE TABLE IF NOT EXISTS account_deletions (
+            user_id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL,
+            total_rows INTEGER NOT NULL,
+            deleted_rows INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        
+        CREATE TABLE IF NOT EXISTS stock_reservations_archive (
+            id INTEGER PRIMARY KEY,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            qty INTEGER NOT NULL,
+            status TEXT,
+            created_at TIMESTAMP,
+            released_at TIMESTAMP
         );
     ''')
     
+    add_column_if_missing(conn, 'products', 'stock', 'INTEGER')
+    for table in ('products', 'orders'):
+        add_column_if_missing(conn, table, 'updated_at', 'TIMESTAMP')
+        add_column_if_missing(conn, table, 'version', 'INTEGER NOT NULL DEFAULT 0')
+    # Мягкое удаление товара; строка заказа хранит название на момент покупки
+    add_column_if_missing(conn, 'products', 'deleted_at', 'TIMESTAMP')
+    for table in ('order_items', 'order_items_archive'):
+        add_column_if_missing(conn, table, 'product_name', 'TEXT')
+    conn.commit()
+    
+    apply_migration(conn, 'merge_duplicate_products', merge_duplicate_products)
+    apply_migration(conn, 'money_to_minor_units', migrate_money_to_minor_units)
+    
+    from reports import rebuild_rollups
+    apply_migration(conn, 'build_report_rollups', rebuild_rollups)
+    apply_migration(conn, 'backfill_sync_versions', backfill_sync_versions)
+    apply_migration(conn, 'archive_aware_order_tombstones', drop_orders_sync_delete_trigger)
+    apply_migration(conn, 'foreign_key_cascades', migrate_foreign_key_cascades)
+    apply_migration(conn, 'order_item_name_snapshots', backfill_order_item_names)
+    apply_migration(conn, 'keep_deleted_sellers_products', migrate_foreign_key_cascades)
+    
     conn.executescript('''
         CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
         CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
@@ -72,30 +477,418 @@ def init_db():
         CREATE INDEX IF NOT EXISTS idx_products_created_by ON products(created_by);
         CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id);
         CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items(order_id);
-        CREATE INDEX IF NOT EXISTS idx_telegram_tokens_token ON telegram_link_tokens(token);
+        -- token уже уникален; привязка ищет среди действующих, очистка - по сроку
+        DROP INDEX IF EXISTS idx_telegram_tokens_token;
+        CREATE INDEX IF NOT EXISTS idx_telegram_tokens_active ON telegram_link_tokens(token, expires_at) WHERE is_used = 0;
+        CREATE INDEX IF NOT EXISTS idx_telegram_tokens_expires_at ON telegram_link_tokens(expires_at);
+        CREATE INDEX IF NOT EXISTS idx_stock_reservations_order_id ON stock_reservations(order_id, status);
+        -- Индексы дочерних колонок: каскадное удаление ищет строки по ним
+        CREATE INDEX IF NOT EXISTS idx_telegram_tokens_user_id ON telegram_link_tokens(user_id);
+        CREATE INDEX IF NOT EXISTS idx_cart_items_product_id ON cart_items(product_id);
+        CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
+        -- Каталог читает только живые товары: частичные индексы без удаленных
+        DROP INDEX IF EXISTS idx_products_owner_name_price;
+        CREATE INDEX IF NOT EXISTS idx_products_live_owner_name_price ON products(created_by, name, price) WHERE deleted_at IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_products_live_created ON products(created_at, id) WHERE deleted_at IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_products_live_owner_created ON products(created_by, created_at, id) WHERE deleted_at IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_change_events_created_at ON change_events(created_at);
+        CREATE INDEX IF NOT EXISTS idx_products_version ON products(version);
+        CREATE INDEX IF NOT EXISTS idx_orders_user_version ON orders(user_id, version);
+        CREATE INDEX IF NOT EXISTS idx_sync_tombstones_version ON sync_tombstones(version);
+        CREATE INDEX IF NOT EXISTS idx_orders_status_updated ON orders(status, updated_at);
+        CREATE INDEX IF NOT EXISTS idx_orders_archive_user_created ON orders_archive(user_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_order_items_archive_order_id ON order_items_archive(order_id);
+        CREATE INDEX IF NOT EXISTS idx_stock_reservations_archive_order_id ON stock_reservations_archive(order_id);
+        
+        -- Версии для /api/sync: любое изменение товара или заказа получает следующий номер
+        -- из sync_clock, удаление оставляет tombstone. Триггеры ловят и косвенные изменения
+        -- (списание остатков, пересчет суммы заказа), которые делаются из разных модулей.
+        CREATE TRIGGER IF NOT EXISTS products_sync_insert AFTER INSERT ON products
+        BEGIN
+            UPDATE sync_clock SET version = version + 1 WHERE id = 1;
+            UPDATE products SET version = (SELECT version FROM sync_clock WHERE id = 1), updated_at = CURRENT_TIMESTAMP
+            WHERE id = NEW.id;
+        END;
+        
+        CREATE TRIGGER IF NOT EXISTS products_sync_update AFTER UPDATE OF name, price, description, stock ON products
+        BEGIN
+            UPDATE sync_clock SET version = version + 1 WHERE id = 1;
+            UPDATE products SET version = (SELECT version FROM sync_clock WHERE id = 1), updated_at = CURRENT_TIMESTAMP
+            WHERE id = NEW.id;
+        END;
+        
+        CREATE TRIGGER IF NOT EXISTS products_sync_delete AFTER DELETE ON products
+        BEGIN
+            UPDATE sync_clock SET version = version + 1 WHERE id = 1;
+            INSERT INTO sync_tombstones (entity, entity_id, user_id, version)
+            VALUES ('product', OLD.id, NULL, (SELECT version FROM sync_clock WHERE id = 1));
+        END;
+        
+        -- Мягкое удаление для клиента - то же удаление
+        CREATE TRIGGER IF NOT EXISTS products_sync_soft_delete AFTER UPDATE OF deleted_at ON products
+        WHEN OLD.deleted_at IS NULL AND NEW.deleted_at IS NOT NULL
+        BEGIN
+            UPDATE sync_clock SET version = version + 1 WHERE id = 1;
+            INSERT INTO sync_tombstones (entity, entity_id, user_id, version)
+            VALUES ('product', OLD.id, NULL, (SELECT version FROM sync_clock WHERE id = 1));
+        END;
+        
+        CREATE TRIGGER IF NOT EXISTS orders_sync_insert AFTER INSERT ON orders
+        BEGIN
+            UPDATE sync_clock SET version = version + 1 WHERE id = 1;
+            UPDATE orders SET version = (SELECT version FROM sync_clock WHERE id = 1), updated_at = CURRENT_TIMESTAMP
+            WHERE id = NEW.id;
+        END;
+        
+        CREATE TRIGGER IF NOT EXISTS orders_sync_update AFTER UPDATE OF status, total_amount ON orders
+        BEGIN
+            UPDATE sync_clock SET version = version + 1 WHERE id = 1;
+            UPDATE orders SET version = (SELECT version FROM sync_clock WHERE id = 1), updated_at = CURRENT_TIMESTAMP
+            WHERE id = NEW.id;
+        END;
+        
+        -- Перенос в архив (строка уже есть в orders_archive) - не удаление для клиента
+        CREATE TRIGGER IF NOT EXISTS orders_sync_delete AFTER DELETE ON orders
+        WHEN NOT EXISTS (SELECT 1 FROM orders_archive WHERE id = OLD.id)
+        BEGIN
+            UPDATE sync_clock SET version = version + 1 WHERE id = 1;
+            INSERT INTO sync_tombstones (entity, entity_id, user_id, version)
+            VALUES ('order', OLD.id, OLD.user_id, (SELECT version FROM sync_clock WHERE id = 1));
+        END;
     ''')
     
     conn.commit()
     conn.close()
 
-def execute_query(query, params=(), fetch_one=False, fetch_all=False, lastrowid=False):
-    """Универсальная функция для выполнения SQL запросов"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def apply_migration(conn, name, migration):
+    """Однократно применяет миграцию данных и записывает ее в schema_migrations"""
+    if conn.execute('SELECT 1 FROM schema_migrations WHERE name = ?', (name,)).fetchone():
+        return False
     
     try:
-        cursor.execute(query, params)
+        migration(conn)
+        conn.execute('INSERT INTO schema_migrations (name) VALUES (?)', (name,))
         conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+def merge_duplicate_products(conn):
+    """Склеивает дубликаты товаров (владелец, название, цена, описание), созданные заказами из Telegram.
+
+    Строки order_items переназначаются на самый ранний товар группы. Товары с учетом
+    остатков не трогаются, чтобы не потерять складские данные. Товары с разными описаниями -
+    разные товары продавца, а не дубликаты; описание сравнивается через IS (NULL равен NULL).
+    """
+    conn.execute('''
+        CREATE TEMP TABLE product_merge AS
+        SELECT p.id AS old_id, k.keep_id
+        FROM products p
+        JOIN (
+            SELECT created_by, name, price, description, MIN(id) AS keep_id
+            FROM products
+            WHERE stock IS NULL
+            GROUP BY created_by, name, price, description
+            HAVING COUNT(*) > 1
+        ) k ON p.created_by = k.created_by AND p.name = k.name AND p.price = k.price
+            AND p.description IS k.description
+        WHERE p.stock IS NULL AND p.id != k.keep_id
+    ''')
+    
+    conn.execute('''
+        UPDATE order_items
+        SET product_id = (SELECT keep_id FROM product_merge WHERE old_id = order_items.product_id)
+        WHERE product_id IN (SELECT old_id FROM product_merge)
+    ''')
+    conn.execute('DELETE FROM products WHERE id IN (SELECT old_id FROM product_merge)')
+    conn.execute('DROP TABLE product_merge')
+
+def drop_orders_sync_delete_trigger(conn):
+    """Миграция: старый триггер удаления заказа пересоздается с условием про архив"""
+    conn.execute('DROP TRIGGER IF EXISTS orders_sync_delete')
+
+# Внешние ключи: колонка -> (родительская таблица, ON DELETE); None - ключа нет.
+# Товар удаленного продавца остается в чужих заказах: он удаляется мягко, а владелец обнуляется
+FOREIGN_KEY_ACTIONS = {
+    'products': {'created_by': ('users', 'SET NULL')},
+    'orders': {'user_id': ('users', 'CASCADE')},
+    'order_items': {'order_id': ('orders', 'CASCADE'), 'product_id': None},
+    'stock_reservations': {'order_id': ('orders', 'CASCADE'), 'product_id': None},
+    'telegram_link_tokens': {'user_id': ('users', 'CASCADE')},
+    'cart_items': {'user_id': ('users', 'CASCADE'), 'product_id': ('products', 'CASCADE')}
+}
+
+def rebuild_foreign_keys(conn, table, actions):
+    """Пересоздает таблицу с нужными ON DELETE - ALTER TABLE в SQLite внешние ключи не меняет"""
+    current = {row['from']: (row['table'], row['on_delete']) for row in conn.execute(f'PRAGMA foreign_key_list({table})')}
+    wanted = {column: foreign_key for column, foreign_key in actions.items() if foreign_key}
+    if current == wanted:
+        return False
+    
+    create_sql = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (table,)
+    ).fetchone()['sql']
+    
+    new_sql = re.sub(rf'^CREATE TABLE\s+"?{table}"?', f'CREATE TABLE {table}_new', create_sql, count=1)
+    # Старые ограничения убираются, нужные дописываются в конец определения таблицы
+    for column in actions:
+        new_sql = re.sub(rf',\s*FOREIGN KEY \({column}\) REFERENCES \w+ \(\w+\)(?: ON DELETE [A-Z ]+?)?(?=\s*[,)])', '', new_sql)
+    # SET NULL требует колонку без NOT NULL
+    for column, (_, action) in wanted.items():
+        if action == 'SET NULL':
+            new_sql = re.sub(rf'\b({column}\s+\w+)\s+NOT NULL\b', r'\1', new_sql)
+    clauses = ''.join(
+        f',\n            FOREIGN KEY ({column}) REFERENCES {parent} (id) ON DELETE {action}'
+        for column, (parent, action) in wanted.items()
+    )
+    new_sql = re.sub(r'\s*\)\s*$', lambda match: clauses + '\n        )', new_sql)
+    
+    # Внешние ключи раньше не проверялись: строки без родителя не переносятся
+    condition = ' AND '.join(
+        f'({column} IS NULL OR {column} IN (SELECT id FROM {parent}))' if action == 'SET NULL'
+        else f'{column} IN (SELECT id FROM {parent})'
+        for column, (parent, action) in wanted.items()
+    ) or '1 = 1'
+    column_names = ', '.join(row['name'] for row in conn.execute(f'PRAGMA table_info({table})'))
+    sequence = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone()
+    
+    conn.execute(new_sql)
+    conn.execute(f'INSERT INTO {table}_new ({column_names}) SELECT {column_names} FROM {table} WHERE {condition}')
+    conn.execute(f'DROP TABLE {table}')
+    conn.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+    
+    # Счетчик AUTOINCREMENT не должен откатиться: id удаленных и архивных заказов не выдаются повторно
+    if sequence is not None:
+        conn.execute('DELETE FROM sqlite_sequence WHERE name = ?', (table,))
+        conn.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, sequence['seq']))
+    return True
+
+def migrate_foreign_key_cascades(conn):
+    """Миграция: внешние ключи приводятся к FOREIGN_KEY_ACTIONS, сироты удаляются"""
+    # Порядок: сначала родители - их сироты уже отброшены, когда проверяются дочерние таблицы
+    changed = [rebuild_foreign_keys(conn, table, actions) for table, actions in FOREIGN_KEY_ACTIONS.items()]
+    if any(changed):
+        from reports import rebuild_rollups
+        rebuild_rollups(conn)
+
+def backfill_order_item_names(conn):
+    """Миграция: названия товаров в существующие строки заказов (и архива).
+
+    Строки товаров, удаленных до мягкого удаления, остаются без названия.
+    """
+    for table in ('order_items', 'order_items_archive'):
+        conn.execute(f'''
+            UPDATE {table} SET product_name = (SELECT name FROM products WHERE products.id = {table}.product_id)
+            WHERE product_name IS NULL
+        ''')
+
+def backfill_sync_versions(conn):
+    """Миграция: существующим товарам и заказам - версия 1, чтобы они попали в первую синхронизацию"""
+    for table in ('products', 'orders'):
+        conn.execute(f'UPDATE {table} SET version = 1, updated_at = COALESCE(updated_at, created_at)')
+    conn.execute('UPDATE sync_clock SET version = MAX(version, 1) WHERE id = 1')
+
+@contextmanager
+def snapshot(replica=False):
+    """Несколько чтений из одного согласованного снимка базы (отложенная транзакция в WAL)"""
+    with read_pool(replica).connection() as conn:
+        conn.execute('BEGIN')
+        try:
+            yield conn
+        finally:
+            conn.execute('COMMIT')
+
+@contextmanager
+def transaction():
+    """Атомарная транзакция: BEGIN IMMEDIATE сразу берет блокировку на запись"""
+    with write_lock():
+        conn = get_db_connection()
+        conn.isolation_level = None
+        
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            yield conn
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+class WriteJob:
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        # Журнал запросов и request_id вызывающего запроса видны и в потоке писателя
+        self.context = contextvars.copy_context()
+        self.future = Future()
+
+    def run(self, conn):
+        return self.context.run(self.fn, conn, *self.args)
+
+class GroupCommitWriter:
+    """Поток-писатель магазина: задания из очереди выполняются группами в одной транзакции.
+
+    Каждое задание - в своем SAVEPOINT: ошибка откатывает только его, остальные задания группы
+    фиксируются одним COMMIT (один fsync на группу вместо одного на заказ). Группа набирается
+    из уже ждущих заданий и тех, что пришли за batch_window секунд, но не больше batch_size.
+    """
+
+    def __init__(self, shop, batch_size, batch_window):
+        self.shop = shop
+        self.batch_size = max(batch_size, 1)
+        self.batch_window = batch_window
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f'db-writer-{shop}', daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args):
+        if threading.current_thread() is self._thread:
+            raise RuntimeError('write_transaction() called from a write job - use its conn instead')
+        job = WriteJob(fn, args)
+        self._jobs.put(job)
+        return job.future
+
+    def _collect(self):
+        batch = [self._jobs.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._jobs.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._jobs.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = get_db_connection(shop_database_path(self.shop))
+        conn.isolation_level = None
+        lock = write_lock(self.shop)
+        while True:
+            batch = self._collect()
+            while batch:
+                with lock:
+                    batch = self._commit_batch(conn, batch)
+
+    def _commit_batch(self, conn, batch):
+        """Выполняет группу; возвращает задания, которые нужно повторить в новой транзакции"""
+        done = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for index, job in enumerate(batch):
+                conn.execute('SAVEPOINT write_job')
+                try:
+                    result = job.run(conn)
+                except Exception as error:
+                    if not conn.in_transaction:
+                        # SQLite откатил всю транзакцию (например, диск заполнен) - выполненные
+                        # задания группы тоже потеряны, оставшиеся пойдут в новую транзакцию
+                        for finished, _ in done:
+                            finished.future.set_exception(error)
+                        job.future.set_exception(error)
+                        return batch[index + 1:]
+                    conn.execute('ROLLBACK TO write_job')
+                    conn.execute('RELEASE write_job')
+                    job.future.set_exception(error)
+                else:
+                    conn.execute('RELEASE write_job')
+                    done.append((job, result))
+            conn.execute('COMMIT')
+        except Exception as error:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_exception(error)
+            return []
         
+        # Результаты отдаются только после COMMIT - вызывающий код видит уже сохраненные данные
+        for job, result in done:
+            job.future.set_result(result)
+        return []
+
+_writers = {}
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+def writer():
+    """Поток-писатель текущего магазина; создается при первой записи в его базу"""
+    global _writer_pid
+    shop = current_shop()
+    with _writer_lock:
+        # После fork потоки писателей родителя в дочернем процессе не существуют
+        if _writer_pid != os.getpid():
+            _writers.clear()
+            _writer_pid = os.getpid()
+        if shop not in _writers:
+            _writers[shop] = GroupCommitWriter(shop, config.DB_WRITE_BATCH_SIZE, config.DB_WRITE_BATCH_WINDOW_MS / 1000)
+        return _writers[shop]
+
+def write_transaction(fn, *args):
+    """Выполняет fn(conn, *args) в потоке писателя и возвращает ее результат или пробрасывает ее исключение.
+
+    fn работает только через conn: внутри нельзя вызывать execute_query и transaction().
+    """
+    return writer().submit(fn, *args).result()
+
+def read_query(query, params=(), fetch_one=False, replica=False):
+    """SELECT через пул чтения"""
+    with read_pool(replica).connection() as conn:
+        cursor = conn.cursor()
+        started = time.perf_counter()
+        cursor.execute(query, params)
         if fetch_one:
             result = cursor.fetchone()
-        elif fetch_all:
-            result = cursor.fetchall()
-        elif lastrowid:
-            result = cursor.lastrowid
+            rows = 0 if result is None else 1
         else:
-            result = None
-            
+            result = cursor.fetchall()
+            rows = len(result)
+        record_query(conn, query, params, time.perf_counter() - started, rows)
+        return result
+
+def execute_query(query, params=(), fetch_one=False, fetch_all=False, lastrowid=False, replica=False):
+    """Универсальная функция для выполнения SQL запросов.
+
+    SELECT с выборкой строк идут в пул чтения (replica=True - в реплику, если она есть),
+    изменения данных - через поток писателя (write_transaction), остальное (PRAGMA, DDL) -
+    отдельным соединением: такие команды нельзя выполнять внутри групповой транзакции.
+    """
+    if (fetch_one or fetch_all) and _READ_QUERY.match(query):
+        return read_query(query, params, fetch_one, replica)
+    
+    if _DATA_CHANGE_QUERY.match(query):
+        return write_transaction(_execute_write, query, params, fetch_one, fetch_all, lastrowid)
+    
+    with write_lock():
+        return _execute_statement(query, params, fetch_one, fetch_all, lastrowid)
+
+def _fetch_result(cursor, fetch_one, fetch_all, lastrowid):
+    if fetch_one:
+        return cursor.fetchone()
+    if fetch_all:
+        return cursor.fetchall()
+    if lastrowid:
+        return cursor.lastrowid
+    return None
+
+def _execute_write(conn, query, params, fetch_one, fetch_all, lastrowid):
+    return _fetch_result(conn.execute(query, params), fetch_one, fetch_all, lastrowid)
+
+def _execute_statement(query, params, fetch_one, fetch_all, lastrowid):
+    conn = get_db_connection()
+    
+    try:
+        result = _fetch_result(conn.execute(query, params), fetch_one, fetch_all, lastrowid)
+        conn.commit()
         return result
     except Exception as e:
         conn.rollback()
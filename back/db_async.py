@@ -0,0 +1,22 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from config import get_config
+
+config = get_config()
+
+# sqlite3 - блокирующий драйвер: в асинхронном приложении каждый запрос к базе уходит
+# в отдельный пул потоков, а event loop продолжает обслуживать другие соединения.
+# Размер пула ограничивает число одновременных обращений к SQLite, остальные ждут в очереди.
+db_executor = ThreadPoolExecutor(max_workers=config.ASYNC_DB_THREADS, thread_name_prefix='sqlite')
+
+
+async def run_db(fn, *args, **kwargs):
+    """Выполняет синхронную функцию, работающую с базой, в пуле потоков.
+
+    Контекст копируется в поток, чтобы запросы попали в журнал текущего HTTP-запроса (query_log).
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, partial(context.run, fn, *args, **kwargs))
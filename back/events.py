@@ -0,0 +1,188 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from config import get_config
+from database import use_shop
+from db_async import run_db
+from money import money_fields
+from query_log import query_log_scope
+from repository import get_repository
+
+config = get_config()
+
+EVENTS_BATCH_SIZE = 100
+
+# Лента изменений: события пишутся в change_events в той же транзакции, что и сами данные,
+# поэтому клиент не увидит событие об изменении, которое откатилось.
+# user_id - получатель события, NULL - событие для всех (каталог товаров).
+
+
+def publish_event(conn, user_id, entity, entity_id, action, payload):
+    conn.execute(
+        'INSERT INTO change_events (user_id, entity, entity_id, action, payload) VALUES (?, ?, ?, ?, ?)',
+        (user_id, entity, entity_id, action, json.dumps(payload, ensure_ascii=False))
+    )
+
+
+def publish_order_event(conn, order_id, action, old_status=None):
+    """Событие по заказу для покупателя и всех продавцов товаров из заказа"""
+    order = conn.execute(
+        'SELECT o.*, COUNT(oi.id) AS items_count FROM orders o LEFT JOIN order_items oi ON oi.order_id = o.id WHERE o.id = ? GROUP BY o.id',
+        (order_id,)
+    ).fetchone()
+
+    payload = money_fields(order, 'total_amount')
+    payload['buyer_id'] = order['user_id']
+    if old_status is not None:
+        payload['old_status'] = old_status
+
+    recipients = conn.execute('''
+        SELECT user_id FROM orders WHERE id = ?
+        UNION
+        SELECT p.created_by FROM order_items oi JOIN products p ON p.id = oi.product_id
+        WHERE oi.order_id = ? AND p.created_by IS NOT NULL
+    ''', (order_id, order_id)).fetchall()
+
+    for recipient in recipients:
+        publish_event(conn, recipient['user_id'], 'order', order_id, action, payload)
+
+
+def publish_product_event(conn, product_id, action):
+    """Событие каталога: товар в том же виде, что и в /api/products/all"""
+    if action == 'deleted':
+        payload = {'id': product_id}
+    else:
+        product = conn.execute('''
+            SELECT p.*, u.email as owner_email
+            FROM products p
+            JOIN users u ON p.created_by = u.id
+            WHERE p.id = ?
+        ''', (product_id,)).fetchone()
+        payload = money_fields(product, 'price')
+
+    publish_event(conn, None, 'product', product_id, action, payload)
+
+
+def delete_user_events(conn, user_id):
+    conn.execute('DELETE FROM change_events WHERE user_id = ?', (user_id,))
+
+
+def event_to_dict(row):
+    return {
+        'id': row['id'],
+        'entity': row['entity'],
+        'entity_id': row['entity_id'],
+        'action': row['action'],
+        'user_id': row['user_id'],
+        'data': json.loads(row['payload']),
+        'created_at': row['created_at']
+    }
+
+
+def events_for_user(user_id, last_event_id, limit=EVENTS_BATCH_SIZE):
+    return get_repository().fetch_all('''
+        SELECT * FROM change_events
+        WHERE id > ? AND (user_id = ? OR user_id IS NULL)
+        ORDER BY id
+        LIMIT ?
+    ''', (last_event_id, user_id, limit))
+
+
+def oldest_event_id():
+    row = get_repository().fetch_one('SELECT MIN(id) AS id FROM change_events')
+    return row['id']
+
+
+def purge_old_events():
+    """Удаляет события старше срока хранения ленты (maintenance.py); возвращает их число"""
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=config.EVENTS_RETENTION_HOURS)
+    return get_repository().execute(
+        'DELETE FROM change_events WHERE created_at < ?',
+        (cutoff.strftime('%Y-%m-%d %H:%M:%S'),)
+    )
+
+
+def format_sse(event_id, event, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_events(shop, user_id, last_event_id):
+    """Асинхронный генератор SSE для asgi.py: отдает события после last_event_id, опрашивая ленту.
+
+    Опрос таблицы, а не очередь в памяти, - события видны из любого процесса. Между опросами
+    соединение ждет в event loop и не держит поток; запросы к базе идут через run_db.
+    Соединение закрывается через EVENTS_STREAM_TIMEOUT, браузер переподключится с Last-Event-ID.
+    """
+    yield f"retry: {config.EVENTS_RETRY_MS}\n\n"
+
+    with use_shop(shop):
+        oldest = await run_db(oldest_event_id)
+    if last_event_id and oldest is not None and last_event_id < oldest - 1:
+        # Часть событий уже удалена - клиент должен перечитать списки целиком
+        yield format_sse(last_event_id, 'reset', {'oldest_event_id': oldest})
+
+    started = time.monotonic()
+    last_sent = started
+
+    while time.monotonic() - started < config.EVENTS_STREAM_TIMEOUT:
+        # Каждый опрос - отдельный журнал запросов, иначе поток за 5 минут "превысит бюджет"
+        with use_shop(shop), query_log_scope('SSE poll'):
+            rows = await run_db(events_for_user, user_id, last_event_id)
+
+        for row in rows:
+            event = event_to_dict(row)
+            last_event_id = event['id']
+            yield format_sse(event['id'], event['entity'], event)
+
+        now = time.monotonic()
+        if rows:
+            last_sent = now
+        elif now - last_sent >= config.EVENTS_HEARTBEAT_INTERVAL:
+            yield ": ping\n\n"
+            last_sent = now
+
+        if len(rows) < EVENTS_BATCH_SIZE:
+            await asyncio.sleep(config.EVENTS_POLL_INTERVAL)
+
+
+def register_consumer(consumer):
+    """Создает курсор потребителя на конце ленты: старые события ему не нужны"""
+    # WHERE true обязателен: без него SQLite читает ON CONFLICT как часть SELECT
+    get_repository().execute('''
+        INSERT INTO event_cursors (consumer, last_event_id)
+        SELECT ?, COALESCE(MAX(id), 0) FROM change_events WHERE true
+        ON CONFLICT (consumer) DO NOTHING
+    ''', (consumer,))
+
+
+def consume_events(consumer, handler, limit=EVENTS_BATCH_SIZE):
+    """Передает handler новые события для потребителя consumer (например, уведомлений в Telegram).
+
+    Курсор сдвигается в той же транзакции, в которой читаются события, поэтому два процесса
+    не получат одну пачку дважды. Доставка at-most-once: ошибка handler не возвращает событие.
+    """
+    def take_batch(conn):
+        cursor = conn.execute(
+            'SELECT last_event_id FROM event_cursors WHERE consumer = ?',
+            (consumer,)
+        ).fetchone()['last_event_id']
+
+        rows = conn.execute(
+            'SELECT * FROM change_events WHERE id > ? ORDER BY id LIMIT ?',
+            (cursor, limit)
+        ).fetchall()
+
+        if rows:
+            conn.execute(
+                'UPDATE event_cursors SET last_event_id = ? WHERE consumer = ?',
+                (rows[-1]['id'], consumer)
+            )
+        return rows
+
+    rows = get_repository().write(take_batch)
+
+    for row in rows:
+        handler(event_to_dict(row))
+
+    return len(rows)
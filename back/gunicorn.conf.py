@@ -0,0 +1,68 @@
+"""Конфигурация gunicorn для backend.
+
+Запуск:          gunicorn -c gunicorn.conf.py wsgi:app
+Перезапуск:      kill -HUP $(cat gunicorn.pid) - новые воркеры стартуют до остановки старых,
+                 старые дорабатывают текущие запросы в пределах graceful_timeout.
+Новая версия:    kill -USR2 $(cat gunicorn.pid), затем kill -TERM старому мастеру
+                 (gunicorn.pid.oldbin). С preload_app код загружен в мастере, поэтому HUP
+                 перезапускает воркеры, но не перечитывает код - для этого нужен новый мастер.
+"""
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Prefork + потоки: процессы дают параллелизм по ядрам, потоки - по запросам, ждущим базу.
+# Каждый запрос занимает поток до конца, поэтому долгих соединений здесь нет: ленту SSE
+# /api/events отдает asgi.py, где ожидание не держит поток
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Приложение импортируется в мастере: init_db() и миграции выполняются один раз
+preload_app = True
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# Плавная ротация воркеров, чтобы утечки памяти не копились; jitter разносит перезапуски
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = 500
+
+pidfile = os.environ.get('GUNICORN_PIDFILE', 'gunicorn.pid')
+
+# /metrics: воркеры пишут метрики в общий каталог, любой воркер отдает сумму по всем.
+# Переменная должна быть задана до импорта приложения; свой каталог нужно очищать перед стартом.
+# При HUP конфиг перечитывается, но переменная уже задана - метрики не сбрасываются.
+if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='bobrshop-metrics-')
+# Запросы логирует само приложение (bobrshop.http, JSON через фоновый поток, с выборкой);
+# синхронный access log gunicorn включается явно: GUNICORN_ACCESSLOG=-
+accesslog = os.environ.get('GUNICORN_ACCESSLOG')
+errorlog = '-'
+
+
+def on_starting(server):
+    from config import print_config_banner
+    print_config_banner()
+
+
+def post_fork(server, worker):
+    # Соединения SQLite нельзя переносить через fork - каждый воркер открывает свои
+    from database import on_worker_start
+    on_worker_start()
+
+
+def child_exit(server, worker):
+    # Счетчик запросов в работе умершего воркера больше не учитывается
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    from database import on_worker_exit
+    from notifications import wait_for_notifications
+    wait_for_notifications()
+    on_worker_exit()
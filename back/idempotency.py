@@ -0,0 +1,132 @@
+import hashlib
+import json
+from datetime import datetime
+from functools import wraps
+from flask import request, make_response, Response
+from config import get_config
+from repository import get_repository
+
+config = get_config()
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def request_scope(path, user_id=None, data=None):
+    """Область действия ключа: маршрут + владелец запроса"""
+    if user_id is not None:
+        return f'{path}:user:{user_id}'
+
+    return f"{path}:tg:{(data or {}).get('telegram_id')}"
+
+
+def _claim_key(scope, key, request_hash):
+    """Пытается занять ключ. Возвращает None, если ключ новый или просрочен, иначе сохраненную запись.
+
+    Пока ответа нет, ключ живет только IDEMPOTENCY_LEASE: после падения процесса посреди запроса
+    повтор занимает его заново, а не получает 409 до конца IDEMPOTENCY_KEY_TTL.
+    """
+    now = datetime.now()
+    repo = get_repository()
+
+    # Живой занятый ключ не обновляется (rowcount 0) - без ошибки IntegrityError, своей у каждого драйвера
+    claimed = repo.execute('''
+        INSERT INTO idempotency_keys (scope, idem_key, request_hash, expires_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT (scope, idem_key) DO UPDATE SET
+            request_hash = excluded.request_hash,
+            status_code = NULL,
+            response_body = NULL,
+            created_at = CURRENT_TIMESTAMP,
+            expires_at = excluded.expires_at
+        WHERE idempotency_keys.expires_at <= ?
+    ''', (scope, key, request_hash, now + config.IDEMPOTENCY_LEASE, now))
+    if claimed:
+        return None
+
+    return repo.fetch_one('SELECT * FROM idempotency_keys WHERE scope = ? AND idem_key = ?', (scope, key))
+
+
+def _release_key(scope, key):
+    get_repository().execute(
+        'DELETE FROM idempotency_keys WHERE scope = ? AND idem_key = ?',
+        (scope, key)
+    )
+
+
+def begin_request(scope, key, body):
+    """Занимает ключ для запроса. None - запрос нужно выполнить, иначе готовый ответ
+    (статус, JSON-тело, повтор ли это сохраненного ответа)"""
+    if len(key) > 255:
+        return 400, json.dumps({'error': 'Idempotency-Key is too long'}), False
+
+    request_hash = hashlib.sha256(body).hexdigest()
+
+    stored = _claim_key(scope, key, request_hash)
+    if stored is None:
+        return None
+
+    if stored['request_hash'] != request_hash:
+        return 422, json.dumps({'error': 'Idempotency-Key was already used with a different request'}), False
+    if stored['status_code'] is None:
+        return 409, json.dumps({'error': 'Request with this Idempotency-Key is still in progress'}), False
+
+    return stored['status_code'], stored['response_body'], True
+
+
+def finish_request(scope, key, status_code, body):
+    """Сохраняет ответ под ключом. Остальные 4xx окончательны и повторяются как есть, а 409
+    (корзина устарела, не хватает остатков) и 5xx освобождают ключ: повтор выполняется заново"""
+    if status_code >= 500 or status_code == 409:
+        _release_key(scope, key)
+        return
+
+    get_repository().execute(
+        'UPDATE idempotency_keys SET status_code = ?, response_body = ?, expires_at = ? WHERE scope = ? AND idem_key = ?',
+        (status_code, body, datetime.now() + config.IDEMPOTENCY_KEY_TTL, scope, key)
+    )
+
+
+def abort_request(scope, key):
+    _release_key(scope, key)
+
+
+def idempotent(f):
+    """Декоратор: повтор запроса с тем же Idempotency-Key возвращает сохраненный ответ"""
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return f(*args, **kwargs)
+
+        scope = request_scope(
+            request.path,
+            getattr(request, 'user_id', None),
+            request.get_json(silent=True)
+        )
+
+        ready = begin_request(scope, key, request.get_data())
+        if ready is not None:
+            status_code, body, replayed = ready
+            response = Response(body, status=status_code, mimetype='application/json')
+            if replayed:
+                response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            abort_request(scope, key)
+            raise
+
+        finish_request(scope, key, response.status_code, response.get_data(as_text=True))
+        return response
+
+    return decorated_function
+
+
+def purge_expired_keys():
+    """Удаляет просроченные ключи идемпотентности - задача maintenance.py, не каждого запроса"""
+    return get_repository().execute(
+        'DELETE FROM idempotency_keys WHERE expires_at <= ?',
+        (datetime.now(),)
+    )
@@ -0,0 +1,118 @@
+from datetime import datetime
+
+from money import parse_price
+
+
+class InsufficientStockError(Exception):
+    """Недостаточно товара на складе для резервирования"""
+
+    def __init__(self, product_id, requested):
+        self.product_id = product_id
+        self.requested = requested
+        super().__init__(f'Insufficient stock for product {product_id}')
+
+
+class ProductNotFoundError(Exception):
+    """Позиция заказа ссылается на товар, которого нет в каталоге"""
+
+    def __init__(self, product_id):
+        self.product_id = product_id
+        super().__init__(f'Product with id {product_id} not found')
+
+
+def is_valid_qty(qty):
+    """Количество в заказе - целое больше нуля; bool - подкласс int, но не количество"""
+    return isinstance(qty, int) and not isinstance(qty, bool) and qty > 0
+
+
+def validate_order_item(item, qty_field='qty', allow_new=False, default_qty=None):
+    """Проверяет позицию заказа или корзины до записи; ValueError с текстом для ответа 400.
+
+    allow_new - вместо product_id позиция может описывать новый товар (product_name и price),
+    его цена переводится в копейки прямо в item. default_qty подставляется, если количества нет.
+    """
+    if not isinstance(item, dict):
+        raise ValueError('Each item must be an object')
+
+    if not item.get('product_id'):
+        if not allow_new:
+            raise ValueError('product_id required')
+        if not item.get('product_name') or item.get('price') is None:
+            raise ValueError('product_id or product_name and price required')
+        item['price'] = parse_price(item['price'])
+
+    item[qty_field] = item.get(qty_field, default_qty)
+    if not is_valid_qty(item[qty_field]):
+        raise ValueError(f'{qty_field} must be a positive integer')
+
+
+def reserve_stock(conn, order_id, product_id, qty):
+    """Атомарно списывает остаток и записывает резерв под заказ.
+
+    Товары с stock IS NULL не учитываются на складе и резервируются без ограничений.
+    Должна вызываться внутри transaction(), чтобы откат заказа вернул остатки.
+    """
+    if not is_valid_qty(qty):
+        # stock - ? с отрицательным количеством увеличил бы остаток
+        raise ValueError(f'Invalid quantity {qty!r} for product {product_id}')
+
+    cursor = conn.execute(
+        'UPDATE products SET stock = stock - ? WHERE id = ? AND stock IS NOT NULL AND stock >= ?',
+        (qty, product_id, qty)
+    )
+
+    if cursor.rowcount == 0:
+        product = conn.execute('SELECT stock FROM products WHERE id = ?', (product_id,)).fetchone()
+        if product is None or product['stock'] is not None:
+            raise InsufficientStockError(product_id, qty)
+        return False
+
+    conn.execute(
+        'INSERT INTO stock_reservations (order_id, product_id, qty) VALUES (?, ?, ?)',
+        (order_id, product_id, qty)
+    )
+    return True
+
+
+def release_order_stock(conn, order_id):
+    """Возвращает на склад все активные резервы заказа (отмена заказа)"""
+    conn.execute('''
+        UPDATE products
+        SET stock = stock + (
+            SELECT SUM(r.qty) FROM stock_reservations r
+            WHERE r.order_id = ? AND r.product_id = products.id AND r.status = 'active'
+        )
+        WHERE id IN (
+            SELECT product_id FROM stock_reservations
+            WHERE order_id = ? AND status = 'active'
+        )
+    ''', (order_id, order_id))
+
+    cursor = conn.execute(
+        "UPDATE stock_reservations SET status = 'released', released_at = ? WHERE order_id = ? AND status = 'active'",
+        (datetime.now(), order_id)
+    )
+    return cursor.rowcount
+
+
+def restore_order_reservations(conn, order_id):
+    """Повторно резервирует ранее освобожденные остатки (заказ вернули из отмены)"""
+    released = conn.execute(
+        "SELECT id, product_id, qty FROM stock_reservations WHERE order_id = ? AND status = 'released'",
+        (order_id,)
+    ).fetchall()
+
+    for reservation in released:
+        cursor = conn.execute(
+            'UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?',
+            (reservation['qty'], reservation['product_id'], reservation['qty'])
+        )
+        if cursor.rowcount == 0:
+            raise InsufficientStockError(reservation['product_id'], reservation['qty'])
+
+        conn.execute(
+            "UPDATE stock_reservations SET status = 'active', released_at = NULL WHERE id = ?",
+            (reservation['id'],)
+        )
+
+    return len(released)
@@ -0,0 +1,168 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from config import get_config
+
+config = get_config()
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# Логи пишутся в очередь, а в stdout их выводит фоновый поток: обработчик запроса не ждет
+# ни форматирования, ни записи. Очередь ограничена - при переполнении записи отбрасываются.
+
+_request_id = ContextVar('request_id', default=None)
+_VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Поля LogRecord, которые не нужно выводить как дополнительные поля события
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'request_id'}
+
+_handler = None
+_listener = None
+
+
+def new_request_id():
+    return uuid.uuid4().hex
+
+
+def set_request_id(value=None):
+    """Id запроса для логов: из заголовка X-Request-ID (от бота) или новый. Возвращает (id, токен)"""
+    request_id = value if value and _VALID_REQUEST_ID.match(value) else new_request_id()
+    return request_id, _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись; поля из extra= выводятся как есть"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Выполняется в потоке запроса: запоминает id запроса и отбрасывает часть частых событий"""
+
+    def __init__(self, sample_rates):
+        super().__init__()
+        self.sample_rates = sample_rates
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            rate = self.sample_rate(record.name)
+            if rate < 1 and random.random() >= rate:
+                return False
+
+        record.request_id = _request_id.get()
+        return True
+
+    def sample_rate(self, name):
+        while name:
+            if name in self.sample_rates:
+                return self.sample_rates[name]
+            name = name.rpartition('.')[0]
+        return 1
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """QueueHandler, который не форматирует запись в потоке запроса и не блокируется на полной очереди"""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Аргументы сообщения и исключение фиксируются сразу - к моменту вывода они могут измениться
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            BackgroundQueueHandler.dropped += 1
+
+
+def parse_mapping(value, cast):
+    """'bobrshop.db=WARNING,bobrshop.http=0.1' -> {'bobrshop.db': cast('WARNING'), ...}"""
+    result = {}
+    for part in filter(None, (part.strip() for part in value.split(','))):
+        name, _, setting = part.partition('=')
+        result[name.strip()] = cast(setting.strip())
+    return result
+
+
+def _start_listener():
+    global _listener
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    _handler.queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+    _listener = QueueListener(_handler.queue, output)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def setup_logging(levels=None):
+    """Настраивает логирование процесса (один раз); после fork фоновый поток запускается заново.
+
+    levels - уровни логгеров по умолчанию (у бота {'aiogram.event': 'WARNING'}), LOG_LEVELS их переопределяет.
+    """
+    global _handler
+
+    if _handler is not None:
+        return
+
+    _handler = BackgroundQueueHandler(None)
+    _handler.addFilter(ContextFilter(parse_mapping(config.LOG_SAMPLE_RATES, float)))
+    _start_listener()
+
+    root = logging.getLogger()
+    root.handlers = [_handler]
+    root.setLevel(config.LOG_LEVEL)
+    for name, level in {**(levels or {}), **parse_mapping(config.LOG_LEVELS, str.upper)}.items():
+        logging.getLogger(name).setLevel(level)
+
+    atexit.register(_stop_listener)
+    if hasattr(os, 'register_at_fork'):
+        # Потоки не переживают fork (воркеры gunicorn) - в дочернем процессе нужны своя очередь и поток
+        os.register_at_fork(after_in_child=_start_listener)
@@ -0,0 +1,334 @@
+"""Обслуживание базы SQLite: python maintenance.py <команда>
+
+    backup PATH              онлайн-копия базы через backup API
+    snapshot [--dir DIR]     копия с отметкой времени в DB_BACKUP_DIR, старые сверх --keep удаляются
+    optimize [--analyze]     PRAGMA optimize (с --analyze - полный ANALYZE)
+    vacuum                   PRAGMA incremental_vacuum шагами, пока есть свободные страницы
+    enable-incremental-vacuum  перевод старой базы в auto_vacuum=INCREMENTAL (полный VACUUM, блокирует запись)
+    status                   размер базы, WAL и свободные страницы (JSON)
+    sweep-tokens             удалить просроченные и использованные токены привязки Telegram
+    purge-idempotency        удалить просроченные ключи идемпотентности
+    purge-tombstones         удалить удаления для /api/sync старше SYNC_TOMBSTONE_RETENTION_DAYS
+    purge-events             удалить события ленты старше EVENTS_RETENTION_HOURS
+    resume-deletions         продолжить упавшие и брошенные задачи удаления аккаунтов
+    run [--interval 3600]    все задачи по расписанию: удаления, токены, ключи идемпотентности, tombstones,
+                             события, optimize, vacuum и snapshot (DB_BACKUP_DIR)
+
+--shop NAME перед командой ограничивает ее одним магазином, без него команда выполняется для базы
+каждого магазина по очереди (backup при нескольких магазинах требует --shop). Копии магазинов,
+кроме DEFAULT_SHOP, хранятся в подкаталогах DB_BACKUP_DIR с именем магазина.
+
+Копия делается шагами по DB_BACKUP_STEP_PAGES страниц с паузой DB_BACKUP_STEP_PAUSE_MS: в WAL читатель
+не мешает писателю, а между шагами проходят чекпойнты. Если базу изменили во время копирования,
+SQLite начинает копию заново - под постоянной записью увеличьте шаг (--pages -1 - за один шаг).
+Время задач попадает в /metrics, если процесс запущен с тем же PROMETHEUS_MULTIPROC_DIR, что и воркеры.
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+from config import get_config
+from database import current_shop, get_db_connection, init_db, shop_database_path, use_shop
+from logs import setup_logging
+from account_deletion import resume_deletion_jobs
+from events import purge_old_events
+from idempotency import purge_expired_keys
+from metrics import observe_maintenance
+from repository import get_repository
+from sync import purge_tombstones
+
+config = get_config()
+
+logger = logging.getLogger('bobrshop.maintenance')
+
+SNAPSHOT_PREFIX = 'bobrshop-'
+
+
+def database_stats(conn, path):
+    """Страницы базы, свободные страницы, режим auto_vacuum и размеры файлов"""
+    wal_path = f'{path}-wal'
+    return {
+        'page_size': conn.execute('PRAGMA page_size').fetchone()[0],
+        'page_count': conn.execute('PRAGMA page_count').fetchone()[0],
+        'freelist_count': conn.execute('PRAGMA freelist_count').fetchone()[0],
+        'auto_vacuum': conn.execute('PRAGMA auto_vacuum').fetchone()[0],
+        'file_bytes': os.path.getsize(path),
+        'wal_bytes': os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+    }
+
+
+def timed_task(task):
+    """Декоратор: время задачи - в лог и в метрику db_maintenance_duration_seconds"""
+    def decorator(fn):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = fn(*args, **kwargs)
+            duration = time.perf_counter() - started
+            observe_maintenance(task, duration)
+            logger.info('maintenance task finished', extra={
+                'task': task,
+                'shop': current_shop(),
+                'duration_ms': round(duration * 1000, 1),
+                'result': result
+            })
+            return result
+        return wrapper
+    return decorator
+
+
+@timed_task('backup')
+def backup_database(target_path, pages=None, pause_ms=None):
+    """Копирует базу в target_path: во временный файл, проверка, атомарная подмена"""
+    pages = config.DB_BACKUP_STEP_PAGES if pages is None else pages
+    pause_ms = config.DB_BACKUP_STEP_PAUSE_MS if pause_ms is None else pause_ms
+    tmp_path = f'{target_path}.tmp'
+    steps = [0]
+
+    # sleep= у backup() действует только при занятой базе, пауза между шагами - в progress
+    def progress(status, remaining, total):
+        steps[0] += 1
+        if remaining and pause_ms:
+            time.sleep(pause_ms / 1000)
+
+    source = get_db_connection()
+    target = sqlite3.connect(tmp_path)
+    try:
+        source.backup(target, pages=pages, progress=progress)
+        target.execute('PRAGMA journal_mode=DELETE')
+        check = target.execute('PRAGMA quick_check').fetchone()[0]
+        if check != 'ok':
+            raise sqlite3.DatabaseError(f'backup check failed: {check}')
+    except Exception:
+        target.close()
+        os.remove(tmp_path)
+        raise
+    finally:
+        source.close()
+    target.close()
+
+    os.replace(tmp_path, target_path)
+    return {'path': target_path, 'steps': steps[0], 'bytes': os.path.getsize(target_path)}
+
+
+def snapshot_database(directory=None, keep=None):
+    """Копия с отметкой времени; в каталоге остаются keep последних копий"""
+    directory = directory or config.DB_BACKUP_DIR
+    if current_shop() != config.DEFAULT_SHOP:
+        directory = os.path.join(directory, current_shop())
+    keep = config.DB_BACKUP_KEEP if keep is None else keep
+    os.makedirs(directory, exist_ok=True)
+
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    result = backup_database(os.path.join(directory, f'{SNAPSHOT_PREFIX}{stamp}.db'))
+
+    # Имена с отметкой времени сортируются по времени
+    snapshots = sorted(glob.glob(os.path.join(directory, f'{SNAPSHOT_PREFIX}*.db')))
+    for old_path in snapshots[:max(len(snapshots) - keep, 0)]:
+        os.remove(old_path)
+    return result
+
+
+@timed_task('optimize')
+def optimize_database(analyze=False):
+    """PRAGMA optimize пересчитывает статистику только там, где она устарела; ANALYZE - везде"""
+    conn = get_db_connection()
+    try:
+        conn.execute('ANALYZE' if analyze else 'PRAGMA optimize')
+        conn.commit()
+    finally:
+        conn.close()
+    return {'analyze': analyze}
+
+
+@timed_task('vacuum')
+def incremental_vacuum(step_pages=None, pause_ms=None):
+    """Возвращает свободные страницы файлу шагами по step_pages; каждый шаг - короткая запись"""
+    step_pages = step_pages or config.DB_VACUUM_STEP_PAGES
+    pause_ms = config.DB_VACUUM_STEP_PAUSE_MS if pause_ms is None else pause_ms
+
+    conn = get_db_connection()
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            logger.warning('incremental vacuum is off, run enable-incremental-vacuum')
+            return {'freed_pages': 0}
+
+        freed = 0
+        while True:
+            free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if not free_pages:
+                break
+            # execute() делает один шаг запроса и освободил бы одну страницу; executescript - весь
+            conn.executescript(f'PRAGMA incremental_vacuum({min(free_pages, step_pages)})')
+            freed += free_pages - conn.execute('PRAGMA freelist_count').fetchone()[0]
+            time.sleep(pause_ms / 1000)
+        # Место в файле освобождает чекпойнт WAL
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
+    return {'freed_pages': freed}
+
+
+@timed_task('sweep_tokens')
+def sweep_link_tokens(batch_size=None, pause_ms=None):
+    """Удаляет токены привязки пачками - короткие записи не задерживают заказы"""
+    batch_size = batch_size or config.LINK_TOKEN_SWEEP_BATCH_SIZE
+    pause_ms = config.DB_VACUUM_STEP_PAUSE_MS if pause_ms is None else pause_ms
+
+    repo = get_repository()
+    now = datetime.now()
+    deleted = 0
+    while True:
+        batch = repo.delete_expired_link_tokens(now, batch_size)
+        deleted += batch
+        if batch < batch_size:
+            break
+        time.sleep(pause_ms / 1000)
+    return {'deleted': deleted}
+
+
+@timed_task('purge_idempotency')
+def purge_idempotency_keys():
+    return {'deleted': purge_expired_keys()}
+
+
+@timed_task('purge_tombstones')
+def purge_sync_tombstones():
+    return {'deleted': purge_tombstones()}
+
+
+@timed_task('purge_events')
+def purge_change_events():
+    return {'deleted': purge_old_events()}
+
+
+@timed_task('resume_deletions')
+def resume_account_deletions():
+    return {'finished': resume_deletion_jobs()}
+
+
+@timed_task('enable_incremental_vacuum')
+def enable_incremental_vacuum():
+    """auto_vacuum меняется у базы с таблицами только полным VACUUM - он блокирует запись на все время"""
+    conn = get_db_connection()
+    try:
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('VACUUM')
+        return {'auto_vacuum': conn.execute('PRAGMA auto_vacuum').fetchone()[0]}
+    finally:
+        conn.close()
+
+
+def run_scheduled(interval, backup_dir, shops):
+    while True:
+        for shop in shops:
+            with use_shop(shop):
+                run_shop_tasks(backup_dir)
+        time.sleep(interval)
+
+
+def run_shop_tasks(backup_dir):
+    for task in (resume_account_deletions, sweep_link_tokens, purge_idempotency_keys, purge_sync_tombstones,
+                 purge_change_events, optimize_database, incremental_vacuum):
+        try:
+            task()
+        except Exception:
+            # Задача повторится на следующем проходе
+            logger.exception('maintenance task failed', extra={'shop': current_shop()})
+    if backup_dir:
+        try:
+            snapshot_database(backup_dir)
+        except (sqlite3.Error, OSError):
+            logger.exception('snapshot failed', extra={'shop': current_shop()})
+
+
+def run_command(args):
+    if args.command == 'backup':
+        backup_database(args.path, args.pages)
+    elif args.command == 'snapshot':
+        snapshot_database(args.dir, args.keep)
+    elif args.command == 'optimize':
+        optimize_database(args.analyze)
+    elif args.command == 'vacuum':
+        incremental_vacuum(args.step_pages)
+    elif args.command == 'sweep-tokens':
+        sweep_link_tokens(args.batch_size)
+    elif args.command == 'purge-idempotency':
+        purge_idempotency_keys()
+    elif args.command == 'purge-tombstones':
+        purge_sync_tombstones()
+    elif args.command == 'purge-events':
+        purge_change_events()
+    elif args.command == 'resume-deletions':
+        resume_account_deletions()
+    elif args.command == 'enable-incremental-vacuum':
+        enable_incremental_vacuum()
+    elif args.command == 'status':
+        conn = get_db_connection()
+        try:
+            return database_stats(conn, shop_database_path())
+        finally:
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Обслуживание базы SQLite')
+    parser.add_argument('--shop', choices=config.SHOPS, help='магазин (по умолчанию - все)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    backup = commands.add_parser('backup', help='онлайн-копия базы')
+    backup.add_argument('path')
+    backup.add_argument('--pages', type=int, default=config.DB_BACKUP_STEP_PAGES, help='страниц за шаг, -1 - все')
+
+    snapshot = commands.add_parser('snapshot', help='копия с отметкой времени')
+    snapshot.add_argument('--dir', default=config.DB_BACKUP_DIR)
+    snapshot.add_argument('--keep', type=int, default=config.DB_BACKUP_KEEP, help='сколько копий хранить')
+
+    optimize = commands.add_parser('optimize', help='обновить статистику планировщика')
+    optimize.add_argument('--analyze', action='store_true', help='полный ANALYZE')
+
+    vacuum = commands.add_parser('vacuum', help='вернуть свободные страницы')
+    vacuum.add_argument('--step-pages', type=int, default=config.DB_VACUUM_STEP_PAGES)
+
+    sweep = commands.add_parser('sweep-tokens', help='удалить просроченные токены привязки')
+    sweep.add_argument('--batch-size', type=int, default=config.LINK_TOKEN_SWEEP_BATCH_SIZE)
+
+    commands.add_parser('purge-idempotency', help='удалить просроченные ключи идемпотентности')
+    commands.add_parser('purge-tombstones', help='удалить старые удаления для /api/sync')
+    commands.add_parser('purge-events', help='удалить старые события ленты')
+    commands.add_parser('resume-deletions', help='продолжить задачи удаления аккаунтов')
+    commands.add_parser('enable-incremental-vacuum', help='перевести базу в auto_vacuum=INCREMENTAL')
+    commands.add_parser('status', help='размер базы и свободные страницы')
+
+    run = commands.add_parser('run', help='задачи по расписанию')
+    run.add_argument('--interval', type=float, default=3600, help='секунд между проходами')
+    run.add_argument('--backup-dir', default=config.DB_BACKUP_DIR)
+
+    args = parser.parse_args()
+    if args.command == 'snapshot' and not args.dir:
+        parser.error('DB_BACKUP_DIR не задан')
+    shops = [args.shop] if args.shop else config.SHOPS
+    if args.command == 'backup' and len(shops) > 1:
+        parser.error('магазинов несколько - укажите --shop')
+
+    setup_logging()
+    init_db()
+    get_repository().init_schema()
+
+    if args.command == 'run':
+        run_scheduled(args.interval, args.backup_dir, shops)
+        return
+
+    results = {}
+    for shop in shops:
+        with use_shop(shop):
+            results[shop] = run_command(args)
+    if args.command == 'status':
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import os
+import re
+import sqlite3
+import time
+from functools import lru_cache
+from prometheus_client import (
+    REGISTRY, CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+)
+from prometheus_client import multiprocess
+from prometheus_client.core import GaugeMetricFamily
+from config import get_config
+
+config = get_config()
+
+# Метрики для /metrics в текстовом формате Prometheus. Под gunicorn воркеры пишут значения
+# в общий каталог PROMETHEUS_MULTIPROC_DIR (см. gunicorn.conf.py), и любой воркер отдает
+# сумму по всем процессам; без него метрики живут в памяти процесса.
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'HTTP-запросы по маршруту и коду ответа',
+    ['method', 'route', 'status']
+)
+HTTP_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Время обработки HTTP-запроса',
+    ['method', 'route'], buckets=LATENCY_BUCKETS
+)
+HTTP_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'Запросы, которые обрабатываются прямо сейчас',
+    ['method', 'route'], multiprocess_mode='livesum'
+)
+DB_QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds', 'Время SQL-запроса по его отпечатку (литералы заменены на ?)',
+    ['query'], buckets=QUERY_BUCKETS
+)
+NOTIFICATION_LATENCY = Histogram(
+    'telegram_notification_duration_seconds', 'Время отправки уведомления в Telegram',
+    ['result'], buckets=LATENCY_BUCKETS
+)
+MAINTENANCE_DURATION = Histogram(
+    'db_maintenance_duration_seconds', 'Время задач обслуживания базы (maintenance.py)',
+    ['task'], buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def sql_fingerprint(sql):
+    """Форма запроса без литералов: одинаковые запросы с разными значениями дают одну метку"""
+    fingerprint = _STRING_LITERAL.sub('?', sql)
+    fingerprint = _NUMBER_LITERAL.sub('?', fingerprint)
+    fingerprint = _PLACEHOLDER_LIST.sub('(?...)', fingerprint)
+    return _WHITESPACE.sub(' ', fingerprint).strip()[:200]
+
+
+def observe_query(sql, seconds):
+    DB_QUERY_LATENCY.labels(sql_fingerprint(sql)).observe(seconds)
+
+
+def observe_notification(result, seconds):
+    NOTIFICATION_LATENCY.labels(result).observe(seconds)
+
+
+def observe_maintenance(task, seconds):
+    MAINTENANCE_DURATION.labels(task).observe(seconds)
+
+
+class DatabaseFileCollector:
+    """Размер файла базы, WAL и свободные страницы по магазинам - считаются при каждом опросе /metrics"""
+
+    def describe(self):
+        return self._families()
+
+    def collect(self):
+        # database импортирует query_log, а тот - metrics
+        from database import shop_database_path
+
+        families = self._families()
+        for shop in config.SHOPS:
+            self._collect_file(families, shop, shop_database_path(shop))
+        return families
+
+    def _collect_file(self, families, shop, path):
+        if not os.path.exists(path):
+            return
+
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=1)
+        try:
+            freelist_count = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        except sqlite3.Error:
+            return
+        finally:
+            conn.close()
+
+        wal_path = f'{path}-wal'
+        file_bytes, wal_bytes, free_bytes = families
+        file_bytes.add_metric([shop], os.path.getsize(path))
+        wal_bytes.add_metric([shop], os.path.getsize(wal_path) if os.path.exists(wal_path) else 0)
+        free_bytes.add_metric([shop], freelist_count * page_size)
+
+    def _families(self):
+        return [
+            GaugeMetricFamily('db_file_bytes', 'Размер файла базы SQLite', labels=['shop']),
+            GaugeMetricFamily('db_wal_bytes', 'Размер WAL-файла базы', labels=['shop']),
+            GaugeMetricFamily('db_free_bytes', 'Свободные страницы в файле базы (их возвращает vacuum)', labels=['shop'])
+        ]
+
+
+DATABASE_FILE_COLLECTOR = DatabaseFileCollector()
+REGISTRY.register(DATABASE_FILE_COLLECTOR)
+
+
+def request_started(method, route):
+    HTTP_IN_PROGRESS.labels(method, route).inc()
+    return time.perf_counter()
+
+
+def request_finished(method, route, status, started):
+    HTTP_IN_PROGRESS.labels(method, route).dec()
+    HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+    HTTP_REQUESTS.labels(method, route, str(status)).inc()
+
+
+def render_metrics():
+    """Тело и Content-Type ответа /metrics"""
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(DATABASE_FILE_COLLECTOR)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
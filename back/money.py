@@ -0,0 +1,116 @@
+import re
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Деньги хранятся в базе целыми копейками, в API - рублями
+MINOR_UNITS = 100
+
+
+def to_minor(value):
+    """Рубли (число или строка) -> целые копейки без ошибок округления float"""
+    try:
+        amount = Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    except (InvalidOperation, ValueError):
+        raise ValueError(f'Invalid money amount: {value!r}')
+    if not amount.is_finite():
+        raise ValueError(f'Invalid money amount: {value!r}')
+    return int(amount * MINOR_UNITS)
+
+
+def parse_price(value):
+    """Цена товара из запроса -> копейки; отрицательная цена - ошибка"""
+    price = to_minor(value)
+    if price < 0:
+        raise ValueError(f'Price must not be negative: {value!r}')
+    return price
+
+
+def from_minor(minor):
+    """Копейки -> рубли для JSON-ответов и сообщений"""
+    if minor is None:
+        return None
+    return minor / MINOR_UNITS
+
+
+def money_fields(row, *fields):
+    """Строка БД -> словарь с полями-суммами, переведенными в рубли"""
+    if row is None:
+        return None
+    result = dict(row)
+    for field in fields:
+        if field in result:
+            result[field] = from_minor(result[field])
+    return result
+
+
+def rebuild_money_columns(conn, table, columns):
+    """Пересоздает таблицу с INTEGER-колонками вместо REAL, переводя значения в копейки"""
+    column_types = {row['name']: row['type'] for row in conn.execute(f'PRAGMA table_info({table})')}
+    if all(column_types.get(column) == 'INTEGER' for column in columns):
+        return False
+
+    create_sql = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (table,)
+    ).fetchone()['sql']
+
+    new_sql = re.sub(rf'^CREATE TABLE\s+"?{table}"?', f'CREATE TABLE {table}_new', create_sql, count=1)
+    for column in columns:
+        new_sql = re.sub(rf'\b{column}\s+REAL\b', f'{column} INTEGER', new_sql)
+
+    column_names = list(column_types)
+    select_list = ', '.join(
+        f'CAST(ROUND({name} * {MINOR_UNITS}) AS INTEGER)' if name in columns else name
+        for name in column_names
+    )
+
+    conn.execute(new_sql)
+    conn.execute(f'INSERT INTO {table}_new ({", ".join(column_names)}) SELECT {select_list} FROM {table}')
+    conn.execute(f'DROP TABLE {table}')
+    conn.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+    return True
+
+
+def migrate_money_to_minor_units(conn):
+    """Миграция: products.price, orders.total_amount, order_items.price -> копейки"""
+    rebuild_money_columns(conn, 'products', ['price'])
+    rebuild_money_columns(conn, 'orders', ['total_amount'])
+    rebuild_money_columns(conn, 'order_items', ['price'])
+
+
+def update_order_total(conn, order_id):
+    """Пересчитывает сумму заказа по его строкам внутри текущей транзакции"""
+    conn.execute('''
+        UPDATE orders
+        SET total_amount = (
+            SELECT COALESCE(SUM(qty * price), 0) FROM order_items WHERE order_id = orders.id
+        )
+        WHERE id = ?
+    ''', (order_id,))
+    return conn.execute('SELECT total_amount FROM orders WHERE id = ?', (order_id,)).fetchone()['total_amount']
+
+
+def find_total_mismatches(conn):
+    """Сверяет orders.total_amount с суммой строк заказа по всей таблице за один проход"""
+    return conn.execute('''
+        SELECT o.id, o.total_amount, COALESCE(SUM(oi.qty * oi.price), 0) AS items_total
+        FROM orders o
+        LEFT JOIN order_items oi ON oi.order_id = o.id
+        GROUP BY o.id
+        HAVING o.total_amount != items_total
+    ''').fetchall()
+
+
+if __name__ == '__main__':
+    from config import get_config
+    from database import get_db_connection, shop_database_path
+
+    for shop in get_config().SHOPS:
+        conn = get_db_connection(shop_database_path(shop))
+        try:
+            mismatches = find_total_mismatches(conn)
+        finally:
+            conn.close()
+
+        for row in mismatches:
+            print(f"[{shop}] Заказ #{row['id']}: total_amount={from_minor(row['total_amount'])}, по строкам={from_minor(row['items_total'])}")
+        print(f"[{shop}] Расхождений: {len(mismatches)}")
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import wait
+import aiohttp
+from config import get_config
+from repository import get_repository
+from money import from_minor
+from metrics import observe_notification
+from logs import current_request_id, set_request_id
+
+config = get_config()
+
+TELEGRAM_NOTIFIER = 'telegram_notifier'
+
+logger = logging.getLogger('bobrshop.notifications')
+
+# Уведомления отправляются из фонового event loop процесса с одной общей HTTP-сессией:
+# обработчик запроса только ставит отправку в очередь и сразу возвращается.
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+_session = None
+_semaphore = None
+_pending = set()
+
+
+def _notification_loop():
+    """Фоновый event loop; после fork воркера создается заново - потоки через fork не переходят"""
+    global _loop, _loop_pid, _session, _semaphore
+
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            _session = None
+            _semaphore = None
+            _pending.clear()
+            threading.Thread(target=_loop.run_forever, name='telegram-notifications', daemon=True).start()
+        return _loop
+
+
+async def send_telegram_notification_async(telegram_id, message, request_id=None):
+    global _session, _semaphore
+
+    if request_id:
+        # Задача выполняется в фоновом loop со своим контекстом - id запроса передается явно
+        set_request_id(request_id)
+
+    try:
+        bot_token = os.getenv('BOT_TOKEN')
+        if not bot_token:
+            logger.warning('BOT_TOKEN is not configured, notification skipped')
+            return False
+
+        if _session is None:
+            _session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+            _semaphore = asyncio.Semaphore(config.NOTIFICATION_CONCURRENCY)
+
+        url = f"{config.TELEGRAM_API_URL}/bot{bot_token}/sendMessage"
+        payload = {
+            'chat_id': telegram_id,
+            'text': message,
+            'parse_mode': 'HTML'
+        }
+
+        async with _semaphore:
+            started = time.perf_counter()
+            try:
+                async with _session.post(url, json=payload) as response:
+                    if response.status == 200:
+                        duration = time.perf_counter() - started
+                        observe_notification('sent', duration)
+                        logger.info('notification sent', extra={
+                            'telegram_id': telegram_id,
+                            'duration_ms': round(duration * 1000, 1)
+                        })
+                        return True
+                    else:
+                        error_text = await response.text()
+                        observe_notification('rejected', time.perf_counter() - started)
+                        logger.warning('notification rejected', extra={
+                            'telegram_id': telegram_id,
+                            'status': response.status,
+                            'error': error_text[:500]
+                        })
+                        return False
+            except Exception:
+                observe_notification('failed', time.perf_counter() - started)
+                raise
+
+    except Exception as e:
+        logger.warning('notification failed', extra={'telegram_id': telegram_id, 'error': str(e)})
+        return False
+
+
+def send_telegram_notification(telegram_id, message):
+    """Ставит уведомление в очередь и не ждет ответа Telegram. Возвращает future"""
+    future = asyncio.run_coroutine_threadsafe(
+        send_telegram_notification_async(telegram_id, message, current_request_id()),
+        _notification_loop()
+    )
+    _pending.add(future)
+    future.add_done_callback(_pending.discard)
+    return future
+
+
+def wait_for_notifications(timeout=10):
+    """Дожидается отправки поставленных уведомлений (при остановке воркера)"""
+    if _pending:
+        wait(list(_pending), timeout=timeout)
+
+
+def notify_order_created(order_id, buyer_id, total_amount):
+    """Уведомляет покупателя и продавцов о новом заказе. Возвращает строки заказа"""
+    repo = get_repository()
+    order_lines = repo.order_lines_with_owners(order_id)
+    buyer = repo.get_user(buyer_id)
+
+    if buyer and buyer['telegram_id']:
+        items_text = "\n".join([f"   • {item['product_name']} - {item['qty']} шт." for item in order_lines[:3]])
+        if len(order_lines) > 3:
+            items_text += f"\n   • ... и еще {len(order_lines) - 3} товаров"
+
+        message = f"🎉 <b>Заказ #{order_id} создан!</b>\n\n📦 <b>Ваши товары:</b>\n{items_text}\n\n💰 <b>Общая сумма:</b> {from_minor(total_amount)} руб.\n\n🔄 Статус заказа можно отслеживать через /orders"
+        send_telegram_notification(buyer['telegram_id'], message)
+
+    product_owners = {}
+    for item in order_lines:
+        if item['owner_id'] not in product_owners:
+            product_owners[item['owner_id']] = {
+                'telegram_id': item['owner_telegram_id'],
+                'products': []
+            }
+        product_owners[item['owner_id']]['products'].append({
+            'name': item['product_name'],
+            'qty': item['qty'],
+            'price': item['price'],
+            'total': item['qty'] * item['price']
+        })
+
+    for owner_id, owner_info in product_owners.items():
+        if owner_info['telegram_id'] and owner_id != buyer_id:
+            products_text = "\n".join([f"   • {product['name']} - {product['qty']} шт. × {from_minor(product['price'])} руб. = {from_minor(product['total'])} руб." for product in owner_info['products']])
+
+            message = f"🛒 <b>Ваш товар купили!</b>\n\n📦 <b>Заказ #{order_id}</b>\n{products_text}\n\n💰 <b>Общая выручка:</b> {from_minor(sum(p['total'] for p in owner_info['products']))} руб."
+            send_telegram_notification(owner_info['telegram_id'], message)
+
+    return order_lines
+
+
+def notify_from_event(event):
+    """Уведомления в Telegram из ленты изменений: смена статуса заказа - покупателю"""
+    if event['entity'] != 'order' or event['action'] != 'status_changed':
+        return
+
+    order = event['data']
+    if event['user_id'] != order['buyer_id']:
+        return
+
+    buyer = get_repository().get_user(order['buyer_id'])
+
+    if buyer and buyer['telegram_id']:
+        status_emojis = {
+            'new': '🆕',
+            'in_progress': '🔄',
+            'completed': '✅',
+            'canceled': '❌'
+        }
+        emoji = status_emojis.get(order['status'], '📦')
+
+        message = f"📢 <b>Статус заказа обновлен!</b>\n\n🆔 Заказ #{order['id']}\n{emoji} Статус: <b>{order['status']}</b>\n\n📊 Предыдущий статус: {order.get('old_status')}"
+        send_telegram_notification(buyer['telegram_id'], message)
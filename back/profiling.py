@@ -0,0 +1,147 @@
+import cProfile
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from config import get_config
+
+config = get_config()
+
+logger = logging.getLogger('bobrshop.profiling')
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_FILE_HEADER = 'X-Profile-File'
+
+# Профилирование отдельных запросов в продакшене. Выключено по умолчанию; профилируются только
+# маршруты из PROFILING_ROUTES - по заголовку X-Profile с секретом PROFILING_TOKEN или
+# случайная доля PROFILING_SAMPLE_RATE. Профили пишутся в PROFILING_DIR, старые удаляются.
+#   cprofile - .prof (pstats): snakeviz, flameprof, gprof2dot
+#   sample   - .folded (свернутые стеки): flamegraph.pl, speedscope, inferno
+
+
+class CProfileSession:
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def write(self, path):
+        self.profiler.dump_stats(path)
+
+
+class StackSampler:
+    """Раз в interval снимает стек потока запроса из фонового потока - почти без накладных расходов"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            self.stacks[folded_stack(frame)] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as profile_file:
+            for stack, count in self.stacks.most_common():
+                profile_file.write(f'{stack} {count}\n')
+
+
+def folded_stack(frame):
+    """Стек в формате flamegraph: корень;...;вершина"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def route_allowed(route):
+    routes = {item.strip() for item in config.PROFILING_ROUTES.split(',') if item.strip()}
+    return '*' in routes or route in routes
+
+
+def profiling_requested(route, header_value):
+    if not config.PROFILING_ENABLED or not route_allowed(route):
+        return False
+
+    # Без PROFILING_TOKEN заголовок игнорируется - иначе профилирование мог бы включить кто угодно
+    if header_value and config.PROFILING_TOKEN and hmac.compare_digest(header_value, config.PROFILING_TOKEN):
+        return True
+
+    return random.random() < config.PROFILING_SAMPLE_RATE
+
+
+def profile_path(method, route, request_id, extension):
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{method}-{slug}-{request_id[:12]}.{extension}"
+    return os.path.join(config.PROFILING_DIR, name)
+
+
+def start_request_profile(method, route, header_value, request_id):
+    """Запускает профилировщик для текущего запроса, если он выбран. Возвращает (сессия, путь) или None"""
+    if not profiling_requested(route, header_value):
+        return None
+
+    if config.PROFILING_MODE == 'sample':
+        session = StackSampler(threading.get_ident(), config.PROFILING_INTERVAL_MS / 1000)
+        extension = 'folded'
+    else:
+        session = CProfileSession()
+        extension = 'prof'
+
+    try:
+        session.start()
+    except ValueError:
+        # В одном процессе одновременно может работать только один cProfile (Python 3.12+)
+        return None
+
+    return session, profile_path(method, route, request_id, extension)
+
+
+def finish_request_profile(profile):
+    session, path = profile
+    session.stop()
+    try:
+        os.makedirs(config.PROFILING_DIR, exist_ok=True)
+        session.write(path)
+        rotate_profiles()
+    except OSError as e:
+        logger.warning('profile not written', extra={'path': path, 'error': str(e)})
+
+
+def rotate_profiles():
+    """Оставляет в каталоге не больше PROFILING_MAX_FILES самых новых профилей"""
+    paths = [
+        os.path.join(config.PROFILING_DIR, name)
+        for name in os.listdir(config.PROFILING_DIR)
+        if name.endswith(('.prof', '.folded'))
+    ]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[config.PROFILING_MAX_FILES:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,119 @@
+import json
+import logging
+import sqlite3
+from contextlib import contextmanager
+from contextvars import ContextVar
+from config import get_config
+from metrics import sql_fingerprint, observe_query
+
+config = get_config()
+
+logger = logging.getLogger('bobrshop.db')
+
+# Журнал запросов к базе в рамках одного HTTP-запроса. ContextVar, а не threading.local:
+# в ASGI-приложении запросы к базе идут из пула потоков (run_db копирует контекст).
+_current_log = ContextVar('query_log', default=None)
+
+QUERY_LOG_MAX_ENTRIES = 1000
+
+
+class QueryBudgetError(RuntimeError):
+    """HTTP-запрос превысил бюджет запросов к базе или повторяет один и тот же запрос (N+1)"""
+
+
+def start_query_log(name):
+    """Начинает журнал запросов для HTTP-запроса name (маршрута). Возвращает токен для finish_query_log"""
+    return _current_log.set({
+        'name': name,
+        'count': 0,
+        'duration': 0.0,
+        'shapes': {},
+        'queries': []
+    })
+
+
+def finish_query_log(token):
+    """Закрывает журнал и возвращает его: число запросов, суммарное время и сами запросы"""
+    log = _current_log.get()
+    _current_log.reset(token)
+    return log
+
+
+@contextmanager
+def query_log_scope(name):
+    """Отдельный журнал для части долгого запроса (например, одного опроса в SSE-потоке)"""
+    token = start_query_log(name)
+    try:
+        yield
+    finally:
+        finish_query_log(token)
+
+
+def log_event(event, **fields):
+    logger.warning(event, extra=fields)
+
+
+def query_plan(conn, sql, params):
+    """EXPLAIN QUERY PLAN в том же соединении; базовый execute, чтобы сам план не попал в журнал"""
+    if not isinstance(conn, sqlite3.Connection):
+        # Серверная база (repository.DbApiRepository) - план смотрят ее средствами
+        return None
+    try:
+        rows = sqlite3.Connection.execute(conn, f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    except (sqlite3.Error, ValueError):
+        return None
+    return [row[3] for row in rows]
+
+
+def report_violation(log, event, **fields):
+    if config.QUERY_CHECK_MODE == 'off':
+        return
+
+    fields['request'] = log['name']
+    if config.QUERY_CHECK_MODE == 'raise':
+        raise QueryBudgetError(json.dumps({'event': event, **fields}, ensure_ascii=False))
+
+    log_event(event, **fields)
+
+
+def record_query(conn, sql, params, seconds, rows=None, many=False):
+    """Учитывает выполненный запрос: метрики, журнал медленных запросов, бюджет и повторы.
+
+    params для executemany - последовательность наборов параметров (many=True).
+    """
+    observe_query(sql, seconds)
+
+    shape = sql_fingerprint(sql)
+    params_count = len(params) if params is not None and not many else None
+    log = _current_log.get()
+
+    if seconds * 1000 >= config.QUERY_SLOW_MS:
+        log_event(
+            'slow_query',
+            request=log['name'] if log else None,
+            sql=shape,
+            params=params_count,
+            duration_ms=round(seconds * 1000, 2),
+            rows=rows,
+            plan=None if many else query_plan(conn, sql, params)
+        )
+
+    if log is None:
+        return
+
+    log['count'] += 1
+    log['duration'] += seconds
+    if len(log['queries']) < QUERY_LOG_MAX_ENTRIES:
+        log['queries'].append({
+            'sql': shape,
+            'params': params_count,
+            'duration_ms': round(seconds * 1000, 3),
+            'rows': rows
+        })
+
+    repeats = log['shapes'][shape] = log['shapes'].get(shape, 0) + 1
+    if repeats == config.QUERY_REPEAT_LIMIT:
+        report_violation(log, 'repeated_query', sql=shape, repeats=repeats)
+
+    if log['count'] == config.QUERY_BUDGET + 1:
+        report_violation(log, 'query_budget_exceeded', budget=config.QUERY_BUDGET)
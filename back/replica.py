@@ -0,0 +1,46 @@
+"""Обновление реплики для чтения: python replica.py [--interval 5]
+
+Раз в interval секунд копирует основную базу в DATABASE_REPLICA_PATH. Тяжелые чтения
+(каталог целиком, история заказов бота) идут в реплику и не мешают записи заказов.
+Реплику можно держать и на другом диске - читатели открывают ее только для чтения.
+У магазинов, кроме DEFAULT_SHOP, реплика рядом: app-replica.db -> app-replica_<магазин>.db.
+"""
+import argparse
+import logging
+import time
+from config import get_config
+from database import refresh_replica, use_shop
+from logs import setup_logging
+
+config = get_config()
+
+logger = logging.getLogger('bobrshop.replica')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Обновление реплики базы для чтения')
+    parser.add_argument('--interval', type=float, default=5, help='секунд между обновлениями')
+    parser.add_argument('--once', action='store_true', help='обновить один раз и выйти')
+    args = parser.parse_args()
+
+    if not config.DATABASE_REPLICA_PATH:
+        parser.error('DATABASE_REPLICA_PATH не задан')
+
+    setup_logging()
+
+    while True:
+        for shop in config.SHOPS:
+            started = time.perf_counter()
+            with use_shop(shop):
+                refresh_replica()
+            logger.info('replica refreshed', extra={
+                'shop': shop,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+            })
+        if args.once:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
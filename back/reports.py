@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta, timezone
+from repository import get_repository
+
+# Роллапы хранят вклад заказов в отчеты продавца по дням создания заказа.
+# Любое изменение заказа = вычесть его старый вклад, изменить, добавить новый.
+# Перенос в архив (archive.py) роллапы не меняет; пересчет и удаление учитывают обе пары таблиц.
+ORDER_TABLES = (('orders', 'order_items'), ('orders_archive', 'order_items_archive'))
+
+
+def _apply_orders(conn, condition, params, sign, orders='orders', items='order_items'):
+    """Добавляет (sign=1) или вычитает (sign=-1) вклад выбранных заказов в роллапы.
+
+    Товары удаленных продавцов (created_by IS NULL) в роллапы не попадают - их роллапы удалены вместе с аккаунтом.
+    """
+    condition = f'{condition} AND p.created_by IS NOT NULL'
+    conn.execute(f'''
+        INSERT INTO seller_daily_stats (seller_id, day, orders_count, items_qty, revenue)
+        SELECT p.created_by, date(o.created_at), ? * COUNT(DISTINCT o.id), ? * SUM(oi.qty), ? * SUM(oi.qty * oi.price)
+        FROM {orders} o
+        JOIN {items} oi ON oi.order_id = o.id
+        JOIN products p ON p.id = oi.product_id
+        WHERE {condition} AND o.status != 'canceled'
+        GROUP BY p.created_by, date(o.created_at)
+        ON CONFLICT (seller_id, day) DO UPDATE SET
+            orders_count = seller_daily_stats.orders_count + excluded.orders_count,
+            items_qty = seller_daily_stats.items_qty + excluded.items_qty,
+            revenue = seller_daily_stats.revenue + excluded.revenue
+    ''', (sign, sign, sign, *params))
+
+    conn.execute(f'''
+        INSERT INTO product_daily_stats (seller_id, product_id, day, qty, revenue)
+        SELECT p.created_by, oi.product_id, date(o.created_at), ? * SUM(oi.qty), ? * SUM(oi.qty * oi.price)
+        FROM {orders} o
+        JOIN {items} oi ON oi.order_id = o.id
+        JOIN products p ON p.id = oi.product_id
+        WHERE {condition} AND o.status != 'canceled'
+        GROUP BY p.created_by, oi.product_id, date(o.created_at)
+        ON CONFLICT (seller_id, product_id, day) DO UPDATE SET
+            qty = product_daily_stats.qty + excluded.qty,
+            revenue = product_daily_stats.revenue + excluded.revenue
+    ''', (sign, sign, *params))
+
+    conn.execute(f'''
+        INSERT INTO order_status_daily (seller_id, day, status, orders_count)
+        SELECT p.created_by, date(o.created_at), o.status, ? * COUNT(DISTINCT o.id)
+        FROM {orders} o
+        JOIN {items} oi ON oi.order_id = o.id
+        JOIN products p ON p.id = oi.product_id
+        WHERE {condition}
+        GROUP BY p.created_by, date(o.created_at), o.status
+        ON CONFLICT (seller_id, day, status) DO UPDATE SET
+            orders_count = order_status_daily.orders_count + excluded.orders_count
+    ''', (sign, *params))
+
+
+def add_order_to_rollups(conn, order_id):
+    """Учитывает заказ в роллапах (после создания или смены статуса)"""
+    _apply_orders(conn, 'o.id = ?', (order_id,), 1)
+
+
+def remove_order_from_rollups(conn, order_id):
+    """Вычитает текущий вклад заказа (перед сменой статуса)"""
+    _apply_orders(conn, 'o.id = ?', (order_id,), -1)
+
+
+def remove_orders_from_rollups(conn, order_ids, orders='orders', items='order_items'):
+    """Вычитает вклад пачки заказов (поэтапное удаление аккаунта)"""
+    placeholders = ', '.join('?' for _ in order_ids)
+    _apply_orders(conn, f'o.id IN ({placeholders})', order_ids, -1, orders, items)
+
+
+def remove_user_orders_from_rollups(conn, user_id):
+    """Вычитает вклад всех заказов покупателя (перед удалением аккаунта)"""
+    for orders, items in ORDER_TABLES:
+        _apply_orders(conn, 'o.user_id = ?', (user_id,), -1, orders, items)
+
+
+def remove_seller_rollups(conn, seller_id):
+    """Удаляет роллапы продавца (удаление аккаунта)"""
+    for table in ('seller_daily_stats', 'product_daily_stats', 'order_status_daily'):
+        conn.execute(f'DELETE FROM {table} WHERE seller_id = ?', (seller_id,))
+
+
+def rebuild_rollups(conn):
+    """Полностью пересчитывает роллапы по orders/order_items и архиву"""
+    conn.execute('DELETE FROM seller_daily_stats')
+    conn.execute('DELETE FROM product_daily_stats')
+    conn.execute('DELETE FROM order_status_daily')
+    for orders, items in ORDER_TABLES:
+        _apply_orders(conn, '1 = 1', (), 1, orders, items)
+
+
+def clamp_report_days(days):
+    """Период отчета: от 1 дня до года"""
+    return min(max(days, 1), 366)
+
+
+def report_start_day(days):
+    """Первый день отчета за последние days дней (UTC, как date(created_at))"""
+    return (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat()
+
+
+def seller_revenue(seller_id, days):
+    """Выручка продавца по дням за последние days дней"""
+    return get_repository().fetch_all('''
+        SELECT day, orders_count, items_qty, revenue
+        FROM seller_daily_stats
+        WHERE seller_id = ? AND day >= ?
+        ORDER BY day
+    ''', (seller_id, report_start_day(days)))
+
+
+def top_products(seller_id, days, limit):
+    """Самые продаваемые товары продавца за последние days дней"""
+    return get_repository().fetch_all('''
+        SELECT s.product_id, p.name AS product_name, SUM(s.qty) AS qty, SUM(s.revenue) AS revenue
+        FROM product_daily_stats s
+        LEFT JOIN products p ON p.id = s.product_id
+        WHERE s.seller_id = ? AND s.day >= ?
+        GROUP BY s.product_id, p.name
+        HAVING SUM(s.qty) > 0
+        ORDER BY revenue DESC, qty DESC
+        LIMIT ?
+    ''', (seller_id, report_start_day(days), limit))
+
+
+def status_funnel(seller_id, days):
+    """Распределение заказов с товарами продавца по статусам"""
+    rows = get_repository().fetch_all('''
+        SELECT status, SUM(orders_count) AS orders_count
+        FROM order_status_daily
+        WHERE seller_id = ? AND day >= ?
+        GROUP BY status
+    ''', (seller_id, report_start_day(days)))
+
+    funnel = {status: 0 for status in ('new', 'in_progress', 'completed', 'canceled')}
+    for row in rows:
+        funnel[row['status']] = row['orders_count']
+    return funnel
+
+
+if __name__ == '__main__':
+    import sys
+    from config import get_config
+    from database import init_db, use_shop
+
+    if sys.argv[1:] != ['rebuild']:
+        print('Использование: python reports.py rebuild')
+        sys.exit(1)
+
+    init_db()
+    for shop in get_config().SHOPS:
+        with use_shop(shop):
+            get_repository().write(rebuild_rollups)
+        print(f'✅ Роллапы отчетов пересчитаны: {shop}')
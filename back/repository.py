@@ -0,0 +1,492 @@
+import importlib
+import itertools
+import os
+import queue
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from config import get_config
+from database import execute_query, snapshot, write_transaction
+from query_log import record_query
+
+config = get_config()
+
+# Слой доступа к данным пользователей, товаров, заказов, строк заказов и токенов привязки.
+# SQL написан один раз с плейсхолдерами ? и без диалектных особенностей; подкласс отвечает
+# за соединения, транзакции и вставку с получением id:
+#   SQLiteRepository - основная база SQLite (пул чтения и поток-писатель из database.py)
+#   DbApiRepository  - серверная база через DB-API 2.0 драйвер (psycopg2 для PostgreSQL)
+# Методы с conn выполняются внутри repo.write(fn) вместе с событиями, остатками и роллапами.
+# Через repo идут все модули с данными магазина (корзина, идемпотентность, лента событий,
+# синхронизация, отчеты, бот), поэтому SQL в них тоже без диалектных функций SQLite.
+
+SERVER_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema_server.sql')
+
+# Товар удаляется мягко (deleted_at): строки заказов ссылаются на него и хранят название на момент
+# покупки, поэтому история заказов читается без JOIN с products. Каталог видит только LIVE_PRODUCT.
+LIVE_PRODUCT = 'p.deleted_at IS NULL'
+
+# Заказы и их строки: горячие таблицы и архив (archive.py) с флагом archived для истории
+ORDER_SOURCES = (('orders', 'order_items', 0), ('orders_archive', 'order_items_archive', 1))
+ORDER_COLUMNS = 'o.id, o.user_id, o.total_amount, o.status, o.created_at, o.updated_at, o.version'
+
+
+class Repository(ABC):
+    # Примитивы драйвера
+
+    @abstractmethod
+    def init_schema(self):
+        pass
+
+    @abstractmethod
+    def fetch_one(self, sql, params=(), replica=False):
+        pass
+
+    @abstractmethod
+    def fetch_all(self, sql, params=(), replica=False):
+        pass
+
+    @abstractmethod
+    def read(self, fn, *args, replica=False):
+        """Выполняет fn(conn, *args) - несколько чтений из одного согласованного снимка"""
+
+    @abstractmethod
+    def write(self, fn, *args):
+        """Выполняет fn(conn, *args) в одной транзакции и возвращает ее результат"""
+
+    @abstractmethod
+    def insert(self, conn, sql, params):
+        """INSERT внутри транзакции; возвращает id новой строки"""
+
+    def execute(self, sql, params=()):
+        """Одиночное изменение в своей транзакции"""
+        return self.write(lambda conn: conn.execute(sql, params).rowcount)
+
+    # Пользователи
+
+    def user_exists(self, email, username):
+        return self.fetch_one('SELECT id FROM users WHERE email = ? OR username = ?', (email, username)) is not None
+
+    def find_user_by_login(self, login):
+        return self.fetch_one('SELECT * FROM users WHERE email = ? OR username = ?', (login, login))
+
+    def is_active_user(self, user_id):
+        """Пользователь существует и не удаляется: задача удаления аккаунта стирает хеш пароля"""
+        return self.fetch_one("SELECT 1 FROM users WHERE id = ? AND password_hash != ''", (user_id,)) is not None
+
+    def get_user(self, user_id):
+        return self.fetch_one('SELECT * FROM users WHERE id = ?', (user_id,))
+
+    def get_telegram_user(self, telegram_id):
+        # telegram_id - TEXT; число от бота в серверной базе с текстом не сравнивается
+        return self.fetch_one('SELECT * FROM users WHERE telegram_id = ?', (str(telegram_id),))
+
+    def create_user(self, username, email, first_name, last_name, password_hash):
+        return self.write(lambda conn: self.insert(
+            conn,
+            'INSERT INTO users (username, email, first_name, last_name, password_hash) VALUES (?, ?, ?, ?, ?)',
+            (username, email, first_name, last_name, password_hash)
+        ))
+
+    def update_user(self, user_id, fields):
+        """fields - {колонка: значение}; колонки проверяет вызывающий код"""
+        assignments = ', '.join(f'{column} = ?' for column in fields)
+        self.execute(f'UPDATE users SET {assignments} WHERE id = ?', (*fields.values(), user_id))
+
+    def delete_user_rows(self, conn, user_id):
+        """Удаляет пользователя; заказы, резервы, корзину и токены удаляет ON DELETE CASCADE.
+
+        Товары к этому моменту уже удалены мягко и отвязаны (account_deletion.retire_products).
+        """
+        # У архива внешних ключей нет
+        orders = 'SELECT id FROM orders_archive WHERE user_id = ?'
+        conn.execute(f'DELETE FROM stock_reservations_archive WHERE order_id IN ({orders})', (user_id,))
+        conn.execute(f'DELETE FROM order_items_archive WHERE order_id IN ({orders})', (user_id,))
+        conn.execute('DELETE FROM orders_archive WHERE user_id = ?', (user_id,))
+        conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
+
+    # Товары
+
+    def get_product_with_owner(self, product_id):
+        return self.fetch_one(f'''
+            SELECT p.*, u.email as owner_email
+            FROM products p
+            JOIN users u ON p.created_by = u.id
+            WHERE p.id = ? AND {LIVE_PRODUCT}
+        ''', (product_id,))
+
+    def get_owned_product(self, product_id, owner_id):
+        return self.fetch_one(
+            f'SELECT * FROM products p WHERE p.id = ? AND p.created_by = ? AND {LIVE_PRODUCT}',
+            (product_id, owner_id)
+        )
+
+    def list_user_products(self, owner_id):
+        return self.fetch_all(
+            f'SELECT * FROM products p WHERE p.created_by = ? AND {LIVE_PRODUCT} ORDER BY p.created_at DESC, p.id DESC',
+            (owner_id,)
+        )
+
+    def list_all_products(self):
+        return self.fetch_all(f'''
+            SELECT p.*, u.email as owner_email
+            FROM products p
+            JOIN users u ON p.created_by = u.id
+            WHERE {LIVE_PRODUCT}
+            ORDER BY p.created_at DESC, p.id DESC
+        ''', replica=True)
+
+    def products_page(self, user_id, only_mine, limit, offset):
+        """Страница каталога и счетчики (всего / моих) одним запросом через оконные функции"""
+        return self.fetch_all(f'''
+            SELECT p.*, u.email as owner_email,
+                   COUNT(*) OVER () AS total_count,
+                   SUM(CASE WHEN p.created_by = ? THEN 1 ELSE 0 END) OVER () AS my_count
+            FROM products p
+            JOIN users u ON p.created_by = u.id
+            WHERE {LIVE_PRODUCT} {'AND p.created_by = ?' if only_mine else ''}
+            ORDER BY p.created_at DESC, p.id DESC
+            LIMIT ? OFFSET ?
+        ''', (user_id, *((user_id,) if only_mine else ()), limit, offset))
+
+    def insert_product(self, conn, owner_id, name, price, description, stock):
+        return self.insert(
+            conn,
+            'INSERT INTO products (name, price, description, stock, created_by) VALUES (?, ?, ?, ?, ?)',
+            (name, price, description, stock, owner_id)
+        )
+
+    def update_product(self, conn, product_id, owner_id, fields):
+        assignments = ', '.join(f'{column} = ?' for column in fields)
+        conn.execute(
+            f'UPDATE products SET {assignments} WHERE id = ? AND created_by = ?',
+            (*fields.values(), product_id, owner_id)
+        )
+
+    def delete_product(self, conn, product_id, owner_id):
+        """Мягкое удаление: товар пропадает из каталога и корзин, строки заказов на него остаются"""
+        conn.execute(
+            'UPDATE products SET deleted_at = CURRENT_TIMESTAMP WHERE id = ? AND created_by = ? AND deleted_at IS NULL',
+            (product_id, owner_id)
+        )
+        conn.execute('DELETE FROM cart_items WHERE product_id = ?', (product_id,))
+
+    # Заказы
+
+    def product_prices(self, conn, product_ids):
+        """{id: строка товара с названием и ценой} для живых товаров заказа одним запросом"""
+        placeholders = ', '.join('?' for _ in product_ids)
+        return {
+            product['id']: product
+            for product in conn.execute(
+                f'SELECT id, name, price FROM products p WHERE id IN ({placeholders}) AND {LIVE_PRODUCT}',
+                list(product_ids)
+            )
+        }
+
+    def insert_order(self, conn, user_id):
+        """Пустой заказ; сумму пересчитывает update_order_total после вставки строк"""
+        return self.insert(
+            conn,
+            'INSERT INTO orders (user_id, total_amount, status) VALUES (?, ?, ?)',
+            (user_id, 0, 'new')
+        )
+
+    def insert_order_items(self, conn, rows):
+        """rows - (order_id, product_id, qty, price, product_name)"""
+        conn.executemany(
+            'INSERT INTO order_items (order_id, product_id, qty, price, product_name) VALUES (?, ?, ?, ?, ?)',
+            rows
+        )
+
+    def set_order_status(self, conn, order_id, status):
+        conn.execute('UPDATE orders SET status = ? WHERE id = ?', (status, order_id))
+
+    def list_user_orders(self, user_id, include_archived=False):
+        """Заказы покупателя, новые первыми; include_archived - вместе с архивом"""
+        sources = ORDER_SOURCES if include_archived else ORDER_SOURCES[:1]
+        parts = [f'''
+            SELECT {ORDER_COLUMNS}, COUNT(oi.id) as items_count, {archived} as archived
+            FROM {orders} o
+            LEFT JOIN {items} oi ON o.id = oi.order_id
+            WHERE o.user_id = ?
+            GROUP BY o.id
+        ''' for orders, items, archived in sources]
+        return self.fetch_all(
+            f"SELECT * FROM ({' UNION ALL '.join(parts)}) history ORDER BY created_at DESC, id DESC",
+            (user_id,) * len(parts)
+        )
+
+    def get_order(self, order_id):
+        return self.fetch_one('SELECT * FROM orders WHERE id = ?', (order_id,))
+
+    def get_user_order(self, order_id, user_id, include_archived=False):
+        order = self.fetch_one('SELECT * FROM orders WHERE id = ? AND user_id = ?', (order_id, user_id))
+        if order is None and include_archived:
+            order = self.fetch_one('SELECT * FROM orders_archive WHERE id = ? AND user_id = ?', (order_id, user_id))
+        return order
+
+    def order_items_with_names(self, order_id, include_archived=False):
+        """Строки заказа с названиями на момент покупки; id заказов в архиве и горячей таблице не пересекаются"""
+        sources = ORDER_SOURCES if include_archived else ORDER_SOURCES[:1]
+        parts = [f'''
+            SELECT id, order_id, product_id, qty, price, product_name
+            FROM {items}
+            WHERE order_id = ?
+        ''' for _, items, _ in sources]
+        return self.fetch_all(f"SELECT * FROM ({' UNION ALL '.join(parts)}) lines ORDER BY id", (order_id,) * len(parts))
+
+    def order_lines_with_owners(self, order_id):
+        """Строки заказа с продавцами и их telegram_id - для уведомлений"""
+        return self.fetch_all('''
+            SELECT oi.qty, oi.price, oi.product_name, p.created_by AS owner_id, u.telegram_id AS owner_telegram_id
+            FROM order_items oi
+            JOIN products p ON oi.product_id = p.id
+            LEFT JOIN users u ON p.created_by = u.id
+            WHERE oi.order_id = ?
+            ORDER BY oi.id
+        ''', (order_id,))
+
+    # Токены привязки Telegram
+
+    def replace_link_token(self, user_id, token, expires_at):
+        """Новый токен привязки; старые токены пользователя удаляются в той же транзакции"""
+        def replace(conn):
+            conn.execute('DELETE FROM telegram_link_tokens WHERE user_id = ?', (user_id,))
+            conn.execute(
+                'INSERT INTO telegram_link_tokens (user_id, token, expires_at) VALUES (?, ?, ?)',
+                (user_id, token, expires_at)
+            )
+
+        self.write(replace)
+
+    def claim_link_token(self, token, telegram_id, now):
+        """Привязывает telegram_id к владельцу действующего токена; возвращает пользователя или None.
+
+        Токен забирает один условный UPDATE в транзакции записи: из одновременных /link с одним
+        токеном его получит только первый. Использованный токен сразу считается просроченным -
+        его удалит delete_expired_link_tokens.
+        """
+        def claim(conn):
+            claimed = conn.execute('''
+                UPDATE telegram_link_tokens SET is_used = 1, expires_at = ?
+                WHERE token = ? AND is_used = 0 AND expires_at > ?
+                RETURNING user_id
+            ''', (now, token, now)).fetchone()
+            if claimed is None:
+                return None
+            conn.execute('UPDATE users SET telegram_id = ? WHERE id = ?', (telegram_id, claimed['user_id']))
+            return conn.execute('SELECT * FROM users WHERE id = ?', (claimed['user_id'],)).fetchone()
+
+        return self.write(claim)
+
+    def delete_expired_link_tokens(self, now, limit):
+        """Удаляет до limit просроченных и использованных токенов; возвращает их число"""
+        return self.execute('''
+            DELETE FROM telegram_link_tokens
+            WHERE id IN (SELECT id FROM telegram_link_tokens WHERE expires_at <= ? LIMIT ?)
+        ''', (now, limit))
+
+
+class SQLiteRepository(Repository):
+    def init_schema(self):
+        # Схему и миграции SQLite выполняет init_db()
+        pass
+
+    def fetch_one(self, sql, params=(), replica=False):
+        return execute_query(sql, params, fetch_one=True, replica=replica)
+
+    def fetch_all(self, sql, params=(), replica=False):
+        return execute_query(sql, params, fetch_all=True, replica=replica)
+
+    def read(self, fn, *args, replica=False):
+        with snapshot(replica) as conn:
+            return fn(conn, *args)
+
+    def write(self, fn, *args):
+        return write_transaction(fn, *args)
+
+    def insert(self, conn, sql, params):
+        return conn.execute(sql, params).lastrowid
+
+
+@lru_cache(maxsize=512)
+def convert_placeholders(sql, paramstyle):
+    """? -> плейсхолдеры драйвера; ? внутри строковых литералов не трогаются"""
+    if paramstyle == 'qmark':
+        return sql
+
+    # format/pyformat (psycopg2, pymysql): %s, а литеральный % нужно удвоить; numeric/named: :1, :2, ...
+    percent_style = paramstyle in ('format', 'pyformat')
+    numbers = itertools.count(1)
+
+    def replace(match):
+        text = match.group(0)
+        if text == '?':
+            return '%s' if percent_style else f':{next(numbers)}'
+        return text.replace('%', '%%') if percent_style else text
+
+    return re.sub(r"'[^']*'|\?|%", replace, sql)
+
+
+def to_plain_value(value):
+    """Значения серверной базы в том же виде, что отдает SQLite (даты - строками)"""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        # SUM по BIGINT в PostgreSQL - numeric; в SQLite это целое число
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+class DbApiCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.rowcount = cursor.rowcount
+        self._columns = [column[0] for column in cursor.description] if cursor.description else None
+
+    def _row(self, values):
+        return {column: to_plain_value(value) for column, value in zip(self._columns, values)}
+
+    def fetchone(self):
+        values = self.cursor.fetchone()
+        return None if values is None else self._row(values)
+
+    def fetchall(self):
+        return [self._row(values) for values in self.cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+class DbApiConnection:
+    """Соединение DB-API с интерфейсом sqlite3: conn.execute(sql с ?, params) и строки-словари.
+
+    Через него в серверной базе работают и функции, принимающие conn (события, остатки, роллапы).
+    """
+
+    def __init__(self, raw, paramstyle):
+        self.raw = raw
+        self.paramstyle = paramstyle
+
+    def _params(self, params):
+        params = tuple(params or ())
+        if self.paramstyle == 'named':
+            return {str(index): value for index, value in enumerate(params, 1)}
+        return params
+
+    def execute(self, sql, params=()):
+        cursor = self.raw.cursor()
+        started = time.perf_counter()
+        cursor.execute(convert_placeholders(sql, self.paramstyle), self._params(params))
+        rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        record_query(self, sql, params, time.perf_counter() - started, rows)
+        return DbApiCursor(cursor)
+
+    def executemany(self, sql, seq_of_parameters):
+        cursor = self.raw.cursor()
+        started = time.perf_counter()
+        cursor.executemany(convert_placeholders(sql, self.paramstyle), [self._params(params) for params in seq_of_parameters])
+        record_query(self, sql, None, time.perf_counter() - started, cursor.rowcount, many=True)
+        return DbApiCursor(cursor)
+
+
+class DbApiRepository(Repository):
+    """Серверная база через модуль DB-API 2.0 (по умолчанию psycopg2); id новых строк - через RETURNING"""
+
+    def __init__(self, module_name, dsn, pool_size):
+        self.module = importlib.import_module(module_name)
+        self.dsn = dsn
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._pid = os.getpid()
+
+    @contextmanager
+    def connection(self):
+        if self._pid != os.getpid():
+            # После fork соединения родителя не используются
+            self._idle = queue.LifoQueue()
+            self._pid = os.getpid()
+
+        with self._slots:
+            try:
+                raw = self._idle.get_nowait()
+            except queue.Empty:
+                raw = self.module.connect(self.dsn)
+
+            try:
+                yield DbApiConnection(raw, self.module.paramstyle)
+            except Exception:
+                try:
+                    raw.rollback()
+                except self.module.Error:
+                    # Соединение оборвано - в пул не возвращается
+                    raw.close()
+                else:
+                    self._idle.put(raw)
+                raise
+            self._idle.put(raw)
+
+    def init_schema(self):
+        with open(SERVER_SCHEMA_PATH, encoding='utf-8') as schema_file:
+            schema = schema_file.read()
+
+        with self.connection() as conn:
+            conn.raw.cursor().execute(schema)
+            conn.raw.commit()
+
+    def _read(self, sql, params, fetch):
+        with self.connection() as conn:
+            cursor = conn.execute(sql, params)
+            result = cursor.fetchone() if fetch == 'one' else cursor.fetchall()
+            conn.raw.rollback()
+            return result
+
+    def fetch_one(self, sql, params=(), replica=False):
+        return self._read(sql, params, 'one')
+
+    def fetch_all(self, sql, params=(), replica=False):
+        return self._read(sql, params, 'all')
+
+    def read(self, fn, *args, replica=False):
+        with self.connection() as conn:
+            # В READ COMMITTED каждый запрос видит свой снимок, как без snapshot() в SQLite
+            conn.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            result = fn(conn, *args)
+            conn.raw.rollback()
+            return result
+
+    def write(self, fn, *args):
+        with self.connection() as conn:
+            result = fn(conn, *args)
+            conn.raw.commit()
+            return result
+
+    def insert(self, conn, sql, params):
+        return conn.execute(f'{sql} RETURNING id', params).fetchone()['id']
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_repository():
+    """Репозиторий процесса по DB_BACKEND: sqlite (по умолчанию) или dbapi (DATABASE_URL, DBAPI_MODULE)"""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            if config.DB_BACKEND == 'dbapi':
+                # Магазины - отдельные файлы SQLite; серверная база пока общая на все
+                if len(config.SHOPS) > 1:
+                    raise ValueError('DB_BACKEND=dbapi supports a single shop')
+                _repository = DbApiRepository(config.DBAPI_MODULE, config.DATABASE_URL, config.DB_SERVER_POOL_SIZE)
+            else:
+                _repository = SQLiteRepository()
+        return _repository
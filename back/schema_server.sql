@@ -0,0 +1,313 @@
+-- Схема серверной базы (PostgreSQL) для DB_BACKEND=dbapi: все данные магазина, которые читаются
+-- и пишутся через репозиторий (repository.py) - пользователи, товары, заказы, резервы остатков,
+-- корзины, ключи идемпотентности, лента событий, роллапы отчетов, версии синхронизации.
+-- Повторный запуск безопасен. Деньги - в копейках.
+-- Ссылки на пользователей и заказы - ON DELETE CASCADE, как в SQLite (database.py), кроме владельца товара:
+-- товар удаленного продавца остается в чужих заказах (ON DELETE SET NULL), product_id в строках заказов
+-- и резервах без внешнего ключа.
+-- Товар удаляется мягко (deleted_at), строка заказа хранит название товара на момент покупки.
+
+CREATE TABLE IF NOT EXISTS users (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    username TEXT UNIQUE NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    password_hash TEXT NOT NULL,
+    theme TEXT DEFAULT 'light',
+    telegram_id TEXT,
+    created_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS products (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    name TEXT NOT NULL,
+    price BIGINT NOT NULL,
+    description TEXT,
+    stock INTEGER,
+    created_by BIGINT REFERENCES users (id) ON DELETE SET NULL,
+    created_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP,
+    version BIGINT NOT NULL DEFAULT 0,
+    deleted_at TIMESTAMP(0)
+);
+
+CREATE TABLE IF NOT EXISTS orders (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    total_amount BIGINT NOT NULL,
+    status TEXT DEFAULT 'new',
+    created_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS order_items (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    order_id BIGINT NOT NULL REFERENCES orders (id) ON DELETE CASCADE,
+    product_id BIGINT NOT NULL,
+    qty INTEGER NOT NULL,
+    price BIGINT NOT NULL,
+    product_name TEXT
+);
+
+CREATE TABLE IF NOT EXISTS telegram_link_tokens (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    token TEXT UNIQUE NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    is_used INTEGER DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS stock_reservations (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    order_id BIGINT NOT NULL REFERENCES orders (id) ON DELETE CASCADE,
+    product_id BIGINT NOT NULL,
+    qty INTEGER NOT NULL,
+    status TEXT DEFAULT 'active',
+    created_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP,
+    released_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS cart_items (
+    user_id BIGINT NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    product_id BIGINT NOT NULL,
+    qty INTEGER NOT NULL,
+    added_price BIGINT NOT NULL,
+    added_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, product_id)
+);
+
+CREATE TABLE IF NOT EXISTS cart_custom_items (
+    user_id BIGINT NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    price BIGINT NOT NULL,
+    description TEXT,
+    qty INTEGER NOT NULL,
+    added_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, name, price)
+);
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    scope TEXT NOT NULL,
+    idem_key TEXT NOT NULL,
+    request_hash TEXT NOT NULL,
+    status_code INTEGER,
+    response_body TEXT,
+    created_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    UNIQUE (scope, idem_key)
+);
+
+CREATE TABLE IF NOT EXISTS seller_daily_stats (
+    seller_id BIGINT NOT NULL,
+    day DATE NOT NULL,
+    orders_count INTEGER NOT NULL DEFAULT 0,
+    items_qty INTEGER NOT NULL DEFAULT 0,
+    revenue BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (seller_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS product_daily_stats (
+    seller_id BIGINT NOT NULL,
+    product_id BIGINT NOT NULL,
+    day DATE NOT NULL,
+    qty INTEGER NOT NULL DEFAULT 0,
+    revenue BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (seller_id, product_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS order_status_daily (
+    seller_id BIGINT NOT NULL,
+    day DATE NOT NULL,
+    status TEXT NOT NULL,
+    orders_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (seller_id, day, status)
+);
+
+CREATE TABLE IF NOT EXISTS change_events (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    user_id BIGINT,
+    entity TEXT NOT NULL,
+    entity_id BIGINT NOT NULL,
+    action TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS event_cursors (
+    consumer TEXT PRIMARY KEY,
+    last_event_id BIGINT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sync_clock (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version BIGINT NOT NULL,
+    purged_version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO sync_clock (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS sync_tombstones (
+    entity TEXT NOT NULL,
+    entity_id BIGINT NOT NULL,
+    user_id BIGINT,
+    version BIGINT NOT NULL,
+    deleted_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Архив завершенных и отмененных заказов (archive.py)
+CREATE TABLE IF NOT EXISTS orders_archive (
+    id BIGINT PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    total_amount BIGINT NOT NULL,
+    status TEXT,
+    created_at TIMESTAMP(0),
+    updated_at TIMESTAMP(0),
+    version BIGINT NOT NULL DEFAULT 0,
+    archived_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS order_items_archive (
+    id BIGINT PRIMARY KEY,
+    order_id BIGINT NOT NULL,
+    product_id BIGINT NOT NULL,
+    qty INTEGER NOT NULL,
+    price BIGINT NOT NULL,
+    product_name TEXT
+);
+
+CREATE TABLE IF NOT EXISTS account_deletions (
+    user_id BIGINT PRIMARY KEY,
+    status TEXT NOT NULL,
+    total_rows INTEGER NOT NULL,
+    deleted_rows INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS stock_reservations_archive (
+    id BIGINT PRIMARY KEY,
+    order_id BIGINT NOT NULL,
+    product_id BIGINT NOT NULL,
+    qty INTEGER NOT NULL,
+    status TEXT,
+    created_at TIMESTAMP(0),
+    released_at TIMESTAMP
+);
+
+-- Базы, созданные до мягкого удаления: колонки и названия товаров в существующих строках заказов
+ALTER TABLE products ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP(0);
+ALTER TABLE order_items ADD COLUMN IF NOT EXISTS product_name TEXT;
+ALTER TABLE order_items_archive ADD COLUMN IF NOT EXISTS product_name TEXT;
+UPDATE order_items oi SET product_name = p.name FROM products p WHERE p.id = oi.product_id AND oi.product_name IS NULL;
+UPDATE order_items_archive oi SET product_name = p.name FROM products p WHERE p.id = oi.product_id AND oi.product_name IS NULL;
+
+-- Базы, созданные до ON DELETE CASCADE: внешние ключи без действия пересоздаются с каскадом
+DO $$
+DECLARE
+    fk RECORD;
+BEGIN
+    FOR fk IN
+        SELECT conrelid::regclass AS table_name, conname, pg_get_constraintdef(oid) AS definition
+        FROM pg_constraint
+        WHERE contype = 'f' AND confdeltype = 'a' AND connamespace = current_schema()::regnamespace
+    LOOP
+        EXECUTE format(
+            'ALTER TABLE %s DROP CONSTRAINT %I, ADD CONSTRAINT %I %s ON DELETE CASCADE',
+            fk.table_name, fk.conname, fk.conname, fk.definition
+        );
+    END LOOP;
+END
+$$;
+
+-- Базы, где товары удалялись вместе с продавцом: владелец товара обнуляется, а товар остается
+ALTER TABLE products ALTER COLUMN created_by DROP NOT NULL;
+DO $$
+DECLARE
+    fk RECORD;
+BEGIN
+    FOR fk IN
+        SELECT conname, pg_get_constraintdef(oid) AS definition
+        FROM pg_constraint
+        WHERE contype = 'f' AND confdeltype = 'c' AND conrelid = 'products'::regclass
+    LOOP
+        EXECUTE format(
+            'ALTER TABLE products DROP CONSTRAINT %I, ADD CONSTRAINT %I %s',
+            fk.conname, fk.conname, replace(fk.definition, 'ON DELETE CASCADE', 'ON DELETE SET NULL')
+        );
+    END LOOP;
+END
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_users_telegram_id ON users(telegram_id);
+CREATE INDEX IF NOT EXISTS idx_telegram_tokens_user_id ON telegram_link_tokens(user_id);
+CREATE INDEX IF NOT EXISTS idx_telegram_tokens_active ON telegram_link_tokens(token, expires_at) WHERE is_used = 0;
+CREATE INDEX IF NOT EXISTS idx_telegram_tokens_expires_at ON telegram_link_tokens(expires_at);
+CREATE INDEX IF NOT EXISTS idx_products_created_by ON products(created_by);
+CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id);
+CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items(order_id);
+CREATE INDEX IF NOT EXISTS idx_stock_reservations_order_id ON stock_reservations(order_id, status);
+DROP INDEX IF EXISTS idx_products_owner_name_price;
+CREATE INDEX IF NOT EXISTS idx_products_live_owner_name_price ON products(created_by, name, price) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_products_live_created ON products(created_at, id) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_products_live_owner_created ON products(created_by, created_at, id) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_change_events_created_at ON change_events(created_at);
+CREATE INDEX IF NOT EXISTS idx_cart_items_product_id ON cart_items(product_id);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
+CREATE INDEX IF NOT EXISTS idx_products_version ON products(version);
+CREATE INDEX IF NOT EXISTS idx_orders_user_version ON orders(user_id, version);
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_version ON sync_tombstones(version);
+CREATE INDEX IF NOT EXISTS idx_orders_status_updated ON orders(status, updated_at);
+CREATE INDEX IF NOT EXISTS idx_orders_archive_user_created ON orders_archive(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_order_items_archive_order_id ON order_items_archive(order_id);
+CREATE INDEX IF NOT EXISTS idx_stock_reservations_archive_order_id ON stock_reservations_archive(order_id);
+
+-- Версии для /api/sync - как триггеры SQLite в database.py: изменение товара или заказа
+-- получает следующий номер из sync_clock, удаление (и мягкое) оставляет tombstone (кроме переноса в архив)
+CREATE OR REPLACE FUNCTION sync_bump_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE sync_clock SET version = version + 1 WHERE id = 1 RETURNING version INTO NEW.version;
+    NEW.updated_at := CURRENT_TIMESTAMP;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION sync_tombstone() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'orders' AND EXISTS (SELECT 1 FROM orders_archive WHERE id = OLD.id) THEN
+        RETURN OLD;
+    END IF;
+    UPDATE sync_clock SET version = version + 1 WHERE id = 1;
+    INSERT INTO sync_tombstones (entity, entity_id, user_id, version)
+    VALUES (
+        TG_ARGV[0],
+        OLD.id,
+        (to_jsonb(OLD) ->> 'user_id')::BIGINT,
+        (SELECT version FROM sync_clock WHERE id = 1)
+    );
+    RETURN OLD;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_sync_upsert ON products;
+CREATE TRIGGER products_sync_upsert BEFORE INSERT OR UPDATE OF name, price, description, stock ON products
+    FOR EACH ROW EXECUTE FUNCTION sync_bump_version();
+
+DROP TRIGGER IF EXISTS products_sync_delete ON products;
+CREATE TRIGGER products_sync_delete AFTER DELETE ON products
+    FOR EACH ROW EXECUTE FUNCTION sync_tombstone('product');
+
+DROP TRIGGER IF EXISTS products_sync_soft_delete ON products;
+CREATE TRIGGER products_sync_soft_delete AFTER UPDATE OF deleted_at ON products
+    FOR EACH ROW WHEN (OLD.deleted_at IS NULL AND NEW.deleted_at IS NOT NULL)
+    EXECUTE FUNCTION sync_tombstone('product');
+
+DROP TRIGGER IF EXISTS orders_sync_upsert ON orders;
+CREATE TRIGGER orders_sync_upsert BEFORE INSERT OR UPDATE OF status, total_amount ON orders
+    FOR EACH ROW EXECUTE FUNCTION sync_bump_version();
+
+DROP TRIGGER IF EXISTS orders_sync_delete ON orders;
+CREATE TRIGGER orders_sync_delete AFTER DELETE ON orders
+    FOR EACH ROW EXECUTE FUNCTION sync_tombstone('order');
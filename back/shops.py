@@ -0,0 +1,95 @@
+import logging
+import re
+import sqlite3
+from config import get_config
+from database import read_pool_for
+
+config = get_config()
+
+logger = logging.getLogger('bobrshop.shops')
+
+# Маршрутизация запросов по магазинам. База выбирается до первого запроса к ней:
+#   веб - по claim shop в JWT (токен действует только в своем магазине), до входа - по заголовку X-Shop;
+#   бот - по справочнику telegram_id -> магазин (SHOP_DIRECTORY_PATH), /link - по префиксу кода привязки.
+# Пока магазин один, справочник не нужен и не читается.
+
+SHOP_HEADER = 'X-Shop'
+
+_SHOP_NAME = re.compile(r'^[a-z0-9_]{1,32}$')
+
+for _shop in config.SHOPS:
+    if not _SHOP_NAME.match(_shop):
+        raise ValueError(f'Invalid shop name {_shop!r}: use a-z, 0-9 and _')
+
+
+def is_known_shop(shop):
+    return shop in config.SHOPS
+
+
+def init_shop_directory():
+    conn = sqlite3.connect(config.SHOP_DIRECTORY_PATH, timeout=30)
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS telegram_shops (
+                telegram_id TEXT PRIMARY KEY,
+                shop TEXT NOT NULL,
+                linked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def shop_for_telegram(telegram_id):
+    """Магазин, к аккаунту которого привязан telegram_id; без записи - DEFAULT_SHOP"""
+    if len(config.SHOPS) == 1 or not telegram_id:
+        return config.DEFAULT_SHOP
+
+    with read_pool_for('shop_directory', config.SHOP_DIRECTORY_PATH).connection() as conn:
+        row = conn.execute('SELECT shop FROM telegram_shops WHERE telegram_id = ?', (str(telegram_id),)).fetchone()
+    # Магазин могли убрать из SHOPS - такие привязки не действуют
+    return row['shop'] if row and is_known_shop(row['shop']) else config.DEFAULT_SHOP
+
+
+def remember_telegram_shop(telegram_id, shop):
+    """Запоминает магазин после привязки; повторная привязка в другом магазине переносит бота туда"""
+    if len(config.SHOPS) == 1:
+        return
+
+    conn = sqlite3.connect(config.SHOP_DIRECTORY_PATH, timeout=30)
+    try:
+        conn.execute('''
+            INSERT INTO telegram_shops (telegram_id, shop) VALUES (?, ?)
+            ON CONFLICT (telegram_id) DO UPDATE SET shop = excluded.shop, linked_at = CURRENT_TIMESTAMP
+        ''', (str(telegram_id), shop))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def shop_link_token(token, shop):
+    """Код привязки с магазином в префиксе: бот один на все магазины и узнает магазин из кода"""
+    return token if shop == config.DEFAULT_SHOP else f'{shop}-{token}'
+
+
+def shop_for_link_token(token):
+    prefix, separator, _ = (token or '').rpartition('-')
+    return prefix if separator and is_known_shop(prefix) else config.DEFAULT_SHOP
+
+
+def bot_request_shop(telegram_id=None, link_token=None, shop=None):
+    """Магазин запроса бота: явный X-Shop, код привязки или справочник по telegram_id"""
+    if shop:
+        return shop
+    if link_token:
+        return shop_for_link_token(link_token)
+    return shop_for_telegram(telegram_id)
+
+
+def web_request_shop(token_payload=None, shop=None):
+    """Магазин запроса сайта: claim shop из действующего JWT, иначе X-Shop, иначе DEFAULT_SHOP"""
+    if token_payload:
+        return token_payload.get('shop', config.DEFAULT_SHOP)
+    return shop or config.DEFAULT_SHOP
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta, timezone
+from config import get_config
+from money import from_minor, money_fields
+from repository import get_repository
+
+config = get_config()
+
+# Версии товаров и заказов поддерживаются триггерами (см. init_db): клиент хранит
+# последнюю полученную версию и запрашивает только то, что изменилось после нее.
+
+
+def changes_since(user_id, since, own_products=False):
+    """Товары и заказы пользователя, измененные после версии since, и удаленные записи"""
+    def read_changes(conn, since):
+        clock = conn.execute('SELECT version, purged_version FROM sync_clock WHERE id = 1').fetchone()
+
+        # Tombstones до purged_version уже удалены (или клиент пришел с чужой версией) -
+        # инкрементально догнать нельзя, отдаем все заново
+        full_resync = since < clock['purged_version'] or since > clock['version']
+        if full_resync:
+            since = 0
+
+        products = conn.execute(f'''
+            SELECT p.*, u.email as owner_email
+            FROM products p
+            JOIN users u ON p.created_by = u.id
+            WHERE p.version > ? AND p.deleted_at IS NULL {'AND p.created_by = ?' if own_products else ''}
+            ORDER BY p.version
+        ''', (since, *((user_id,) if own_products else ()))).fetchall()
+
+        orders = conn.execute('''
+            SELECT * FROM orders
+            WHERE user_id = ? AND version > ?
+            ORDER BY version
+        ''', (user_id, since)).fetchall()
+
+        order_items = conn.execute('''
+            SELECT order_id, qty, price, product_name
+            FROM order_items
+            WHERE order_id IN (SELECT id FROM orders WHERE user_id = ? AND version > ?)
+            ORDER BY id
+        ''', (user_id, since)).fetchall()
+
+        tombstones = [] if full_resync else conn.execute('''
+            SELECT entity, entity_id FROM sync_tombstones
+            WHERE version > ? AND (user_id IS NULL OR user_id = ?)
+            ORDER BY version
+        ''', (since, user_id)).fetchall()
+
+        return clock, full_resync, products, orders, order_items, tombstones
+
+    clock, full_resync, products, orders, order_items, tombstones = get_repository().read(read_changes, since)
+
+    items_by_order = {}
+    for item in order_items:
+        items_by_order.setdefault(item['order_id'], []).append({
+            'product_name': item['product_name'],
+            'quantity': item['qty'],
+            'price': from_minor(item['price']),
+            'total': from_minor(item['qty'] * item['price'])
+        })
+
+    orders_list = []
+    for order in orders:
+        order_dict = money_fields(order, 'total_amount')
+        order_dict['items'] = items_by_order.get(order['id'], [])
+        order_dict['items_count'] = len(order_dict['items'])
+        orders_list.append(order_dict)
+
+    products_list = []
+    for product in products:
+        product_dict = money_fields(product, 'price')
+        product_dict['is_mine'] = product['created_by'] == user_id
+        products_list.append(product_dict)
+
+    return {
+        'version': clock['version'],
+        'full_resync': full_resync,
+        'products': products_list,
+        'orders': orders_list,
+        'deleted': {
+            'products': [row['entity_id'] for row in tombstones if row['entity'] == 'product'],
+            'orders': [row['entity_id'] for row in tombstones if row['entity'] == 'order']
+        }
+    }
+
+
+def purge_tombstones():
+    """Удаляет старые tombstones (maintenance.py); клиенты с версией до них получат полную синхронизацию"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=config.SYNC_TOMBSTONE_RETENTION_DAYS)
+
+    def purge(conn):
+        row = conn.execute(
+            'SELECT MAX(version) AS version FROM sync_tombstones WHERE deleted_at < ?',
+            (cutoff.strftime('%Y-%m-%d %H:%M:%S'),)
+        ).fetchone()
+
+        if row['version'] is None:
+            return 0
+
+        deleted = conn.execute('DELETE FROM sync_tombstones WHERE version <= ?', (row['version'],)).rowcount
+        conn.execute(
+            'UPDATE sync_clock SET purged_version = ? WHERE id = 1 AND purged_version < ?',
+            (row['version'], row['version'])
+        )
+        return deleted
+
+    return get_repository().write(purge)
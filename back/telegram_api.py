@@ -0,0 +1,336 @@
+import logging
+from datetime import datetime
+from database import current_shop
+from events import publish_order_event
+from inventory import InsufficientStockError, ProductNotFoundError, reserve_stock, validate_order_item
+from money import from_minor, money_fields, update_order_total
+from cart import get_cart, add_cart_item, add_custom_cart_item, clear_cart, cart_to_json, place_cart_order, find_or_create_product
+from notifications import send_telegram_notification
+from reports import add_order_to_rollups, seller_revenue, top_products, status_funnel, clamp_report_days
+from repository import get_repository
+from shops import remember_telegram_shop
+from sync import changes_since
+
+logger = logging.getLogger('bobrshop.telegram')
+
+# Эндпоинты бота без привязки к веб-фреймворку: принимают разобранные параметры и
+# возвращают (тело ответа, статус). Их вызывают и Flask (app.py), и ASGI-приложение (asgi.py).
+
+
+def get_telegram_user(telegram_id):
+    return get_repository().get_telegram_user(telegram_id)
+
+
+def resolve_user(telegram_id):
+    """Пользователь по telegram_id или (None, ответ с ошибкой)"""
+    if not telegram_id:
+        return None, ({'error': 'telegram_id required'}, 400)
+
+    user = get_telegram_user(telegram_id)
+    if not user:
+        return None, ({'error': 'User not found'}, 404)
+
+    return user, None
+
+
+def insert_telegram_order(conn, user_id, order_items):
+    """Задание потока-писателя: заказ из бота. Возвращает (order_id, total_amount).
+
+    Позиции - товары каталога (product_id) или новые товары пользователя (product_name и price).
+    """
+    repo = get_repository()
+    order_id = repo.insert_order(conn, user_id)
+
+    # Товары каталога - одним запросом, а не запросом на каждую позицию
+    product_ids = {item['product_id'] for item in order_items if item.get('product_id')}
+    catalog = repo.product_prices(conn, product_ids) if product_ids else {}
+
+    rows = []
+    for item in order_items:
+        if item.get('product_id'):
+            product = catalog.get(item['product_id'])
+
+            if not product:
+                raise ProductNotFoundError(item['product_id'])
+
+            product_id = product['id']
+            item['product_name'] = product['name']
+            item['price'] = product['price']
+            reserve_stock(conn, order_id, product_id, item['quantity'])
+        else:
+            product_id = find_or_create_product(
+                conn,
+                user_id,
+                item['product_name'],
+                item['price'],
+                item.get('description', f'Товар из заказа Telegram #{order_id}')
+            )
+
+        rows.append((order_id, product_id, item['quantity'], item['price'], item['product_name']))
+
+    repo.insert_order_items(conn, rows)
+
+    total_amount = update_order_total(conn, order_id)
+    add_order_to_rollups(conn, order_id)
+    publish_order_event(conn, order_id, 'created')
+    return order_id, total_amount
+
+
+def create_order(data):
+    try:
+        if not data or not data.get('telegram_id') or not data.get('items') or not isinstance(data['items'], list):
+            return {'error': 'telegram_id and items array required'}, 400
+
+        telegram_id = data['telegram_id']
+
+        user = get_telegram_user(telegram_id)
+
+        if not user:
+            return {'error': 'User not found'}, 404
+
+        user_id = user['id']
+        order_items = data['items']
+
+        # Поля позиций проверяются до записи: без quantity или product_name задание упало бы с KeyError,
+        # а дробное или строковое количество дошло бы до итогов заказа и сводок
+        try:
+            for item in order_items:
+                validate_order_item(item, 'quantity', allow_new=True)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        try:
+            order_id, total_amount = get_repository().write(insert_telegram_order, user_id, order_items)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        except InsufficientStockError as e:
+            return {'error': f'Not enough stock for product with id {e.product_id}'}, 409
+        except ProductNotFoundError as e:
+            return {'error': str(e)}, 404
+
+        logger.info('telegram order created', extra={
+            'order_id': order_id,
+            'user_id': user_id,
+            'items_count': len(order_items),
+            'total_amount': from_minor(total_amount)
+        })
+
+        order_details = get_repository().get_order(order_id)
+
+        if user['telegram_id']:
+            items_text = "\n".join([f"   • {item['product_name']} - {item['quantity']} шт. × {from_minor(item['price'])} руб." for item in order_items])
+
+            message = f"🎉 <b>Заказ #{order_id} создан!</b>\n\n📦 <b>Ваши товары:</b>\n{items_text}\n\n💰 <b>Общая сумма:</b> {from_minor(total_amount)} руб.\n\n🔄 Статус заказа можно отслеживать через /orders"
+            send_telegram_notification(user['telegram_id'], message)
+
+        return {
+            'success': True,
+            'order_id': order_id,
+            'total_amount': from_minor(total_amount),
+            'status': 'new',
+            'created_at': order_details['created_at'],
+            'items': [{
+                'product_name': item['product_name'],
+                'quantity': item['quantity'],
+                'price': from_minor(item['price']),
+                'total': from_minor(item['quantity'] * item['price'])
+            } for item in order_items]
+        }, 201
+
+    except Exception:
+        # Ожидаемые ошибки разобраны выше; текст остальных остается в логе, а не в ответе боту
+        logger.exception('telegram order failed')
+        return {'error': 'Internal server error'}, 500
+
+
+def get_user_cart(telegram_id):
+    user, error = resolve_user(telegram_id)
+    if error:
+        return error
+
+    return cart_to_json(get_cart(user['id'])), 200
+
+
+def clear_user_cart(telegram_id):
+    user, error = resolve_user(telegram_id)
+    if error:
+        return error
+
+    clear_cart(user['id'])
+    return cart_to_json(get_cart(user['id'])), 200
+
+
+def add_to_cart(data):
+    if not data or not data.get('telegram_id'):
+        return {'error': 'telegram_id required'}, 400
+
+    user, error = resolve_user(data['telegram_id'])
+    if error:
+        return error
+
+    try:
+        validate_order_item(data, 'quantity', allow_new=True, default_qty=1)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    if data.get('product_id'):
+        if not add_cart_item(user['id'], data['product_id'], data['quantity']):
+            return {'error': 'Product not found'}, 404
+    else:
+        # Товар в каталоге создаст оформление заказа, а не добавление в корзину
+        add_custom_cart_item(user['id'], data['product_name'], data['price'], data.get('description'), data['quantity'])
+
+    return cart_to_json(get_cart(user['id'])), 200
+
+
+def checkout_cart(data):
+    if not data or not data.get('telegram_id'):
+        return {'error': 'telegram_id required'}, 400
+
+    user, error = resolve_user(data['telegram_id'])
+    if error:
+        return error
+
+    return place_cart_order(user['id'])
+
+
+def get_products(telegram_id):
+    user, error = resolve_user(telegram_id)
+    if error:
+        return error
+
+    products = get_repository().list_user_products(user['id'])
+
+    return [money_fields(product, 'price') for product in products], 200
+
+
+def link_account(token, telegram_id):
+    if not token or not telegram_id:
+        return {'error': 'Token and telegram_id required'}, 400
+
+    user = get_repository().claim_link_token(token, telegram_id, datetime.now())
+
+    if not user:
+        return {'error': 'Invalid or expired token'}, 400
+
+    # Следующие запросы бота с этим telegram_id пойдут в базу этого магазина
+    remember_telegram_shop(telegram_id, current_shop())
+
+    message = f"✅ <b>Аккаунт успешно привязан!</b>\n\n👤 {user['email']}\n\nТеперь вы будете получать уведомления о:\n• Новых заказах\n• Покупках ваших товаров\n• Изменениях статусов"
+    send_telegram_notification(telegram_id, message)
+
+    return {
+        'success': True,
+        'message': 'Telegram account linked successfully',
+        'user_email': user['email']
+    }, 200
+
+
+def orders_with_items(orders, include_archived=False):
+    """Заказы с товарами: строки всех заказов одним запросом, а не запросом на каждый заказ"""
+    if not orders:
+        return []
+
+    order_ids = [order['id'] for order in orders]
+    placeholders = ', '.join('?' for _ in orders)
+    tables = ['order_items', 'order_items_archive'] if include_archived else ['order_items']
+    lines = ' UNION ALL '.join(f'''
+        SELECT id, order_id, qty, price, product_name
+        FROM {table}
+        WHERE order_id IN ({placeholders})
+    ''' for table in tables)
+    order_items = get_repository().fetch_all(
+        f'SELECT * FROM ({lines}) lines ORDER BY id',
+        order_ids * len(tables),
+        replica=True
+    )
+
+    items_by_order = {}
+    for item in order_items:
+        items_by_order.setdefault(item['order_id'], []).append({
+            'product_name': item['product_name'],
+            'quantity': item['qty'],
+            'price': from_minor(item['price']),
+            'total': from_minor(item['qty'] * item['price'])
+        })
+
+    orders_list = []
+    for order in orders:
+        order_dict = money_fields(order, 'total_amount')
+        order_dict['items'] = items_by_order.get(order['id'], [])
+        orders_list.append(order_dict)
+
+    return orders_list
+
+
+def get_user_info(telegram_id):
+    user, error = resolve_user(telegram_id)
+    if error:
+        return error
+
+    # Сумма - по всем заказам, включая архивные; последние заказы - из горячей таблицы
+    repo = get_repository()
+    totals = repo.fetch_one('''
+        SELECT
+            (SELECT COALESCE(SUM(total_amount), 0) FROM orders WHERE user_id = ?)
+            + (SELECT COALESCE(SUM(total_amount), 0) FROM orders_archive WHERE user_id = ?) AS total
+    ''', (user['id'], user['id']), replica=True)
+
+    orders = repo.fetch_all('''
+        SELECT o.*
+        FROM orders o
+        WHERE o.user_id = ?
+        ORDER BY o.created_at DESC
+        LIMIT 3
+    ''', (user['id'],), replica=True)
+
+    return {
+        'email': user['email'],
+        'first_name': user['first_name'],
+        'last_name': user['last_name'],
+        'total_all_orders': from_minor(totals['total']),
+        'orders': orders_with_items(orders)
+    }, 200
+
+
+def get_orders(telegram_id, include_archived=False):
+    user, error = resolve_user(telegram_id)
+    if error:
+        return error
+
+    query = 'SELECT id, user_id, total_amount, status, created_at, updated_at, version, 0 AS archived FROM orders WHERE user_id = ?'
+    params = [user['id']]
+    if include_archived:
+        query += ''' UNION ALL
+            SELECT id, user_id, total_amount, status, created_at, updated_at, version, 1 AS archived
+            FROM orders_archive WHERE user_id = ?'''
+        params.append(user['id'])
+    orders = get_repository().fetch_all(query + ' ORDER BY created_at DESC', params, replica=True)
+
+    return orders_with_items(orders, include_archived), 200
+
+
+def get_stats(telegram_id, days):
+    user, error = resolve_user(telegram_id)
+    if error:
+        return error
+
+    days = clamp_report_days(days)
+    rows = seller_revenue(user['id'], days)
+
+    return {
+        'days': days,
+        'revenue_total': from_minor(sum(row['revenue'] for row in rows)),
+        'orders_total': sum(row['orders_count'] for row in rows),
+        'items_total': sum(row['items_qty'] for row in rows),
+        'top_products': [money_fields(row, 'revenue') for row in top_products(user['id'], days, 5)],
+        'status_funnel': status_funnel(user['id'], days)
+    }, 200
+
+
+def get_changes(telegram_id, since):
+    user, error = resolve_user(telegram_id)
+    if error:
+        return error
+
+    return changes_since(user['id'], max(since, 0), own_products=True), 200
@@ -0,0 +1,108 @@
+import itertools
+import os
+import sys
+import tempfile
+
+# config читает окружение при импорте - настройки до импорта app
+DATA_DIR = tempfile.mkdtemp(prefix='bobrshop-tests-')
+# PostgreSQL из pgserver под root работает от другого пользователя - ему нужен доступ к каталогу
+os.chmod(DATA_DIR, 0o777)
+os.environ['DATABASE_PATH'] = os.path.join(DATA_DIR, 'app.db')
+os.environ['QUERY_CHECK_MODE'] = 'raise'
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.pop('BOT_TOKEN', None)
+os.environ.pop('SHOPS', None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import app as app_module
+import repository
+from config import get_config
+from events import register_consumer
+from notifications import TELEGRAM_NOTIFIER
+
+config = get_config()
+
+_names = itertools.count(1)
+
+
+def start_server_database():
+    """DSN серверной базы: TEST_DATABASE_URL или локальный PostgreSQL из pgserver. (dsn, server)"""
+    if os.environ.get('TEST_DATABASE_URL'):
+        return os.environ['TEST_DATABASE_URL'], None
+
+    pgserver = pytest.importorskip('pgserver', reason='set TEST_DATABASE_URL or pip install pgserver')
+    server = pgserver.get_server(os.path.join(DATA_DIR, 'pg'), cleanup_mode='stop')
+    return server.get_uri(), server
+
+
+@pytest.fixture(scope='session', params=['sqlite', 'dbapi'])
+def backend(request):
+    """Каждый тест выполняется с обоими драйверами репозитория"""
+    if request.param == 'sqlite':
+        yield repository.SQLiteRepository()
+        return
+
+    dsn, server = start_server_database()
+    repo = repository.DbApiRepository(config.DBAPI_MODULE, dsn, config.DB_SERVER_POOL_SIZE)
+    repo.init_schema()
+    yield repo
+    if server is not None:
+        server.cleanup()
+
+
+@pytest.fixture(autouse=True)
+def repo(backend, monkeypatch):
+    monkeypatch.setattr(repository, '_repository', backend)
+    monkeypatch.setattr(app_module, 'repo', backend)
+    register_consumer(TELEGRAM_NOTIFIER)
+    return backend
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def make_user(client):
+    """Регистрирует нового пользователя; возвращает (заголовки с токеном, id)"""
+    def make(prefix='user'):
+        name = f'{prefix}{next(_names)}'
+        response = client.post('/api/auth/register', json={
+            'username': name,
+            'email': f'{name}@example.com',
+            'password': 'secret',
+            'first_name': 'Test',
+            'last_name': 'User'
+        })
+        assert response.status_code == 201, response.get_json()
+        body = response.get_json()
+        return {'Authorization': f"Bearer {body['access_token']}"}, body['user']['id']
+
+    return make
+
+
+@pytest.fixture
+def make_product(client):
+    """Создает товар от имени владельца; возвращает его JSON"""
+    def make(headers, name='Product', price=10, **fields):
+        response = client.post('/api/products', json={'name': name, 'price': price, **fields}, headers=headers)
+        assert response.status_code == 201, response.get_json()
+        return response.get_json()
+
+    return make
+
+
+@pytest.fixture
+def link_telegram(client):
+    """Привязывает Telegram к аккаунту; возвращает telegram_id"""
+    def link(headers):
+        telegram_id = str(100000 + next(_names))
+        token = client.post('/api/telegram/generate-token', headers=headers).get_json()['token']
+        response = client.get(f'/link-telegram?token={token}&telegram_id={telegram_id}')
+        assert response.status_code == 200, response.get_json()
+        return telegram_id
+
+    return link
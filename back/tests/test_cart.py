@@ -0,0 +1,90 @@
+import pytest
+
+
+def test_cart_items_and_checkout(client, make_user, make_product):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    product = make_product(seller, price=5, stock=10)
+
+    assert client.post('/api/cart/items', json={'product_id': product['id'], 'qty': 2}, headers=buyer).status_code == 200
+    cart = client.post('/api/cart/items', json={'product_id': product['id'], 'qty': 1}, headers=buyer).get_json()
+    assert [item['qty'] for item in cart['items']] == [3]
+    assert cart['total_amount'] == 15.0
+
+    cart = client.put(f"/api/cart/items/{product['id']}", json={'qty': 4}, headers=buyer).get_json()
+    assert cart['total_amount'] == 20.0
+
+    response = client.post('/api/cart/checkout', headers=buyer)
+    assert response.status_code == 201
+    assert response.get_json()['total_amount'] == 20.0
+    assert client.get('/api/cart', headers=buyer).get_json()['items'] == []
+    assert client.get('/api/products', headers=seller).get_json()[0]['stock'] == 6
+
+
+def test_cart_item_missing(client, make_user):
+    buyer, _ = make_user('buyer')
+
+    assert client.post('/api/cart/items', json={'product_id': 10 ** 9}, headers=buyer).status_code == 404
+    assert client.put(f'/api/cart/items/{10 ** 9}', json={'qty': 1}, headers=buyer).status_code == 404
+    assert client.delete(f'/api/cart/items/{10 ** 9}', headers=buyer).status_code == 404
+    assert client.post('/api/cart/checkout', headers=buyer).status_code == 400
+
+
+def test_checkout_of_stale_cart_is_refreshed(client, make_user, make_product):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    product = make_product(seller, price=5)
+    removed = make_product(seller, name='Gone')
+    client.post('/api/cart/items', json={'product_id': product['id']}, headers=buyer)
+    client.post('/api/cart/items', json={'product_id': removed['id']}, headers=buyer)
+
+    client.delete(f"/api/products/{removed['id']}", headers=seller)
+    assert [item['product_id'] for item in client.get('/api/cart', headers=buyer).get_json()['items']] == [product['id']]
+
+    client.put(f"/api/products/{product['id']}", json={'price': 7}, headers=seller)
+    response = client.post('/api/cart/checkout', headers=buyer)
+    assert response.status_code == 409
+    assert [problem['problem'] for problem in response.get_json()['problems']] == ['price_changed']
+
+    response = client.post('/api/cart/checkout', headers=buyer)
+    assert response.status_code == 201
+    assert response.get_json()['total_amount'] == 7.0
+
+
+@pytest.mark.parametrize('qty', [True, 1.5, '2', 0])
+def test_cart_rejects_invalid_quantity(client, make_user, make_product, link_telegram, qty):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    product = make_product(seller)
+    telegram_id = link_telegram(buyer)
+
+    assert client.post('/api/cart/items', json={'product_id': product['id'], 'qty': qty}, headers=buyer).status_code == 400
+    response = client.post('/api/telegram/cart/items', json={'telegram_id': telegram_id, 'product_id': product['id'], 'quantity': qty})
+    assert response.status_code == 400
+    assert client.get('/api/cart', headers=buyer).get_json()['items'] == []
+
+
+@pytest.mark.parametrize('qty', [True, 1.5, 0, -1])
+def test_cart_qty_update_rejects_invalid_quantity(client, make_user, make_product, qty):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    product = make_product(seller)
+    client.post('/api/cart/items', json={'product_id': product['id'], 'qty': 2}, headers=buyer)
+
+    assert client.put(f"/api/cart/items/{product['id']}", json={'qty': qty}, headers=buyer).status_code == 400
+    assert [item['qty'] for item in client.get('/api/cart', headers=buyer).get_json()['items']] == [2]
+
+
+def test_conflicting_checkout_does_not_pin_idempotency_key(client, make_user, make_product):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    product = make_product(seller, price=5)
+    client.post('/api/cart/items', json={'product_id': product['id']}, headers=buyer)
+    client.put(f"/api/products/{product['id']}", json={'price': 7}, headers=seller)
+    headers = {**buyer, 'Idempotency-Key': 'k1'}
+
+    assert client.post('/api/cart/checkout', headers=headers).status_code == 409
+
+    response = client.post('/api/cart/checkout', headers=headers)
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response.headers
@@ -0,0 +1,133 @@
+import pytest
+from datetime import datetime, timedelta
+from idempotency import begin_request, finish_request
+from inventory import reserve_stock
+
+
+def test_order_total_stock_and_history(client, make_user, make_product):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    first = make_product(seller, name='Tea', price=10.5, stock=3)
+    second = make_product(seller, name='Cup', price=2)
+
+    response = client.post('/api/orders', json={'items': [
+        {'product_id': first['id'], 'qty': 2},
+        {'product_id': second['id'], 'qty': 1}
+    ]}, headers=buyer)
+
+    assert response.status_code == 201
+    order = response.get_json()
+    assert order['total_amount'] == 23.0
+    assert sorted(item['product_name'] for item in order['items']) == ['Cup', 'Tea']
+
+    stock = {product['id']: product['stock'] for product in client.get('/api/products', headers=seller).get_json()}
+    assert stock[first['id']] == 1
+
+    history = client.get('/api/orders', headers=buyer).get_json()
+    assert [(row['id'], row['items_count'], row['total_amount']) for row in history] == [(order['id'], 2, 23.0)]
+
+    details = client.get(f"/api/orders/{order['id']}", headers=buyer).get_json()
+    assert details['total_amount'] == 23.0
+
+
+def test_order_rejects_missing_product_and_insufficient_stock(client, make_user, make_product):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    product = make_product(seller, stock=1)
+
+    response = client.post('/api/orders', json={'items': [{'product_id': 10 ** 9, 'qty': 1}]}, headers=buyer)
+    assert response.status_code == 404
+
+    response = client.post('/api/orders', json={'items': [{'product_id': product['id'], 'qty': 2}]}, headers=buyer)
+    assert response.status_code == 409
+    assert client.get('/api/orders', headers=buyer).get_json() == []
+
+
+def test_cancel_returns_stock(client, make_user, make_product):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    product = make_product(seller, stock=2)
+    order = client.post('/api/orders', json={'items': [{'product_id': product['id'], 'qty': 2}]}, headers=buyer).get_json()
+
+    response = client.put(f"/api/orders/{order['id']}", json={'status': 'canceled'}, headers=buyer)
+    assert response.get_json()['status'] == 'canceled'
+    assert client.get('/api/products', headers=seller).get_json()[0]['stock'] == 2
+
+    response = client.put(f"/api/orders/{order['id']}", json={'status': 'new'}, headers=buyer)
+    assert response.get_json()['status'] == 'new'
+    assert client.get('/api/products', headers=seller).get_json()[0]['stock'] == 0
+
+
+def test_idempotent_order_is_created_once(client, make_user, make_product):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    product = make_product(seller)
+    headers = {**buyer, 'Idempotency-Key': 'order-1'}
+    body = {'items': [{'product_id': product['id'], 'qty': 1}]}
+
+    first = client.post('/api/orders', json=body, headers=headers)
+    second = client.post('/api/orders', json=body, headers=headers)
+
+    assert first.status_code == second.status_code == 201
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert second.get_json()['id'] == first.get_json()['id']
+    assert len(client.get('/api/orders', headers=buyer).get_json()) == 1
+
+    other = client.post('/api/orders', json={'items': [{'product_id': product['id'], 'qty': 2}]}, headers=headers)
+    assert other.status_code == 422
+
+
+def test_deleted_product_keeps_order_lines(client, make_user, make_product):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    product = make_product(seller, name='Lamp')
+    order = client.post('/api/orders', json={'items': [{'product_id': product['id'], 'qty': 1}]}, headers=buyer).get_json()
+
+    assert client.delete(f"/api/products/{product['id']}", headers=seller).status_code == 200
+
+    assert product['id'] not in [row['id'] for row in client.get('/api/products/all', headers=buyer).get_json()]
+    details = client.get(f"/api/orders/{order['id']}", headers=buyer).get_json()
+    assert [item['product_name'] for item in details['items']] == ['Lamp']
+
+
+@pytest.mark.parametrize('qty', [-100, 0, 1.5, '2', True, None])
+def test_order_rejects_invalid_quantity(client, make_user, make_product, qty):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    product = make_product(seller, stock=5)
+
+    response = client.post('/api/orders', json={'items': [{'product_id': product['id'], 'qty': qty}]}, headers=buyer)
+
+    assert response.status_code == 400
+    assert client.get('/api/products', headers=seller).get_json()[0]['stock'] == 5
+    assert client.get('/api/orders', headers=buyer).get_json() == []
+
+
+def test_reserve_stock_rejects_negative_quantity(repo, make_user, make_product):
+    seller, _ = make_user('seller')
+    product = make_product(seller, stock=5)
+
+    with pytest.raises(ValueError):
+        repo.write(reserve_stock, 1, product['id'], -100)
+    assert repo.get_owned_product(product['id'], product['created_by'])['stock'] == 5
+
+
+def test_product_rejects_negative_price(client, make_user):
+    seller, _ = make_user('seller')
+
+    assert client.post('/api/products', json={'name': 'Free', 'price': -1}, headers=seller).status_code == 400
+
+
+def test_abandoned_idempotency_claim_is_reclaimed(repo):
+    assert begin_request('test:scope', 'stuck', b'{}') is None
+    assert begin_request('test:scope', 'stuck', b'{}')[0] == 409
+
+    # Процесс упал, не сохранив ответ: аренда ключа истекла
+    repo.execute(
+        'UPDATE idempotency_keys SET expires_at = ? WHERE scope = ? AND idem_key = ?',
+        (datetime.now() - timedelta(seconds=1), 'test:scope', 'stuck')
+    )
+    assert begin_request('test:scope', 'stuck', b'{}') is None
+
+    finish_request('test:scope', 'stuck', 201, '{}')
+    assert begin_request('test:scope', 'stuck', b'{}') == (201, '{}', True)
@@ -0,0 +1,173 @@
+import asyncio
+import time
+import account_deletion
+import sync
+from auth import decode_stream_token
+import events
+from events import events_for_user, stream_events
+
+
+def test_sync_returns_changes_and_tombstones(client, make_user, make_product):
+    seller, _ = make_user('seller')
+    product = make_product(seller, name='Soap')
+    version = client.get('/api/sync', headers=seller).get_json()['version']
+
+    client.put(f"/api/products/{product['id']}", json={'price': 3}, headers=seller)
+    changes = client.get(f'/api/sync?since={version}', headers=seller).get_json()
+    assert [row['price'] for row in changes['products']] == [3.0]
+
+    client.delete(f"/api/products/{product['id']}", headers=seller)
+    changes = client.get(f"/api/sync?since={changes['version']}", headers=seller).get_json()
+    assert changes['deleted']['products'] == [product['id']]
+    assert changes['full_resync'] is False
+
+
+def test_old_tombstones_are_purged_separately(client, make_user, make_product, monkeypatch):
+    seller, _ = make_user('seller')
+    product = make_product(seller)
+    version = client.get('/api/sync', headers=seller).get_json()['version']
+    client.delete(f"/api/products/{product['id']}", headers=seller)
+
+    # Удаление товара само tombstones не чистит
+    assert client.get(f'/api/sync?since={version}', headers=seller).get_json()['full_resync'] is False
+
+    monkeypatch.setattr(sync.config, 'SYNC_TOMBSTONE_RETENTION_DAYS', -1)
+    assert sync.purge_tombstones() >= 1
+    assert client.get(f'/api/sync?since={version}', headers=seller).get_json()['full_resync'] is True
+
+
+def test_order_events_reach_buyer_and_seller(client, make_user, make_product):
+    seller, seller_id = make_user('seller')
+    buyer, buyer_id = make_user('buyer')
+    product = make_product(seller)
+    order = client.post('/api/orders', json={'items': [{'product_id': product['id'], 'qty': 1}]}, headers=buyer).get_json()
+
+    for user_id in (seller_id, buyer_id):
+        events = [(row['entity'], row['entity_id'], row['action']) for row in events_for_user(user_id, 0, 1000)]
+        assert ('order', order['id'], 'created') in events
+
+
+
+def test_events_stream_token_is_single_purpose(client, make_user, make_product):
+    seller, _ = make_user('seller')
+    buyer, buyer_id = make_user('buyer')
+    product = make_product(seller)
+    order = client.post('/api/orders', json={'items': [{'product_id': product['id'], 'qty': 1}]}, headers=buyer).get_json()
+
+    token = client.post('/api/events/token', headers=buyer).get_json()['token']
+    assert client.get('/api/auth/me', headers={'Authorization': f'Bearer {token}'}).status_code == 401
+    assert decode_stream_token(buyer['Authorization'][7:]) is None
+
+    async def first_event():
+        stream = stream_events(decode_stream_token(token)['shop'], buyer_id, 0)
+        try:
+            async for chunk in stream:
+                if 'event: order' in chunk:
+                    return chunk
+        finally:
+            await stream.aclose()
+
+    assert f'"entity_id": {order["id"]}' in asyncio.run(first_event())
+
+
+def test_old_events_are_purged_separately(client, make_user, make_product, monkeypatch):
+    seller, seller_id = make_user('seller')
+    product = make_product(seller)
+    assert ('product', product['id']) in [(row['entity'], row['entity_id']) for row in events_for_user(seller_id, 0, 10 ** 6)]
+
+    monkeypatch.setattr(events.config, 'EVENTS_RETENTION_HOURS', -1)
+    assert events.purge_old_events() >= 1
+    assert events_for_user(seller_id, 0) == []
+
+
+def test_seller_reports(client, make_user, make_product):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    product = make_product(seller, name='Pen', price=2.5)
+    client.post('/api/orders', json={'items': [{'product_id': product['id'], 'qty': 4}]}, headers=buyer)
+    canceled = client.post('/api/orders', json={'items': [{'product_id': product['id'], 'qty': 1}]}, headers=buyer).get_json()
+    client.put(f"/api/orders/{canceled['id']}", json={'status': 'canceled'}, headers=buyer)
+
+    revenue = client.get('/api/reports/revenue', headers=seller).get_json()
+    assert (revenue['revenue_total'], revenue['orders_total']) == (10.0, 1)
+
+    top = client.get('/api/reports/top-products', headers=seller).get_json()
+    assert [(row['product_name'], row['qty'], row['revenue']) for row in top] == [('Pen', 4, 10.0)]
+
+    funnel = client.get('/api/reports/status-funnel', headers=seller).get_json()['statuses']
+    assert (funnel['new'], funnel['canceled']) == (1, 1)
+
+
+def test_account_deletion_removes_user_data(client, make_user, make_product):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    product = make_product(seller)
+    client.post('/api/orders', json={'items': [{'product_id': product['id'], 'qty': 1}]}, headers=buyer)
+
+    assert client.delete('/api/auth/me', headers=buyer).status_code == 200
+    assert client.get('/api/auth/me', headers=buyer).status_code == 401
+    assert client.get('/api/reports/revenue', headers=seller).get_json()['orders_total'] == 0
+
+
+
+def test_buyer_deletion_returns_reserved_stock(client, repo, make_user, make_product):
+    seller, _ = make_user('seller')
+    buyer, buyer_id = make_user('buyer')
+    product = make_product(seller, stock=10)
+    for qty in (4, 2):
+        client.post('/api/orders', json={'items': [{'product_id': product['id'], 'qty': qty}]}, headers=buyer)
+    completed = client.post('/api/orders', json={'items': [{'product_id': product['id'], 'qty': 1}]}, headers=buyer).get_json()
+    client.put(f"/api/orders/{completed['id']}", json={'status': 'completed'}, headers=buyer)
+
+    # Пачка освобождает резервы своих заказов, остальное - erase_account
+    assert repo.write(account_deletion.delete_account_batch, buyer_id, 1) == 1
+    assert client.get('/api/products', headers=seller).get_json()[0]['stock'] == 7
+    assert client.delete('/api/auth/me', headers=buyer).status_code == 200
+    assert client.get('/api/products', headers=seller).get_json()[0]['stock'] == 9
+
+
+def test_seller_deletion_keeps_buyer_order_lines(client, make_user, make_product):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    product = make_product(seller, name='Kettle', price=4)
+    order = client.post('/api/orders', json={'items': [{'product_id': product['id'], 'qty': 1}]}, headers=buyer).get_json()
+    client.post('/api/cart/items', json={'product_id': product['id']}, headers=buyer)
+
+    assert client.delete('/api/auth/me', headers=seller).status_code == 200
+
+    details = client.get(f"/api/orders/{order['id']}", headers=buyer).get_json()
+    assert [(item['product_name'], item['price']) for item in details['items']] == [('Kettle', 4.0)]
+    assert product['id'] not in [row['id'] for row in client.get('/api/products/all', headers=buyer).get_json()]
+    assert client.get('/api/cart', headers=buyer).get_json()['items'] == []
+
+    response = client.put(f"/api/orders/{order['id']}", json={'status': 'canceled'}, headers=buyer)
+    assert response.get_json()['status'] == 'canceled'
+
+
+def test_background_deletion_revokes_tokens_and_runs_once(client, make_user, make_product, monkeypatch):
+    monkeypatch.setattr(account_deletion.config, 'ACCOUNT_DELETE_BATCH_SIZE', 1)
+    monkeypatch.setattr(account_deletion.config, 'ACCOUNT_DELETE_BATCH_PAUSE_MS', 0)
+    seller, seller_id = make_user('seller')
+    buyer, _ = make_user('buyer')
+    products = [make_product(seller, name=f'Item {number}') for number in range(3)]
+    order = client.post('/api/orders', json={'items': [{'product_id': products[0]['id'], 'qty': 1}]}, headers=buyer).get_json()
+
+    assert client.delete('/api/auth/me', headers=seller).status_code == 202
+    assert client.get('/api/auth/me', headers=seller).status_code == 401
+    assert client.delete('/api/auth/me', headers=seller).status_code == 401
+
+    for _ in range(100):
+        if client.get('/api/auth/me/deletion', headers=seller).get_json()['status'] == 'done':
+            break
+        time.sleep(0.05)
+    assert client.get('/api/auth/me/deletion', headers=seller).get_json()['status'] == 'done'
+
+    details = client.get(f"/api/orders/{order['id']}", headers=buyer).get_json()
+    assert [item['product_name'] for item in details['items']] == ['Item 0']
+
+
+def test_second_deletion_job_is_not_started(repo, make_user):
+    _, user_id = make_user()
+
+    assert repo.write(account_deletion._start_job, user_id, 10) is True
+    assert repo.write(account_deletion._start_job, user_id, 10) is False
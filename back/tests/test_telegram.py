@@ -0,0 +1,135 @@
+import pytest
+
+
+def test_link_and_bot_catalog(client, make_user, make_product, link_telegram):
+    seller, _ = make_user('seller')
+    make_product(seller, name='Honey')
+    telegram_id = link_telegram(seller)
+
+    assert client.get('/api/auth/me', headers=seller).get_json()['telegram_linked'] is True
+    products = client.get(f'/api/telegram/products?telegram_id={telegram_id}').get_json()
+    assert [product['name'] for product in products] == ['Honey']
+
+
+def test_link_token_is_single_use(client, make_user):
+    user, _ = make_user()
+    token = client.post('/api/telegram/generate-token', headers=user).get_json()['token']
+
+    assert client.get(f'/link-telegram?token={token}&telegram_id=1').status_code == 200
+    assert client.get(f'/link-telegram?token={token}&telegram_id=2').status_code == 400
+
+
+def test_unknown_telegram_user(client):
+    assert client.get('/api/telegram/products?telegram_id=404404').status_code == 404
+    assert client.get('/api/telegram/products').status_code == 400
+
+
+def test_bot_order_and_profile(client, make_user, make_product, link_telegram):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    product = make_product(seller, name='Jam', price=3, stock=5)
+    telegram_id = link_telegram(buyer)
+
+    response = client.post('/api/telegram/create-order', json={'telegram_id': telegram_id, 'items': [
+        {'product_id': product['id'], 'quantity': 2},
+        {'product_name': 'Bread', 'price': 1.5, 'quantity': 2}
+    ]})
+    assert response.status_code == 201
+    assert response.get_json()['total_amount'] == 9.0
+
+    info = client.get(f'/api/telegram/user-info?telegram_id={telegram_id}').get_json()
+    assert info['total_all_orders'] == 9.0
+    assert [len(order['items']) for order in info['orders']] == [2]
+
+    orders = client.get(f'/api/telegram/orders?telegram_id={telegram_id}').get_json()
+    assert [order['total_amount'] for order in orders] == [9.0]
+
+
+def test_bot_cart_checkout(client, make_user, make_product, link_telegram):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    product = make_product(seller, price=4)
+    telegram_id = link_telegram(buyer)
+
+    response = client.post('/api/telegram/cart/items', json={'telegram_id': telegram_id, 'product_id': product['id'], 'quantity': 2})
+    assert response.get_json()['total_amount'] == 8.0
+
+    response = client.post('/api/telegram/cart/checkout', json={'telegram_id': telegram_id})
+    assert response.status_code == 201
+    assert client.get(f'/api/telegram/cart?telegram_id={telegram_id}').get_json()['items'] == []
+
+
+@pytest.mark.parametrize('qty', [1.5, '2', -1, True])
+def test_bot_order_rejects_invalid_quantity(client, make_user, make_product, link_telegram, qty):
+    seller, _ = make_user('seller')
+    buyer, _ = make_user('buyer')
+    product = make_product(seller, stock=5)
+    telegram_id = link_telegram(buyer)
+
+    response = client.post('/api/telegram/create-order', json={'telegram_id': telegram_id, 'items': [
+        {'product_id': product['id'], 'quantity': qty}
+    ]})
+
+    assert response.status_code == 400
+    assert client.get('/api/products', headers=seller).get_json()[0]['stock'] == 5
+    assert client.get(f'/api/telegram/orders?telegram_id={telegram_id}').get_json() == []
+
+
+def test_bot_order_rejects_negative_price(client, make_user, link_telegram):
+    buyer, _ = make_user('buyer')
+    telegram_id = link_telegram(buyer)
+
+    response = client.post('/api/telegram/create-order', json={'telegram_id': telegram_id, 'items': [
+        {'product_name': 'Bread', 'price': -5, 'quantity': 1}
+    ]})
+
+    assert response.status_code == 400
+    assert client.get(f'/api/telegram/orders?telegram_id={telegram_id}').get_json() == []
+
+
+@pytest.mark.parametrize('item', [
+    {'product_id': 1},
+    {'price': 5, 'quantity': 1},
+    {'product_name': 'Bread', 'quantity': 1},
+    'Bread'
+])
+def test_bot_order_rejects_incomplete_items(client, make_user, link_telegram, item):
+    buyer, _ = make_user('buyer')
+    telegram_id = link_telegram(buyer)
+
+    response = client.post('/api/telegram/create-order', json={'telegram_id': telegram_id, 'items': [item]})
+
+    assert response.status_code == 400
+
+
+def test_bot_order_unknown_product(client, make_user, link_telegram):
+    buyer, _ = make_user('buyer')
+    telegram_id = link_telegram(buyer)
+
+    response = client.post('/api/telegram/create-order', json={'telegram_id': telegram_id, 'items': [
+        {'product_id': 10 ** 9, 'quantity': 1}
+    ]})
+
+    assert response.status_code == 404
+
+
+def test_bot_cart_custom_item_creates_product_on_checkout(client, make_user, link_telegram):
+    buyer, _ = make_user('buyer')
+    telegram_id = link_telegram(buyer)
+    item = {'telegram_id': telegram_id, 'product_name': 'Pie', 'price': 2.5, 'quantity': 1}
+
+    client.post('/api/telegram/cart/items', json=item)
+    cart = client.post('/api/telegram/cart/items', json=item).get_json()
+    assert [(row['name'], row['qty']) for row in cart['items']] == [('Pie', 2)]
+    assert cart['total_amount'] == 5.0
+    assert client.get('/api/products', headers=buyer).get_json() == []
+
+    client.delete(f'/api/telegram/cart?telegram_id={telegram_id}')
+    assert client.get(f'/api/telegram/cart?telegram_id={telegram_id}').get_json()['items'] == []
+
+    client.post('/api/telegram/cart/items', json=item)
+    response = client.post('/api/telegram/cart/checkout', json={'telegram_id': telegram_id})
+    assert response.status_code == 201
+    assert [line['product_name'] for line in response.get_json()['items']] == ['Pie']
+    assert [product['name'] for product in client.get('/api/products', headers=buyer).get_json()] == ['Pie']
+    assert client.get(f'/api/telegram/cart?telegram_id={telegram_id}').get_json()['items'] == []
@@ -0,0 +1,8 @@
+"""WSGI-точка входа: gunicorn -c gunicorn.conf.py wsgi:app
+
+Импорт app выполняет init_db() и регистрирует потребителей ленты. С preload_app это
+происходит один раз в мастер-процессе до fork, а не в каждом воркере.
+"""
+from app import app
+
+application = app
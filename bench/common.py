@@ -0,0 +1,160 @@
+"""Общие части нагрузочных скриптов: запуск gunicorn, клиенты и перцентили задержек."""
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+BACK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'back')
+
+
+def use_backend(db_path):
+    """Импорт модулей backend в этом процессе с базой db_path"""
+    os.environ['DATABASE_PATH'] = db_path
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    if BACK_DIR not in sys.path:
+        sys.path.insert(0, BACK_DIR)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'gunicorn did not start on port {port}')
+
+
+@contextmanager
+def gunicorn(db_path, workers, threads, **env):
+    """Поднимает gunicorn на временном порту, отдает порт, по выходе останавливает"""
+    port = free_port()
+    env = dict(
+        os.environ,
+        DATABASE_PATH=db_path,
+        FLASK_ENV='production',
+        LOG_LEVEL='WARNING',
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_THREADS=str(threads),
+        GUNICORN_BIND=f'127.0.0.1:{port}',
+        GUNICORN_PIDFILE=os.path.join(os.path.dirname(db_path), f'gunicorn-{port}.pid'),
+        **env
+    )
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+        cwd=BACK_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_server(port)
+        yield port
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+
+def client_process(port, scenario, context, threads, duration, seed, queue):
+    """Один процесс-клиент: threads потоков с keep-alive соединениями.
+
+    scenario(rng, context) возвращает (method, path, json_body или None, headers или None).
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        local_errors = 0
+        while time.monotonic() < stop_at:
+            method, path, body, headers = scenario(rng, context)
+            headers = dict(headers or {})
+            if body is not None:
+                body = json.dumps(body)
+                headers['Content-Type'] = 'application/json'
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    local_errors += 1
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    queue.put((latencies, errors[0]))
+
+
+def drive(port, scenario, context, clients, threads, duration):
+    """Запускает clients процессов по threads потоков и возвращает (задержки, ошибки)"""
+    queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=client_process,
+            args=(port, scenario, context, threads, duration, seed, queue)
+        )
+        for seed in range(clients)
+    ]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = sorted(value for values, _ in results for value in values)
+    errors = sum(count for _, count in results)
+    return latencies, errors
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(int(len(sorted_values) * p / 100), len(sorted_values) - 1)
+    return round(sorted_values[index] * 1000, 2)
+
+
+def summarize(latencies, errors, duration):
+    """Пропускная способность и перцентили задержек (мс) одного прогона"""
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / duration, 1),
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': round(latencies[-1] * 1000, 2) if latencies else None
+        }
+    }
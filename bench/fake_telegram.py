@@ -0,0 +1,51 @@
+"""Заглушка Telegram Bot API для нагрузочных тестов: принимает sendMessage и отвечает ok.
+
+Backend направляется на нее переменной TELEGRAM_API_URL. Задержка ответа имитирует настоящий API.
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        with self.server.lock:
+            self.server.messages += 1
+
+        body = json.dumps({'ok': True, 'result': {'message_id': self.server.messages}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeTelegramServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Воркеры backend при остановке рвут keep-alive соединения - это не ошибка заглушки
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_fake_telegram(latency_ms=0):
+    """Запускает заглушку в фоновом потоке; возвращает сервер (server.url, server.messages)"""
+    server = FakeTelegramServer(('127.0.0.1', 0), FakeTelegramHandler)
+    server.latency = latency_ms / 1000
+    server.messages = 0
+    server.lock = threading.Lock()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
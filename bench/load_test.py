@@ -0,0 +1,66 @@
+"""Нагрузочный тест backend под gunicorn: как пропускная способность растет с числом воркеров.
+
+Запуск из корня репозитория (нужен gunicorn, только Linux/macOS):
+    python bench/load_test.py --workers 1 2 4 --clients 4 --threads 16 --duration 10
+
+Для каждого числа воркеров поднимается отдельный gunicorn на временной базе с
+засеянным каталогом, клиенты в нескольких процессах бьют в чтение каталога и корня API.
+Результат - JSON с RPS и перцентилями задержек по каждому прогону.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import drive, gunicorn, summarize
+from seed import seed_database
+
+PATHS = ['/api/products/overview?per_page=50', '/api/products/all', '/']
+
+
+def read_catalog(rng, context):
+    return 'GET', rng.choice(PATHS), None, {'Authorization': f"Bearer {context['tokens'][0]}"}
+
+
+def run(workers, threads_per_worker, db_path, context, args):
+    with gunicorn(db_path, workers, threads_per_worker) as port:
+        latencies, errors = drive(port, read_catalog, context, args.clients, args.threads, args.duration)
+
+    return dict(
+        {'workers': workers, 'threads_per_worker': threads_per_worker},
+        **summarize(latencies, errors, args.duration)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help='числа воркеров для прогонов (по умолчанию 1, 2, 4 ... до числа ядер)')
+    parser.add_argument('--worker-threads', type=int, default=4, help='потоков в воркере gunicorn')
+    parser.add_argument('--clients', type=int, default=max(multiprocessing.cpu_count() // 2, 1),
+                        help='процессов-клиентов')
+    parser.add_argument('--threads', type=int, default=16, help='потоков в процессе-клиенте')
+    parser.add_argument('--duration', type=float, default=10, help='секунд на прогон')
+    parser.add_argument('--products', type=int, default=500, help='товаров в каталоге')
+    args = parser.parse_args()
+
+    cores = multiprocessing.cpu_count()
+    workers_list = args.workers
+    if not workers_list:
+        workers_list = [1]
+        while workers_list[-1] * 2 <= cores:
+            workers_list.append(workers_list[-1] * 2)
+
+    workdir = tempfile.mkdtemp(prefix='bobrshop-load-')
+    db_path = os.path.join(workdir, 'load.db')
+    context = seed_database(db_path, users=1, products=args.products, orders=0, tokens=1)
+
+    runs = [run(workers, args.worker_threads, db_path, context, args) for workers in workers_list]
+    print(json.dumps({'cpu_count': cores, 'duration_s': args.duration, 'runs': runs}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
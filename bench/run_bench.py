@@ -0,0 +1,184 @@
+"""Набор нагрузочных сценариев backend: вход, каталог, создание заказа, эндпоинты бота.
+
+Запуск из корня репозитория (нужен gunicorn, только Linux/macOS):
+    python bench/run_bench.py --output baseline.json
+    python bench/run_bench.py --scenarios browse order --order-items 10 --baseline baseline.json
+
+База засевается один раз (bench/seed.py), каждый сценарий получает свою копию, поэтому
+записи одного сценария не влияют на другой. Уведомления уходят в заглушку Telegram API
+(bench/fake_telegram.py). Результат - JSON с RPS и перцентилями задержек по сценариям;
+с --baseline добавляется изменение относительно сохраненного прогона.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import drive, gunicorn, summarize
+from fake_telegram import start_fake_telegram
+from seed import seed_database
+
+
+def auth_headers(rng, context):
+    return {'Authorization': f"Bearer {rng.choice(context['tokens'])}"}
+
+
+def random_telegram_id(rng, context):
+    return str(context['telegram_id_base'] + rng.randrange(context['users']))
+
+
+def login(rng, context):
+    user = rng.randrange(context['users'])
+    return 'POST', '/api/auth/login', {'login': f'bench{user}', 'password': context['password']}, None
+
+
+def browse(rng, context):
+    pages = max(context['products'] // 50, 1)
+    if rng.random() < 0.2:
+        return 'GET', '/api/products/overview?mine=1', None, auth_headers(rng, context)
+    return 'GET', f'/api/products/overview?page={rng.randint(1, pages)}&per_page=50', None, auth_headers(rng, context)
+
+
+def order(rng, context):
+    product_ids = rng.sample(range(1, context['products'] + 1), min(context['order_items'], context['products']))
+    items = [{'product_id': product_id, 'qty': rng.randint(1, 3)} for product_id in product_ids]
+    return 'POST', '/api/orders', {'items': items}, auth_headers(rng, context)
+
+
+def telegram(rng, context):
+    """Смесь запросов бота: списки заказов и профиль чаще, создание заказа с уведомлениями реже"""
+    telegram_id = random_telegram_id(rng, context)
+    roll = rng.random()
+    if roll < 0.35:
+        return 'GET', f'/api/telegram/orders?telegram_id={telegram_id}', None, None
+    if roll < 0.6:
+        return 'GET', f'/api/telegram/user-info?telegram_id={telegram_id}', None, None
+    if roll < 0.8:
+        return 'GET', f'/api/telegram/products?telegram_id={telegram_id}', None, None
+
+    product_ids = rng.sample(range(1, context['products'] + 1), min(context['order_items'], context['products']))
+    items = [{'product_id': product_id, 'quantity': rng.randint(1, 3)} for product_id in product_ids]
+    return 'POST', '/api/telegram/create-order', {'telegram_id': telegram_id, 'items': items}, None
+
+
+SCENARIOS = {
+    'login': login,
+    'browse': browse,
+    'order': order,
+    'telegram': telegram
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Изменение RPS и p95 в процентах относительно прогона baseline"""
+    def change(new, old):
+        if not old or new is None:
+            return None
+        return round((new - old) / old * 100, 1)
+
+    comparison = {}
+    for name, result in results.items():
+        old = baseline.get('scenarios', {}).get(name)
+        if old:
+            comparison[name] = {
+                'rps_change_pct': change(result['rps'], old['rps']),
+                'p95_change_pct': change(result['latency_ms']['p95'], old['latency_ms']['p95']),
+                'p99_change_pct': change(result['latency_ms']['p99'], old['latency_ms']['p99'])
+            }
+    return comparison
+
+
+def main():
+    cores = multiprocessing.cpu_count()
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--items-per-order', type=int, default=3, help='строк в засеянных заказах')
+    parser.add_argument('--order-items', type=int, default=5, help='строк в создаваемых заказах')
+    parser.add_argument('--workers', type=int, default=cores, help='воркеров gunicorn')
+    parser.add_argument('--worker-threads', type=int, default=4, help='потоков в воркере gunicorn')
+    parser.add_argument('--clients', type=int, default=max(cores // 2, 1), help='процессов-клиентов')
+    parser.add_argument('--threads', type=int, default=8, help='потоков в процессе-клиенте')
+    parser.add_argument('--duration', type=float, default=10, help='секунд на сценарий')
+    parser.add_argument('--telegram-latency-ms', type=float, default=50, help='задержка заглушки Telegram API')
+    parser.add_argument('--output', help='записать результат в файл')
+    parser.add_argument('--baseline', help='сравнить с результатом прошлого прогона')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bobrshop-bench-')
+    template = os.path.join(workdir, 'template.db')
+    dataset = seed_database(template, args.users, args.products, args.orders, args.items_per_order)
+    context = dict(dataset, order_items=args.order_items)
+
+    fake_telegram = start_fake_telegram(args.telegram_latency_ms)
+
+    results = {}
+    try:
+        for name in args.scenarios:
+            db_path = os.path.join(workdir, f'{name}.db')
+            shutil.copyfile(template, db_path)
+
+            with gunicorn(
+                db_path, args.workers, args.worker_threads,
+                BOT_TOKEN='bench', TELEGRAM_API_URL=fake_telegram.url, QUERY_CHECK_MODE='off'
+            ) as port:
+                latencies, errors = drive(port, SCENARIOS[name], context, args.clients, args.threads, args.duration)
+
+            results[name] = summarize(latencies, errors, args.duration)
+    finally:
+        fake_telegram.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    dataset.pop('tokens')
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': cores,
+            'workers': args.workers,
+            'worker_threads': args.worker_threads,
+            'clients': args.clients,
+            'client_threads': args.threads,
+            'duration_s': args.duration,
+            'order_items': args.order_items,
+            'telegram_latency_ms': args.telegram_latency_ms,
+            'dataset': dataset
+        },
+        'scenarios': results,
+        'telegram_messages': fake_telegram.messages
+    }
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            report['vs_baseline'] = compare(results, json.load(baseline_file))
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
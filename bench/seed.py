@@ -0,0 +1,106 @@
+"""Заполняет SQLite-базу тестовыми данными заданного размера.
+
+Запуск из корня репозитория:
+    python bench/seed.py bench.db --users 1000 --products 5000 --orders 20000 --items-per-order 3
+
+У всех пользователей пароль BENCH_PASSWORD, логины bench0, bench1, ..., telegram_id 100000 + номер.
+Заказы распределены по последним 30 дням, роллапы отчетов пересчитываются.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import use_backend
+
+BENCH_PASSWORD = 'bench-password'
+TELEGRAM_ID_BASE = 100000
+STATUSES = ['new', 'in_progress', 'completed', 'canceled']
+
+
+def seed_database(path, users=1000, products=5000, orders=20000, items_per_order=3, tokens=200, seed=1):
+    """Создает базу path и возвращает описание набора данных для сценариев нагрузки"""
+    use_backend(path)
+
+    from database import init_db, transaction, execute_query
+    from auth import hash_pswd, create_access_token
+    from reports import rebuild_rollups
+
+    rng = random.Random(seed)
+    init_db()
+
+    # bcrypt медленный - один хэш на всех пользователей
+    password_hash = hash_pswd(BENCH_PASSWORD)
+
+    with transaction() as conn:
+        conn.executemany(
+            'INSERT INTO users (username, email, first_name, last_name, password_hash, telegram_id) VALUES (?, ?, ?, ?, ?, ?)',
+            [
+                (f'bench{i}', f'bench{i}@example.com', 'Bench', f'User{i}', password_hash, str(TELEGRAM_ID_BASE + i))
+                for i in range(users)
+            ]
+        )
+        conn.executemany(
+            'INSERT INTO products (name, price, description, created_by) VALUES (?, ?, ?, ?)',
+            [
+                (f'Товар {i}', rng.randint(100, 500000), 'нагрузочный тест', rng.randint(1, users))
+                for i in range(products)
+            ]
+        )
+        conn.executemany(
+            "INSERT INTO orders (user_id, total_amount, status, created_at) VALUES (?, 0, ?, datetime('now', ?))",
+            [
+                (rng.randint(1, users), rng.choice(STATUSES), f'-{rng.randint(0, 30 * 24 * 60)} minutes')
+                for _ in range(orders)
+            ]
+        )
+        conn.executemany(
+            'INSERT INTO order_items (order_id, product_id, qty, price, product_name) SELECT ?, id, ?, price, name FROM products WHERE id = ?',
+            [
+                (order_id, rng.randint(1, 3), product_id)
+                for order_id in range(1, orders + 1)
+                for product_id in rng.sample(range(1, products + 1), min(items_per_order, products))
+            ]
+        )
+        conn.execute('''
+            UPDATE orders SET total_amount = (
+                SELECT COALESCE(SUM(qty * price), 0) FROM order_items WHERE order_id = orders.id
+            )
+        ''')
+        rebuild_rollups(conn)
+
+    # Весь WAL в основной файл - базу можно копировать как шаблон для каждого прогона
+    execute_query('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    return {
+        'users': users,
+        'products': products,
+        'orders': orders,
+        'items_per_order': items_per_order,
+        'password': BENCH_PASSWORD,
+        'telegram_id_base': TELEGRAM_ID_BASE,
+        'tokens': [create_access_token(rng.randint(1, users)) for _ in range(tokens)]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='файл базы (будет создан)')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--items-per-order', type=int, default=3)
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        parser.error(f'{args.path} уже существует')
+
+    dataset = seed_database(args.path, args.users, args.products, args.orders, args.items_per_order)
+    dataset.pop('tokens')
+    print(json.dumps(dataset, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Стресс-тест резервирования остатков: много потоков бьют в один горячий товар.
+
+Запуск из корня репозитория:
+    python bench/stock_contention.py --threads 32 --attempts 200 --stock 1000
+
+Скрипт завершается с ненулевым кодом, если остаток ушел в минус или не сошелся
+с числом успешных резервов.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BACK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'back')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--attempts', type=int, default=200, help='попыток резерва на поток')
+    parser.add_argument('--stock', type=int, default=1000, help='начальный остаток товара')
+    parser.add_argument('--qty', type=int, default=1, help='количество в одном резерве')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bobrshop-stock-')
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'stress.db')
+    sys.path.insert(0, BACK_DIR)
+
+    from database import init_db, execute_query, transaction
+    from inventory import InsufficientStockError, reserve_stock
+
+    init_db()
+    user_id = execute_query(
+        'INSERT INTO users (username, email, first_name, last_name, password_hash) VALUES (?, ?, ?, ?, ?)',
+        ('stress', 'stress@example.com', 'Stress', 'Test', '-'),
+        lastrowid=True
+    )
+    product_id = execute_query(
+        'INSERT INTO products (name, price, stock, created_by) VALUES (?, ?, ?, ?)',
+        ('Hot SKU', 10000, args.stock, user_id),
+        lastrowid=True
+    )
+
+    counters = {'reserved': 0, 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(args.threads)
+
+    def worker():
+        start_barrier.wait()
+        for _ in range(args.attempts):
+            try:
+                with transaction() as conn:
+                    order_id = conn.execute(
+                        'INSERT INTO orders (user_id, total_amount, status) VALUES (?, ?, ?)',
+                        (user_id, 10000 * args.qty, 'new')
+                    ).lastrowid
+                    reserve_stock(conn, order_id, product_id, args.qty)
+                    conn.execute(
+                        'INSERT INTO order_items (order_id, product_id, qty, price, product_name) VALUES (?, ?, ?, ?, ?)',
+                        (order_id, product_id, args.qty, 10000, 'Hot SKU')
+                    )
+                outcome = 'reserved'
+            except InsufficientStockError:
+                outcome = 'rejected'
+            except Exception:
+                outcome = 'errors'
+            with lock:
+                counters[outcome] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    final_stock = execute_query('SELECT stock FROM products WHERE id = ?', (product_id,), fetch_one=True)['stock']
+    reserved_qty = execute_query(
+        "SELECT COALESCE(SUM(qty), 0) AS qty FROM stock_reservations WHERE product_id = ? AND status = 'active'",
+        (product_id,),
+        fetch_one=True
+    )['qty']
+    orders_count = execute_query('SELECT COUNT(*) AS cnt FROM orders', fetch_one=True)['cnt']
+
+    expected_reserved = min(args.stock // args.qty, args.threads * args.attempts) * args.qty
+    ok = (
+        final_stock >= 0
+        and final_stock + reserved_qty == args.stock
+        and reserved_qty == expected_reserved
+        and orders_count == counters['reserved']
+        and counters['errors'] == 0
+    )
+
+    print(json.dumps({
+        'threads': args.threads,
+        'attempts': args.threads * args.attempts,
+        'initial_stock': args.stock,
+        'final_stock': final_stock,
+        'reserved_qty': reserved_qty,
+        'counters': counters,
+        'elapsed_sec': round(elapsed, 3),
+        'attempts_per_sec': round(args.threads * args.attempts / elapsed, 1),
+        'ok': ok
+    }, indent=2))
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
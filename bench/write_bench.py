@@ -0,0 +1,150 @@
+"""Пропускная способность записи заказов: поток-писатель с групповым коммитом против отдельных транзакций.
+
+Запуск из корня репозитория:
+    python bench/write_bench.py --writers 1 8 64 --duration 5 --output writes.json
+
+Каждый прогон - отдельный процесс с копией засеянной базы и writers потоками, которые без
+пауз создают заказы из бота (insert_telegram_order) одним из способов:
+    transaction - каждый заказ в своем transaction() (BEGIN IMMEDIATE ... COMMIT на заказ)
+    group       - write_transaction(): поток-писатель, DB_WRITE_BATCH_SIZE заказов на COMMIT
+Результат - JSON с заказами в секунду (rps), перцентилями задержки и ошибками.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import summarize, use_backend
+from seed import seed_database
+
+MODES = ['transaction', 'group']
+
+
+def run_writers(db_path, mode, writers, duration, context, env, queue):
+    """Процесс одного прогона: writers потоков создают заказы duration секунд"""
+    os.environ.update(env)
+    use_backend(db_path)
+    os.environ['LOG_LEVEL'] = 'ERROR'
+
+    from database import transaction, write_transaction
+    from telegram_api import insert_telegram_order
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def place(user_id, items):
+        if mode == 'group':
+            return write_transaction(insert_telegram_order, user_id, items)
+        with transaction() as conn:
+            return insert_telegram_order(conn, user_id, items)
+
+    def worker(index):
+        rng = random.Random(index)
+        local = []
+        local_errors = 0
+        while time.monotonic() < stop_at:
+            product_ids = rng.sample(range(1, context['products'] + 1), context['order_items'])
+            items = [{'product_id': product_id, 'quantity': rng.randint(1, 3)} for product_id in product_ids]
+            started = time.perf_counter()
+            try:
+                place(rng.randint(1, context['users']), items)
+            except Exception:
+                # Ошибки заказа и отказы базы (sqlite3.OperationalError: database is locked)
+                local_errors += 1
+                continue
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(writers)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    queue.put((sorted(latencies), errors[0]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, nargs='+', default=[1, 8, 64], help='потоков-писателей')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--orders', type=int, default=5000, help='заказов в засеянной базе')
+    parser.add_argument('--order-items', type=int, default=3, help='строк в создаваемых заказах')
+    parser.add_argument('--duration', type=float, default=5, help='секунд на прогон')
+    parser.add_argument('--batch-size', type=int, default=32, help='DB_WRITE_BATCH_SIZE для group')
+    parser.add_argument('--batch-window-ms', type=float, default=2, help='DB_WRITE_BATCH_WINDOW_MS для group')
+    parser.add_argument('--output', help='записать результат в файл')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bobrshop-writes-')
+    template = os.path.join(workdir, 'template.db')
+    env = {
+        'DB_WRITE_BATCH_SIZE': str(args.batch_size),
+        'DB_WRITE_BATCH_WINDOW_MS': str(args.batch_window_ms),
+        'QUERY_CHECK_MODE': 'off'
+    }
+
+    # Засев и прогоны - в отдельных процессах spawn: модули backend читают настройки при импорте
+    spawn = multiprocessing.get_context('spawn')
+    with spawn.Pool(1) as pool:
+        dataset = pool.apply(seed_database, (template, args.users, args.products, args.orders, 1))
+    context = {'users': args.users, 'products': args.products, 'order_items': args.order_items}
+
+    results = {}
+    try:
+        for writers in args.writers:
+            results[writers] = {}
+            for mode in args.modes:
+                db_path = os.path.join(workdir, f'{mode}-{writers}.db')
+                shutil.copyfile(template, db_path)
+
+                queue = spawn.Queue()
+                process = spawn.Process(
+                    target=run_writers,
+                    args=(db_path, mode, writers, args.duration, context, env, queue)
+                )
+                process.start()
+                latencies, errors = queue.get()
+                process.join()
+
+                results[writers][mode] = summarize(latencies, errors, args.duration)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    dataset.pop('tokens')
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': multiprocessing.cpu_count(),
+            'duration_s': args.duration,
+            'order_items': args.order_items,
+            'batch_size': args.batch_size,
+            'batch_window_ms': args.batch_window_ms,
+            'dataset': dataset
+        },
+        'writers': results
+    }
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
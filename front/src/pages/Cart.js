@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useTheme } from '../context/ThemeContext';
 
@@ -8,8 +8,14 @@ const CartItem = React.memo(({ item, onUpdateQuantity, onRemove }) => {
   return (
     <article className="card p-6 mb-4 flex flex-col sm:flex-row justify-between items-start sm:items-center gap-4 animate-slide-up dark:bg-gray-800 dark:border-gray-700">
       <div className="flex-1 min-w-0">
-        <h3 className="text-xl font-semibold text-gray-900 dark:text-white mb-2 truncate">{item.name}</h3>
+        <h3 className="text-xl font-semibold text-gray-900 dark:text-white mb-2 truncate">{item.name || 'Товар удален'}</h3>
         <p className="text-lg text-green-600 dark:text-green-400 font-bold">{item.price} ₽</p>
+        {item.price_changed && (
+          <p className="text-sm text-yellow-600 dark:text-yellow-400">Цена изменилась: было {item.added_price} ₽</p>
+        )}
+        {item.insufficient_stock && (
+          <p className="text-sm text-red-600 dark:text-red-400">В наличии только {item.stock} шт.</p>
+        )}
       </div>
       
       <div className="flex items-center gap-4 w-full sm:w-auto">
@@ -50,40 +56,54 @@ const CartItem = React.memo(({ item, onUpdateQuantity, onRemove }) => {
 
 const Cart = ({ token, user }) => {
   const [cart, setCart] = useState([]);
+  const [totalAmount, setTotalAmount] = useState(0);
   const [loading, setLoading] = useState(false);
   const [alert, setAlert] = useState(null);
   const navigate = useNavigate();
   const { theme } = useTheme();
+  // Один ключ на попытку оформления: повторная отправка не создаст дубль заказа
+  const idempotencyKeyRef = useRef(null);
+
+  // Корзина хранится на сервере: цены и наличие товаров проверяются одним запросом
+  const cartRequest = useCallback(async (path, options = {}) => {
+    try {
+      const response = await fetch(`http://localhost:5000/api/cart${path}`, {
+        ...options,
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${token}`
+        }
+      });
+      if (response.ok) {
+        const data = await response.json();
+        idempotencyKeyRef.current = null;
+        setCart(data.items);
+        setTotalAmount(data.total_amount);
+        if (data.problems.length > 0) {
+          setAlert({ type: 'error', message: 'Некоторые товары изменились или недоступны. Проверьте корзину.' });
+        }
+      }
+    } catch (error) {
+      console.error('Error updating cart:', error);
+      setAlert({ type: 'error', message: 'Ошибка при обновлении корзины' });
+    }
+  }, [token]);
 
   useEffect(() => {
-    const savedCart = JSON.parse(localStorage.getItem('cart') || '[]');
-    setCart(savedCart);
-  }, []);
+    cartRequest('');
+  }, [cartRequest]);
 
-  const updateCart = useCallback((newCart) => {
-    setCart(newCart);
-    localStorage.setItem('cart', JSON.stringify(newCart));
-  }, []);
+  const removeFromCart = useCallback((productId) => {
+    cartRequest(`/items/${productId}`, { method: 'DELETE' });
+  }, [cartRequest]);
 
   const updateQuantity = useCallback((productId, newQty) => {
     if (newQty < 1) {
       removeFromCart(productId);
       return;
     }
-    const updatedCart = cart.map(item => 
-      item.product_id === productId ? { ...item, qty: newQty } : item
-    );
-    updateCart(updatedCart);
-  }, [cart, updateCart]);
-
-  const removeFromCart = useCallback((productId) => {
-    const updatedCart = cart.filter(item => item.product_id !== productId);
-    updateCart(updatedCart);
-  }, [cart, updateCart]);
-
-  const getTotalAmount = useCallback(() => {
-    return cart.reduce((total, item) => total + (item.price * item.qty), 0);
-  }, [cart]);
+    cartRequest(`/items/${productId}`, { method: 'PUT', body: JSON.stringify({ qty: newQty }) });
+  }, [cartRequest, removeFromCart]);
 
   const createOrder = async () => {
     if (cart.length === 0) {
@@ -92,21 +112,18 @@ const Cart = ({ token, user }) => {
     }
 
     setLoading(true);
-    const orderData = {
-      items: cart.map(item => ({
-        product_id: item.product_id,
-        qty: item.qty
-      }))
-    };
+    if (!idempotencyKeyRef.current) {
+      idempotencyKeyRef.current = crypto.randomUUID();
+    }
 
     try {
-      const response = await fetch('http://localhost:5000/api/orders', {
+      const response = await fetch('http://localhost:5000/api/cart/checkout', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          'Authorization': `Bearer ${token}`
-        },
-        body: JSON.stringify(orderData)
+          'Authorization': `Bearer ${token}`,
+          'Idempotency-Key': idempotencyKeyRef.current
+        }
       });
 
       if (response.ok) {
@@ -115,11 +132,17 @@ const Cart = ({ token, user }) => {
           type: 'success', 
           message: `Заказ #${order.id} успешно создан! Сумма: ${order.total_amount} ₽` 
         });
+        idempotencyKeyRef.current = null;
         setCart([]);
-        localStorage.setItem('cart', '[]');
+        setTotalAmount(0);
         setTimeout(() => navigate('/orders'), 2000);
       } else {
         const error = await response.json();
+        if (error.cart) {
+          idempotencyKeyRef.current = null;
+          setCart(error.cart.items);
+          setTotalAmount(error.cart.total_amount);
+        }
         setAlert({ type: 'error', message: `Ошибка: ${error.error}` });
       }
     } catch (error) {
@@ -174,7 +197,7 @@ const Cart = ({ token, user }) => {
               <div className="space-y-4">
                 {cart.map(item => (
                   <CartItem
-                    key={item.product_id}
+                    key={item.product_id ?? `${item.name}:${item.price}`}
                     item={item}
                     onUpdateQuantity={updateQuantity}
                     onRemove={removeFromCart}
@@ -187,7 +210,7 @@ const Cart = ({ token, user }) => {
             <section className="card p-6 bg-gradient-to-r from-green-50 to-blue-50 dark:from-green-900/20 dark:to-blue-900/20 border-2 border-green-200 dark:border-green-700">
               <div className="text-center">
                 <h2 className="text-3xl font-bold text-gray-900 dark:text-white mb-4">
-                  Итого: {getTotalAmount()} ₽
+                  Итого: {totalAmount} ₽
                 </h2>
                 <button 
                   className="btn btn-success w-full py-4 text-lg font-bold transform hover:scale-105 transition-transform"
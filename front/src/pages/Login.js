@@ -27,6 +27,8 @@ const Login = ({ onLogin }) => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          // Витрина магазина: до входа магазин задается заголовком, после - берется из токена
+          ...(process.env.REACT_APP_SHOP && { 'X-Shop': process.env.REACT_APP_SHOP }),
         },
         body: JSON.stringify(formData),
       });
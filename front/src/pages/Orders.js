@@ -1,6 +1,9 @@
 import React, { useState, useEffect, useCallback } from 'react';
 import { useTheme } from '../context/ThemeContext';
 
+// Ленту /api/events отдает асинхронное приложение (back/asgi.py)
+const EVENTS_URL = process.env.REACT_APP_EVENTS_URL || 'http://localhost:5001';
+
 const OrderCard = React.memo(({ order, isSelected, onClick, onStatusUpdate }) => {
   const { theme } = useTheme();
   
@@ -141,6 +144,73 @@ const Orders = ({ token, user }) => {
     fetchOrders();
   }, [fetchOrders]);
 
+  // Изменения заказов приходят из ленты /api/events - список не перезапрашивается целиком.
+  // При переподключении браузер сам передает Last-Event-ID и получает пропущенные события.
+  // В URL идет не JWT, а короткий токен ленты: когда он истек, сервер отвечает 401,
+  // браузер закрывает ленту, и она открывается заново с новым токеном и last_event_id.
+  useEffect(() => {
+    let source = null;
+    let stopped = false;
+    let lastEventId = 0;
+
+    const connect = async () => {
+      try {
+        const response = await fetch('http://localhost:5000/api/events/token', {
+          method: 'POST',
+          headers: { 'Authorization': `Bearer ${token}` }
+        });
+        if (!response.ok || stopped) {
+          return;
+        }
+        const { token: streamToken } = await response.json();
+        source = new EventSource(
+          `${EVENTS_URL}/api/events?token=${encodeURIComponent(streamToken)}&last_event_id=${lastEventId}`
+        );
+      } catch (error) {
+        console.error('Error opening events stream:', error);
+        if (!stopped) {
+          setTimeout(connect, 3000);
+        }
+        return;
+      }
+
+      source.addEventListener('order', handleOrderEvent);
+      source.addEventListener('reset', (e) => {
+        lastEventId = Number(e.lastEventId) || lastEventId;
+        fetchOrders();
+      });
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED && !stopped) {
+          setTimeout(connect, 3000);
+        }
+      };
+    };
+
+    const handleOrderEvent = (e) => {
+      lastEventId = Number(e.lastEventId) || lastEventId;
+      const { data: changed } = JSON.parse(e.data);
+      if (changed.buyer_id !== user?.id) {
+        return;
+      }
+      const { buyer_id, old_status, ...order } = changed;
+
+      setOrders(prev => prev.some(item => item.id === order.id)
+        ? prev.map(item => item.id === order.id ? { ...item, ...order } : item)
+        : [order, ...prev]
+      );
+      setSelectedOrder(prev => prev && prev.id === order.id ? { ...prev, status: order.status } : prev);
+    };
+
+    connect();
+
+    return () => {
+      stopped = true;
+      if (source) {
+        source.close();
+      }
+    };
+  }, [token, user, fetchOrders]);
+
   if (loading) {
     return (
       <div className="min-h-screen bg-gradient-to-br from-gray-50 to-gray-100 dark:from-gray-900 dark:to-gray-800 py-8">
@@ -154,9 +154,13 @@ const ProductForm = React.memo(({ showForm, editingProduct, formData, onClose, o
   );
 });
 
+const PRODUCTS_PAGE_SIZE = 50;
+
 const Products = ({ token, user }) => {
-  const [products, setProducts] = useState([]);
   const [allProducts, setAllProducts] = useState([]);
+  const [overview, setOverview] = useState({ page: 0, total: 0, my_count: 0, has_more: false });
+  const [myProducts, setMyProducts] = useState([]);
+  const [myOverview, setMyOverview] = useState({ page: 0, has_more: false });
   const [loading, setLoading] = useState(false);
   const [alert, setAlert] = useState(null);
   const [showForm, setShowForm] = useState(false);
@@ -168,17 +172,26 @@ const Products = ({ token, user }) => {
   });
   const { theme } = useTheme();
 
-  const fetchMyProducts = useCallback(async () => {
+  // Каталог и "мои товары" листаются отдельно: свои товары продавца могут быть за пределами
+  // загруженных страниц каталога, поэтому они читаются с mine=1, а не фильтруются из общего списка
+  const fetchOverview = useCallback(async (page = 1, mine = false) => {
     setLoading(true);
     try {
-      const response = await fetch('http://localhost:5000/api/products', {
+      const response = await fetch(`http://localhost:5000/api/products/overview?page=${page}&per_page=${PRODUCTS_PAGE_SIZE}${mine ? '&mine=1' : ''}`, {
         headers: {
           'Authorization': `Bearer ${token}`
         }
       });
       if (response.ok) {
         const data = await response.json();
-        setProducts(data);
+        const setList = mine ? setMyProducts : setAllProducts;
+        setList(prev => page === 1 ? data.products : [...prev, ...data.products]);
+        if (mine) {
+          setMyOverview({ page: data.page, has_more: data.has_more });
+          setOverview(prev => ({ ...prev, my_count: data.my_count }));
+        } else {
+          setOverview({ page: data.page, total: data.total, my_count: data.my_count, has_more: data.has_more });
+        }
       }
     } catch (error) {
       console.error('Error fetching products:', error);
@@ -187,50 +200,55 @@ const Products = ({ token, user }) => {
     setLoading(false);
   }, [token]);
 
-  const fetchAllProducts = useCallback(async () => {
-    try {
-      const response = await fetch('http://localhost:5000/api/products/all', {
-        headers: {
-          'Authorization': `Bearer ${token}`
-        }
-      });
-      if (response.ok) {
-        const data = await response.json();
-        setAllProducts(data);
-      }
-    } catch (error) {
-      console.error('Error fetching all products:', error);
+  useEffect(() => {
+    fetchOverview(1);
+    fetchOverview(1, true);
+  }, [fetchOverview]);
+
+  // После изменений сервер возвращает сам товар - применяем дельту без перезагрузки каталога
+  const applyProductDelta = useCallback((product, isNew) => {
+    if (isNew) {
+      setAllProducts(prev => [product, ...prev]);
+      setMyProducts(prev => [product, ...prev]);
+      setOverview(prev => ({ ...prev, total: prev.total + 1, my_count: prev.my_count + 1 }));
+    } else {
+      setAllProducts(prev => prev.map(item => item.id === product.id ? product : item));
+      setMyProducts(prev => prev.map(item => item.id === product.id ? product : item));
     }
-  }, [token]);
+  }, []);
 
-  useEffect(() => {
-    fetchMyProducts();
-    fetchAllProducts();
-  }, [fetchMyProducts, fetchAllProducts]);
+  const removeProductDelta = useCallback((productId) => {
+    setAllProducts(prev => prev.filter(item => item.id !== productId));
+    setMyProducts(prev => prev.filter(item => item.id !== productId));
+    setOverview(prev => ({ ...prev, total: prev.total - 1, my_count: prev.my_count - 1 }));
+  }, []);
 
   const showAlert = useCallback((message, type = 'info') => {
     setAlert({ message, type });
     setTimeout(() => setAlert(null), 5000);
   }, []);
 
-  const addToCart = useCallback((product) => {
-    const cart = JSON.parse(localStorage.getItem('cart') || '[]');
-    const existingItem = cart.find(item => item.product_id === product.id);
-    
-    if (existingItem) {
-      existingItem.qty += 1;
-    } else {
-      cart.push({
-        product_id: product.id,
-        name: product.name,
-        price: product.price,
-        qty: 1
+  const addToCart = useCallback(async (product) => {
+    try {
+      const response = await fetch('http://localhost:5000/api/cart/items', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${token}`
+        },
+        body: JSON.stringify({ product_id: product.id, qty: 1 })
       });
+      if (response.ok) {
+        showAlert('Товар добавлен в корзину!', 'success');
+      } else {
+        const error = await response.json();
+        showAlert(`Ошибка: ${error.error}`, 'error');
+      }
+    } catch (error) {
+      console.error('Error adding to cart:', error);
+      showAlert('Ошибка при добавлении в корзину', 'error');
     }
-    
-    localStorage.setItem('cart', JSON.stringify(cart));
-    showAlert('Товар добавлен в корзину!', 'success');
-  }, [showAlert]);
+  }, [token, showAlert]);
 
   const handleFormChange = useCallback((e) => {
     const { name, value } = e.target;
@@ -265,12 +283,12 @@ const Products = ({ token, user }) => {
       });
 
       if (response.ok) {
+        const data = await response.json();
+        applyProductDelta(editingProduct ? data.product : data, !editingProduct);
         setShowForm(false);
         setEditingProduct(null);
         setFormData({ name: '', price: '', description: '' });
         showAlert(editingProduct ? 'Товар успешно обновлен' : 'Товар успешно создан', 'success');
-        fetchMyProducts();
-        fetchAllProducts();
       } else {
         const error = await response.json();
         showAlert(error.error, 'error');
@@ -293,9 +311,8 @@ const Products = ({ token, user }) => {
       });
       
       if (response.ok) {
+        removeProductDelta(productId);
         showAlert('Товар успешно удален', 'success');
-        fetchMyProducts();
-        fetchAllProducts();
       } else {
         const error = await response.json();
         showAlert(error.error, 'error');
@@ -357,6 +374,7 @@ const Products = ({ token, user }) => {
         <section className="mb-12">
           <header className="flex items-center justify-between mb-6">
             <h2 className="text-2xl font-bold text-gray-900 dark:text-white">Все товары</h2>
+            <span className="text-gray-600 dark:text-gray-400">{allProducts.length} из {overview.total}</span>
           </header>
           
           {allProducts.length === 0 ? (
@@ -380,12 +398,24 @@ const Products = ({ token, user }) => {
               ))}
             </div>
           )}
+
+          {overview.has_more && (
+            <div className="text-center mt-6">
+              <button
+                onClick={() => fetchOverview(overview.page + 1)}
+                disabled={loading}
+                className="btn btn-secondary"
+              >
+                Показать еще
+              </button>
+            </div>
+          )}
         </section>
 
         {/* My Products Section */}
         <section>
           <header className="flex items-center justify-between mb-6">
-            <h2 className="text-2xl font-bold text-gray-900 dark:text-white">Мои товары</h2>
+            <h2 className="text-2xl font-bold text-gray-900 dark:text-white">Мои товары ({overview.my_count})</h2>
             <button 
               onClick={() => setShowForm(true)}
               className="btn btn-success"
@@ -403,7 +433,7 @@ const Products = ({ token, user }) => {
             onChange={handleFormChange}
           />
 
-          {products.length === 0 ? (
+          {myProducts.length === 0 ? (
             <div className="card p-8 text-center dark:bg-gray-800 dark:border-gray-700">
               <div className="text-6xl mb-4">🛍️</div>
               <h3 className="text-xl font-bold text-gray-900 dark:text-white mb-2">У вас пока нет товаров</h3>
@@ -417,7 +447,7 @@ const Products = ({ token, user }) => {
             </div>
           ) : (
             <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
-              {products.map(product => (
+              {myProducts.map(product => (
                 <ProductCard
                   key={product.id}
                   product={product}
@@ -430,6 +460,18 @@ const Products = ({ token, user }) => {
               ))}
             </div>
           )}
+
+          {myOverview.has_more && (
+            <div className="text-center mt-6">
+              <button
+                onClick={() => fetchOverview(myOverview.page + 1, true)}
+                disabled={loading}
+                className="btn btn-secondary"
+              >
+                Показать еще
+              </button>
+            </div>
+          )}
         </section>
       </div>
     </div>
@@ -1,27 +1,34 @@
+import html
 import os
 import logging
-from aiogram import Bot, Dispatcher, types, F
+from collections import OrderedDict
+from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command
 from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
 from aiogram.enums import ParseMode
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 import asyncio
+import uuid
 import aiohttp
 from dotenv import load_dotenv
+from task_timing import setup_task_timing
 
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Логирование в формате backend (logs.py - копия back/logs.py): JSON-строки в stdout через фоновый
+# поток. У каждого апдейта свой request_id, он же уходит в backend заголовком X-Request-ID.
+from logs import REQUEST_ID_HEADER, current_request_id, new_request_id, set_request_id, setup_logging
+
+setup_logging(levels={"aiogram.event": "WARNING"})
 logger = logging.getLogger(__name__)
 
 # Конфигурация
-API_URL = "http://localhost:5000"
+# API бота можно обслуживать отдельным ASGI-приложением (back/asgi.py), например на :5001
+API_URL = os.getenv("API_URL", "http://localhost:5000")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+ORDER_CREATE_ATTEMPTS = 3
+SYNC_CACHE_SIZE = int(os.getenv("SYNC_CACHE_SIZE", 1000))
 
 if not BOT_TOKEN:
     logger.error("BOT_TOKEN environment variable is not set!")
@@ -33,6 +40,9 @@ dp = Dispatcher()
 # Хранилище данных пользователей
 user_pages = {}
 user_products = {}
+# Кэш товаров и заказов по telegram_id, догоняется через /api/telegram/sync.
+# Не больше SYNC_CACHE_SIZE пользователей: давно не писавший вытесняется и при возвращении синхронизируется заново
+sync_cache = OrderedDict()
 
 # Состояния для создания заказа
 class CreateOrderStates(StatesGroup):
@@ -44,38 +54,102 @@ class CreateOrderStates(StatesGroup):
     waiting_for_confirmation = State()
     selecting_existing_product = State()
 
-async def make_api_request(url, params=None, method="GET", json_data=None):
+async def make_api_request(url, params=None, method="GET", json_data=None, headers=None):
     """Универсальная функция для API запросов"""
+    headers = dict(headers or {})
+    headers[REQUEST_ID_HEADER] = current_request_id() or new_request_id()
     try:
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(headers=headers) as session:
             if method == "GET":
                 async with session.get(url, params=params) as response:
-                    logger.info(f"GET запрос к {url}, статус: {response.status}")
+                    logger.debug("api request", extra={"method": method, "url": url, "status": response.status})
                     if response.status == 200:
                         return await response.json()
                     else:
                         error_data = await response.text()
-                        logger.error(f"API error: {error_data}")
+                        logger.error("api error", extra={"method": method, "url": url, "status": response.status, "error": error_data[:500]})
                         return None
             elif method == "POST":
                 async with session.post(url, json=json_data) as response:
-                    logger.info(f"POST запрос к {url}, статус: {response.status}")
+                    logger.debug("api request", extra={"method": method, "url": url, "status": response.status})
                     if response.status in [200, 201]:
                         return await response.json()
                     else:
                         error_data = await response.text()
-                        logger.error(f"API error: {error_data}")
+                        logger.error("api error", extra={"method": method, "url": url, "status": response.status, "error": error_data[:500]})
+                        return None
+            elif method == "DELETE":
+                async with session.delete(url, params=params) as response:
+                    logger.debug("api request", extra={"method": method, "url": url, "status": response.status})
+                    if response.status == 200:
+                        return await response.json()
+                    else:
+                        error_data = await response.text()
+                        logger.error("api error", extra={"method": method, "url": url, "status": response.status, "error": error_data[:500]})
                         return None
     except aiohttp.ClientConnectorError as e:
-        logger.error(f"Connection error: {e}")
+        logger.error("api connection error", extra={"url": url, "error": str(e)})
         return None
-    except asyncio.TimeoutError as e:
-        logger.error(f"Timeout error: {e}")
+    except asyncio.TimeoutError:
+        logger.error("api timeout", extra={"url": url})
         return None
-    except Exception as e:
-        logger.error(f"Request error: {e}")
+    except Exception:
+        logger.exception("api request failed", extra={"url": url})
         return None
 
+async def api_post(url, json_data, headers=None):
+    """POST с ответом как есть: (статус, JSON-тело); статус None - ответа нет (сеть, таймаут)"""
+    headers = dict(headers or {})
+    headers[REQUEST_ID_HEADER] = current_request_id() or new_request_id()
+    try:
+        async with aiohttp.ClientSession(headers=headers) as session:
+            async with session.post(url, json=json_data) as response:
+                logger.debug("api request", extra={"method": "POST", "url": url, "status": response.status})
+                try:
+                    body = await response.json(content_type=None)
+                except ValueError:
+                    body = None
+                if response.status >= 400:
+                    logger.error("api error", extra={"method": "POST", "url": url, "status": response.status, "error": str(body)[:500]})
+                return response.status, body if isinstance(body, dict) else {}
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error("api connection error", extra={"url": url, "error": str(e)})
+        return None, None
+
+async def sync_user_data(telegram_id):
+    """Догоняет кэш пользователя до текущей версии сервера, запрашивая только изменения"""
+    cache = sync_cache.get(telegram_id) or {'version': 0, 'products': {}, 'orders': {}}
+    
+    changes = await make_api_request(
+        f"{API_URL}/api/telegram/sync",
+        params={"telegram_id": telegram_id, "since": cache['version']}
+    )
+    
+    if not changes:
+        return None
+    
+    if changes['full_resync']:
+        cache = {'version': 0, 'products': {}, 'orders': {}}
+    
+    for product in changes['products']:
+        cache['products'][product['id']] = product
+    for order in changes['orders']:
+        cache['orders'][order['id']] = order
+    for product_id in changes['deleted']['products']:
+        cache['products'].pop(product_id, None)
+    for order_id in changes['deleted']['orders']:
+        cache['orders'].pop(order_id, None)
+    
+    cache['version'] = changes['version']
+    sync_cache[telegram_id] = cache
+    sync_cache.move_to_end(telegram_id)
+    while len(sync_cache) > SYNC_CACHE_SIZE:
+        sync_cache.popitem(last=False)
+    return cache
+
+def newest_first(items):
+    return sorted(items, key=lambda item: (item['created_at'], item['id']), reverse=True)
+
 def create_pagination_keyboard(page, total_pages):
     """Создает клавиатуру для пагинации"""
     keyboard = []
@@ -131,6 +205,70 @@ def format_orders_page(orders, page, total_pages, total_orders):
     
     return message_text
 
+def format_cart_summary(cart):
+    """Форматирует содержимое корзины для подтверждения заказа"""
+    message_text = "🛒 <b>Ваша корзина</b>\n\n"
+    
+    for item in cart['items']:
+        message_text += f"📝 <b>{item['name']}</b>\n"
+        message_text += f"   {item['price']} руб. × {item['qty']} = {round(item['price'] * item['qty'], 2)} руб.\n"
+    
+    message_text += f"\n💵 <b>Общая сумма:</b> {cart['total_amount']} руб.\n\n"
+    message_text += "Оформить заказ или добавить еще товар?"
+    
+    return message_text
+
+def create_cart_keyboard():
+    """Клавиатура подтверждения заказа из корзины"""
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text="✅ Оформить заказ", callback_data="confirm_order"),
+                InlineKeyboardButton(text="➕ Добавить товар", callback_data="add_more")
+            ],
+            [
+                InlineKeyboardButton(text="❌ Очистить корзину", callback_data="cancel_order")
+            ]
+        ]
+    )
+
+def create_product_type_keyboard():
+    """Клавиатура выбора типа товара"""
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text="🛍️ Выбрать существующий товар", callback_data="select_existing"),
+                InlineKeyboardButton(text="➕ Создать новый товар", callback_data="create_new")
+            ]
+        ]
+    )
+
+async def add_item_to_cart(message: Message, state: FSMContext, item):
+    """Кладет товар в серверную корзину и показывает ее содержимое"""
+    cart = await make_api_request(
+        f"{API_URL}/api/telegram/cart/items",
+        method="POST",
+        json_data={"telegram_id": message.from_user.id, **item}
+    )
+    
+    if not cart:
+        await message.answer(
+            "❌ <b>Не удалось добавить товар в корзину</b>\n\n"
+            "Попробуйте еще раз командой /create_order",
+            parse_mode=ParseMode.HTML
+        )
+        await state.clear()
+        return
+    
+    # Новый ключ на каждое подтверждение: состав корзины мог измениться
+    await state.update_data(idempotency_key=uuid.uuid4().hex)
+    await message.answer(
+        format_cart_summary(cart),
+        parse_mode=ParseMode.HTML,
+        reply_markup=create_cart_keyboard()
+    )
+    await state.set_state(CreateOrderStates.waiting_for_confirmation)
+
 def get_status_emoji(status):
     """Возвращает emoji для статуса заказа"""
     emoji_map = {
@@ -166,6 +304,7 @@ async def cmd_start(message: Message):
 /orders - Мои заказы
 /create_order - Создать новый заказ
 /profile - Информация о профиле
+/stats - Статистика продаж
 /help - Помощь
 
 🔗 Для начала привяжите ваш аккаунт с помощью команды /link
@@ -184,6 +323,7 @@ async def cmd_help(message: Message):
 /orders - Показать все заказы 
 /create_order - Создать новый заказ
 /profile - Информация о профиле
+/stats [дни] - Статистика продаж ваших товаров
 /help - Эта справка
 
 💡 <b>Как привязать аккаунт:</b>
@@ -250,21 +390,11 @@ async def cmd_create_order(message: Message, state: FSMContext):
         )
         return
     
-    products_data = await make_api_request(
-        f"{API_URL}/api/telegram/products",
-        params={"telegram_id": telegram_id}
-    )
+    cache = await sync_user_data(telegram_id)
     
-    user_products[telegram_id] = products_data if products_data else []
+    user_products[telegram_id] = newest_first(cache['products'].values()) if cache else []
     
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="🛍️ Выбрать существующий товар", callback_data="select_existing"),
-                InlineKeyboardButton(text="➕ Создать новый товар", callback_data="create_new")
-            ]
-        ]
-    )
+    keyboard = create_product_type_keyboard()
     
     await message.answer(
         "🛍️ <b>Создание нового заказа</b>\n\n"
@@ -329,6 +459,7 @@ async def process_product_selection(callback: CallbackQuery, state: FSMContext):
         return
     
     await state.update_data(
+        product_id=selected_product['id'],
         product_name=selected_product['name'],
         price=selected_product['price'],
         description=selected_product.get('description', ''),
@@ -346,14 +477,7 @@ async def process_product_selection(callback: CallbackQuery, state: FSMContext):
 @dp.callback_query(F.data == "back_to_choice", CreateOrderStates.selecting_existing_product)
 async def process_back_to_choice(callback: CallbackQuery, state: FSMContext):
     """Обработчик возврата к выбору типа товара"""
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="🛍️ Выбрать существующий товар", callback_data="select_existing"),
-                InlineKeyboardButton(text="➕ Создать новый товар", callback_data="create_new")
-            ]
-        ]
-    )
+    keyboard = create_product_type_keyboard()
     
     await callback.message.edit_text(
         "🛍️ <b>Создание нового заказа</b>\n\n"
@@ -376,7 +500,7 @@ async def process_create_new(callback: CallbackQuery, state: FSMContext):
 @dp.message(CreateOrderStates.waiting_for_product_name)
 async def process_product_name(message: Message, state: FSMContext):
     """Обработчик ввода названия товара"""
-    await state.update_data(product_name=message.text, is_existing_product=False)
+    await state.update_data(product_id=None, product_name=message.text, is_existing_product=False)
     
     await message.answer(
         f"📝 <b>Товар:</b> {message.text}\n\n"
@@ -400,31 +524,10 @@ async def process_quantity(message: Message, state: FSMContext):
     data = await state.get_data()
     
     if data.get('is_existing_product'):
-        price = data['price']
-        total_amount = price * quantity
-        
-        await state.update_data(quantity=quantity, total_amount=total_amount)
-        
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [
-                    InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_order"),
-                    InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_order")
-                ]
-            ]
-        )
-        
-        await message.answer(
-            f"🛍️ <b>Подтверждение заказа</b>\n\n"
-            f"📝 <b>Товар:</b> {data['product_name']}\n"
-            f"🔢 <b>Количество:</b> {quantity}\n"
-            f"💰 <b>Цена за единицу:</b> {price} руб.\n"
-            f"💵 <b>Общая сумма:</b> {total_amount} руб.\n\n"
-            f"Подтверждаете создание заказа?",
-            parse_mode=ParseMode.HTML,
-            reply_markup=keyboard
-        )
-        await state.set_state(CreateOrderStates.waiting_for_confirmation)
+        await add_item_to_cart(message, state, {
+            "product_id": data['product_id'],
+            "quantity": quantity
+        })
     else:
         await state.update_data(quantity=quantity)
         
@@ -469,104 +572,103 @@ async def process_description(message: Message, state: FSMContext):
     """Обработчик ввода описания товара"""
     description = message.text if message.text.lower() != 'нет' else ''
     
-    await state.update_data(description=description)
-    
     data = await state.get_data()
-    product_name = data['product_name']
-    quantity = data['quantity']
-    price = data['price']
-    total_amount = data['total_amount']
     
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_order"),
-                InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_order")
-            ]
-        ]
-    )
-    
-    message_text = f"🛍️ <b>Подтверждение заказа</b>\n\n"
-    message_text += f"📝 <b>Товар:</b> {product_name}\n"
-    message_text += f"🔢 <b>Количество:</b> {quantity}\n"
-    message_text += f"💰 <b>Цена за единицу:</b> {price} руб.\n"
-    if description:
-        message_text += f"📄 <b>Описание:</b> {description}\n"
-    message_text += f"💵 <b>Общая сумма:</b> {total_amount} руб.\n\n"
-    message_text += f"Подтверждаете создание заказа?"
-    
-    await message.answer(
-        message_text,
-        parse_mode=ParseMode.HTML,
-        reply_markup=keyboard
-    )
-    await state.set_state(CreateOrderStates.waiting_for_confirmation)
+    await add_item_to_cart(message, state, {
+        "product_name": data['product_name'],
+        "price": data['price'],
+        "quantity": data['quantity'],
+        "description": description
+    })
 
 @dp.callback_query(F.data == "confirm_order", CreateOrderStates.waiting_for_confirmation)
 async def process_order_confirmation(callback: CallbackQuery, state: FSMContext):
-    """Обработчик подтверждения заказа"""
+    """Обработчик оформления заказа из корзины"""
     data = await state.get_data()
     telegram_id = callback.from_user.id
     
-    order_data = {
-        "telegram_id": telegram_id,
-        "items": [
-            {
-                "product_name": data['product_name'],
-                "quantity": data['quantity'],
-                "price": data['price'],
-                "total": data['total_amount']
-            }
-        ],
-        "total_amount": data['total_amount']
-    }
-    
-    if data.get('description'):
-        order_data['items'][0]['description'] = data['description']
-    
-    logger.info(f"Отправка данных заказа: {order_data}")
-    
-    response = await make_api_request(
-        f"{API_URL}/api/telegram/create-order",
-        method="POST",
-        json_data=order_data
-    )
+    # Тот же ключ повторяется только без ответа или после 5xx: сервер вернет уже созданный
+    # заказ вместо дубликата. Ответ 4xx окончателен - следующая попытка идет с новым ключом
+    headers = {"Idempotency-Key": data['idempotency_key']}
+    status, response = None, None
+    for attempt in range(1, ORDER_CREATE_ATTEMPTS + 1):
+        status, response = await api_post(
+            f"{API_URL}/api/telegram/cart/checkout",
+            {"telegram_id": telegram_id},
+            headers=headers
+        )
+        if status is not None and status < 500:
+            break
+        if attempt < ORDER_CREATE_ATTEMPTS:
+            logger.warning("order checkout retry", extra={"attempt": attempt + 1})
+            await asyncio.sleep(attempt)
     
-    logger.info(f"Ответ от сервера: {response}")
+    if status is not None and 400 <= status < 500:
+        await state.update_data(idempotency_key=uuid.uuid4().hex)
     
-    if response and response.get('success'):
+    if status in (200, 201) and response.get('success'):
         order_id = response.get('order_id', 'N/A')
-        message_text = f"✅ <b>Заказ успешно создан!</b>\n\n"
+        logger.info("order created", extra={"order_id": order_id, "telegram_id": telegram_id})
+        message_text = "✅ <b>Заказ успешно создан!</b>\n\n"
         message_text += f"🆔 <b>Номер заказа:</b> #{order_id}\n"
-        message_text += f"📝 <b>Товар:</b> {data['product_name']}\n"
-        message_text += f"🔢 <b>Количество:</b> {data['quantity']}\n"
-        message_text += f"💰 <b>Цена за единицу:</b> {data['price']} руб.\n"
-        if data.get('description'):
-            message_text += f"📄 <b>Описание:</b> {data['description']}\n"
-        message_text += f"💵 <b>Общая сумма:</b> {data['total_amount']} руб.\n\n"
-        message_text += f"Вы можете просмотреть все свои заказы с помощью команды /orders"
+        for item in response.get('items', []):
+            message_text += f"📝 <b>{item['product_name']}</b> - {item['quantity']} шт. × {item['price']} руб.\n"
+        message_text += f"💵 <b>Общая сумма:</b> {response['total_amount']} руб.\n\n"
+        message_text += "Вы можете просмотреть все свои заказы с помощью команды /orders"
         
         await callback.message.edit_text(
             message_text,
             parse_mode=ParseMode.HTML
         )
     else:
-        error_msg = response.get('error', 'Неизвестная ошибка') if response else 'Ошибка соединения с сервером'
-        logger.error(f"Ошибка при создании заказа: {error_msg}")
+        if status is not None and status < 500:
+            # Сервер отказал (корзина устарела, не хватает товара): заказа нет, показываем причину
+            error_msg = response.get('error') or 'Неизвестная ошибка'
+            # При 409 сервер уже обновил корзину и прислал ее актуальный вид
+            note = format_cart_summary(response['cart']) if response.get('cart') else "Проверьте корзину и попробуйте еще раз."
+        else:
+            error_msg = 'Ошибка соединения с сервером' if status is None else 'Ошибка сервера'
+            note = ("⚠️ <i>Заказ мог быть создан, но мы не получили подтверждение от сервера.</i>\n"
+                    "Повтор безопасен: дубликат заказа создан не будет.")
+        logger.error("order checkout failed", extra={"error": error_msg, "status": status, "telegram_id": telegram_id})
+        keyboard = InlineKeyboardMarkup(
+            inline_keyboard=[
+                [
+                    InlineKeyboardButton(text="🔁 Повторить", callback_data="confirm_order"),
+                    InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_order")
+                ]
+            ]
+        )
         await callback.message.edit_text(
-            f"❌ <b>Ошибка при создании заказа:</b> {error_msg}\n\n"
-            f"⚠️ <i>Заказ мог быть создан, но мы не получили подтверждение от сервера.</i>\n"
-            f"Проверьте ваши заказы с помощью команды /orders",
-            parse_mode=ParseMode.HTML
+            f"❌ <b>Ошибка при создании заказа:</b> {html.escape(error_msg)}\n\n{note}",
+            parse_mode=ParseMode.HTML,
+            reply_markup=keyboard
         )
+        return
     
     await state.clear()
 
+@dp.callback_query(F.data == "add_more", CreateOrderStates.waiting_for_confirmation)
+async def process_add_more(callback: CallbackQuery, state: FSMContext):
+    """Обработчик добавления еще одного товара в корзину"""
+    await callback.message.edit_text(
+        "🛍️ <b>Добавление товара в заказ</b>\n\n"
+        "Выберите тип товара:",
+        parse_mode=ParseMode.HTML,
+        reply_markup=create_product_type_keyboard()
+    )
+    await state.set_state(CreateOrderStates.choosing_product_type)
+
 @dp.callback_query(F.data == "cancel_order", CreateOrderStates.waiting_for_confirmation)
 async def process_order_cancellation(callback: CallbackQuery, state: FSMContext):
     """Обработчик отмены заказа"""
+    await make_api_request(
+        f"{API_URL}/api/telegram/cart",
+        params={"telegram_id": callback.from_user.id},
+        method="DELETE"
+    )
     await callback.message.edit_text(
-        "❌ <b>Создание заказа отменено</b>",
+        "❌ <b>Создание заказа отменено, корзина очищена</b>",
         parse_mode=ParseMode.HTML
     )
     await state.clear()
@@ -576,26 +678,17 @@ async def cmd_orders(message: Message):
     """Обработчик команды /orders для показа заказов"""
     telegram_id = message.from_user.id
     
-    orders_data = await make_api_request(
-        f"{API_URL}/api/telegram/orders",
-        params={"telegram_id": telegram_id}
-    )
+    cache = await sync_user_data(telegram_id)
     
-    if not orders_data:
+    if cache is None:
         await message.answer(
-            "❌ <b>Ошибка соединения с сервером</b>\n\n"
-            "Попробуйте позже или обратитесь к администратору.",
+            "❌ <b>Не удалось загрузить заказы</b>\n\n"
+            "Проверьте, что аккаунт привязан (/link), или попробуйте позже.",
             parse_mode=ParseMode.HTML
         )
         return
     
-    if isinstance(orders_data, dict) and 'error' in orders_data:
-        await message.answer(
-            "❌ <b>Аккаунт не привязан!</b>\n\n"
-            "Используйте команду /link для привязки аккаунта.",
-            parse_mode=ParseMode.HTML
-        )
-        return
+    orders_data = newest_first(cache['orders'].values())
     
     if not orders_data:
         await message.answer(
@@ -680,15 +773,6 @@ async def cmd_profile(message: Message):
         )
         return
     
-    all_orders = await make_api_request(
-        f"{API_URL}/api/telegram/orders",
-        params={"telegram_id": telegram_id}
-    )
-    
-    total_amount_all_orders = 0
-    if all_orders and not isinstance(all_orders, dict):
-        total_amount_all_orders = sum(order['total_amount'] for order in all_orders)
-    
     orders = user_data.get('orders', [])
     
     profile_text = f"""
@@ -697,7 +781,7 @@ async def cmd_profile(message: Message):
 📧 Email: {user_data['email']}
 👨‍💼 Имя: {user_data['first_name']} {user_data['last_name']}
 📦 Всего заказов: {len(orders)}
-💳 Сумма всех заказов: {total_amount_all_orders} руб.
+💳 Сумма всех заказов: {user_data['total_all_orders']} руб.
 
 💡 <b>Последние действия:</b>
 """
@@ -717,6 +801,42 @@ async def cmd_profile(message: Message):
     
     await message.answer(profile_text, parse_mode=ParseMode.HTML)
 
+@dp.message(Command("stats"))
+async def cmd_stats(message: Message):
+    """Обработчик команды /stats для статистики продавца"""
+    telegram_id = message.from_user.id
+    args = message.text.split()
+    days = int(args[1]) if len(args) > 1 and args[1].isdigit() else 7
+    
+    stats = await make_api_request(
+        f"{API_URL}/api/telegram/stats",
+        params={"telegram_id": telegram_id, "days": days}
+    )
+    
+    if not stats:
+        await message.answer(
+            "❌ <b>Не удалось получить статистику</b>\n\n"
+            "Проверьте, что аккаунт привязан командой /link.",
+            parse_mode=ParseMode.HTML
+        )
+        return
+    
+    stats_text = f"📊 <b>Статистика продаж за {stats['days']} дн.</b>\n\n"
+    stats_text += f"💰 Выручка: {stats['revenue_total']} руб.\n"
+    stats_text += f"🧾 Заказов: {stats['orders_total']}\n"
+    stats_text += f"📦 Продано единиц: {stats['items_total']}\n"
+    
+    if stats['top_products']:
+        stats_text += "\n🏆 <b>Топ товаров:</b>\n"
+        for product in stats['top_products']:
+            stats_text += f"   • {product['product_name'] or 'Удаленный товар'} - {product['qty']} шт., {product['revenue']} руб.\n"
+    
+    stats_text += "\n📈 <b>Статусы заказов:</b>\n"
+    for status, count in stats['status_funnel'].items():
+        stats_text += f"   {get_status_emoji(status)} {format_status(status)}: {count}\n"
+    
+    await message.answer(stats_text, parse_mode=ParseMode.HTML)
+
 @dp.message(F.text & ~F.text.startswith('/'))
 async def handle_text(message: Message):
     """Обработчик текстовых сообщений"""
@@ -726,6 +846,14 @@ async def handle_text(message: Message):
         parse_mode=ParseMode.HTML
     )
 
+@dp.update.outer_middleware()
+async def request_id_middleware(handler, event, data):
+    """Новый request_id на каждый апдейт - по нему в логах backend находятся его запросы"""
+    set_request_id()
+    return await handler(event, data)
+
+setup_task_timing(dp)
+
 async def main():
     """Основная функция запуска бота"""
     logger.info("Bot is starting...")
@@ -0,0 +1,146 @@
+"""Логирование бота в том же формате, что у backend (back/logs.py).
+
+Копия, а не импорт из back/: бот разворачивается отдельно от backend. JSON-строки в stdout
+пишет фоновый поток, настройки те же - LOG_LEVEL, LOG_LEVELS, LOG_SAMPLE_RATES, LOG_QUEUE_SIZE.
+У каждого апдейта свой request_id, он уходит в backend заголовком X-Request-ID.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+_request_id = ContextVar("request_id", default=None)
+
+# Поля LogRecord, которые не нужно выводить как дополнительные поля события
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "request_id"}
+
+_handler = None
+
+
+def new_request_id():
+    return uuid.uuid4().hex
+
+
+def set_request_id(value=None):
+    """Новый (или переданный) id для записей текущего апдейта"""
+    request_id = value or new_request_id()
+    _request_id.set(request_id)
+    return request_id
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись; поля из extra= выводятся как есть"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Запоминает id апдейта и отбрасывает часть частых событий"""
+
+    def __init__(self, sample_rates):
+        super().__init__()
+        self.sample_rates = sample_rates
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            rate = self.sample_rate(record.name)
+            if rate < 1 and random.random() >= rate:
+                return False
+
+        record.request_id = _request_id.get()
+        return True
+
+    def sample_rate(self, name):
+        while name:
+            if name in self.sample_rates:
+                return self.sample_rates[name]
+            name = name.rpartition(".")[0]
+        return 1
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """QueueHandler, который не форматирует запись в event loop и не блокируется на полной очереди"""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Аргументы сообщения и исключение фиксируются сразу - к моменту вывода они могут измениться
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            BackgroundQueueHandler.dropped += 1
+
+
+def parse_mapping(value, cast):
+    """'aiogram.event=WARNING,bot.timing=0.1' -> {'aiogram.event': cast('WARNING'), ...}"""
+    result = {}
+    for part in filter(None, (part.strip() for part in value.split(","))):
+        name, _, setting = part.partition("=")
+        result[name.strip()] = cast(setting.strip())
+    return result
+
+
+def setup_logging(levels=None):
+    """Настраивает логирование процесса (один раз).
+
+    levels - уровни логгеров по умолчанию ({'aiogram.event': 'WARNING'}), LOG_LEVELS их переопределяет.
+    """
+    global _handler
+
+    if _handler is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    _handler = BackgroundQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10000))))
+    _handler.addFilter(ContextFilter(parse_mapping(os.getenv("LOG_SAMPLE_RATES", ""), float)))
+    listener = QueueListener(_handler.queue, output)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [_handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for name, level in {**(levels or {}), **parse_mapping(os.getenv("LOG_LEVELS", ""), str.upper)}.items():
+        logging.getLogger(name).setLevel(level)
@@ -0,0 +1,58 @@
+"""Замеры времени в боте: медленные обработчики и шаги, блокирующие event loop.
+
+Включается переменной BOT_TASK_TIMING=1. Пороги: BOT_SLOW_HANDLER_MS (по умолчанию 1000) -
+время обработчика целиком, включая ожидание API; BOT_LOOP_BLOCK_MS (100) - один шаг
+корутины или колбэк без await, который все это время держит event loop. Такие шаги пишет
+сам asyncio в debug-режиме (логгер asyncio, "Executing ... took") - режим добавляет накладные
+расходы, поэтому включается только вместе с BOT_TASK_TIMING.
+"""
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger("bot.timing")
+
+
+def handler_timing_middleware(slow_ms):
+    """Middleware aiogram: пишет в лог обработчики дольше slow_ms"""
+
+    async def middleware(handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            if duration_ms >= slow_ms:
+                handler_object = data.get("handler")
+                logger.warning("slow handler", extra={
+                    "handler": getattr(getattr(handler_object, "callback", None), "__name__", None),
+                    "event": type(event).__name__,
+                    "duration_ms": round(duration_ms, 1),
+                })
+
+    return middleware
+
+
+def install_loop_monitor(dispatcher, block_ms):
+    """При запуске поллинга переводит event loop в debug-режим: шаги дольше block_ms попадают в лог.
+
+    Шаг задачи - код между двумя await; если он долгий, все остальные апдейты ждут.
+    """
+
+    async def enable_slow_callback_log():
+        loop = asyncio.get_running_loop()
+        loop.set_debug(True)
+        loop.slow_callback_duration = block_ms / 1000
+
+    dispatcher.startup.register(enable_slow_callback_log)
+
+
+def setup_task_timing(dispatcher):
+    if os.getenv("BOT_TASK_TIMING", "0") != "1":
+        return
+
+    middleware = handler_timing_middleware(float(os.getenv("BOT_SLOW_HANDLER_MS", 1000)))
+    dispatcher.message.middleware(middleware)
+    dispatcher.callback_query.middleware(middleware)
+    install_loop_monitor(dispatcher, float(os.getenv("BOT_LOOP_BLOCK_MS", 100)))